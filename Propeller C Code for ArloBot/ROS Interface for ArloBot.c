@@ -115,6 +115,20 @@ int ticksLeft, ticksRight, ticksLeftOld, ticksRightOld;
 static double Heading = 0.0, X = 0.0, Y = 0.0;
 static int speedLeft, speedRight, throttleStatus = 0;
 
+// Telemetry periods in milliseconds, ROS may change these with 'u' messages
+// to get faster odometry while driving or quieter telemetry while parked.
+// Keep the limits in sync with TELEMETRY_PERIOD_LIMITS in propellerbot_node.py
+#define MIN_ODOM_PERIOD 20
+#define MAX_ODOM_PERIOD 1000
+#define MIN_STATUS_PERIOD 100
+#define MAX_STATUS_PERIOD 10000
+#define MIN_SENSOR_PERIOD 0
+#define MAX_SENSOR_PERIOD 1000
+static volatile int odomPeriod = 100; // Odometry and sensor data "o" lines
+static volatile int statusPeriod = 1000; // Status "s" lines
+static volatile int sensorPeriod = 0; // Extra pause between sensor sweeps
+int limitPeriod(double requested, int minimum, int maximum);
+
 void getTicks();
 
 void displayTicks();
@@ -191,6 +205,26 @@ ignoreFloorSensors = 0,
 ignoreIRSensors = 0,
 pluggedIn = 0;
 
+// Acknowledgements for settings changed by ROS with 'u' (update) and 'd' messages.
+// The main cog just flags them, and the broadcastOdometry cog prints them
+// so that they are never mixed into the middle of an odometry line.
+// Each acknowledgement echoes the value we are actually using, so ROS knows what mode we are in.
+#define ACK_TRACK_WIDTH 0
+#define ACK_DISTANCE_PER_COUNT 1
+#define ACK_IGNORE_PROXIMITY 2
+#define ACK_IGNORE_CLIFF_SENSORS 3
+#define ACK_IGNORE_IR_SENSORS 4
+#define ACK_IGNORE_FLOOR_SENSORS 5
+#define ACK_PLUGGED_IN 6
+#define ACK_DRIVE_GEOMETRY 7 // The entire 'd' message
+#define ACK_ODOM_PERIOD 8
+#define ACK_STATUS_PERIOD 9
+#define ACK_SENSOR_PERIOD 10
+#define NUMBER_OF_ACKS 11
+static volatile int acknowledgementPending[NUMBER_OF_ACKS] = {0};
+
+void sendAcknowledgements(void);
+
 void safetyOverride(void *par); // Use a cog to squelch incoming commands and perform safety procedures like halting, backing off, avoiding cliffs, calling for help, etc.
 // This can use proximity sensors to detect obstacles (including people) and cliffs
 // This can use the gyro to detect tipping
@@ -342,6 +376,7 @@ int main() {
     double angularVelocityOffset = 0.0, expectedLeftSpeed = 0.0, expectedRightSpeed = 0.0;
 
     // Listen for drive commands
+    // Only 's' motion commands reset this, settings updates must not keep a robot that lost ROS moving.
     int timeoutCounter = 0;
     while (1) {
 
@@ -387,7 +422,49 @@ int main() {
                 #ifdef debugModeOn
                 dprint(term, "GOT D! %d %d %d %d %d\n", ignoreProximity, ignoreCliffSensors, ignoreIRSensors, ignoreFloorSensors, pluggedIn); // For Debugging
                 #endif
-                timeoutCounter = 0;
+                acknowledgementPending[ACK_DRIVE_GEOMETRY] = 1;
+            } else if (buf[0] == 'u') {
+                // Update a single setting, i.e. "u,ignoreIRSensors,1"
+                char *token;
+                char *key;
+                token = strtok(buf, delimiter);
+                key = strtok(NULL, delimiter);
+                token = strtok(NULL, delimiter);
+                if (key != NULL && token != NULL) {
+                    char *unconverted;
+                    double value = strtod(token, &unconverted);
+                    if (strcmp(key, "trackWidth") == 0) {
+                        trackWidth = value;
+                        acknowledgementPending[ACK_TRACK_WIDTH] = 1;
+                    } else if (strcmp(key, "distancePerCount") == 0) {
+                        distancePerCount = value;
+                        acknowledgementPending[ACK_DISTANCE_PER_COUNT] = 1;
+                    } else if (strcmp(key, "ignoreProximity") == 0) {
+                        ignoreProximity = (int)value;
+                        acknowledgementPending[ACK_IGNORE_PROXIMITY] = 1;
+                    } else if (strcmp(key, "ignoreCliffSensors") == 0) {
+                        ignoreCliffSensors = (int)value;
+                        acknowledgementPending[ACK_IGNORE_CLIFF_SENSORS] = 1;
+                    } else if (strcmp(key, "ignoreIRSensors") == 0) {
+                        ignoreIRSensors = (int)value;
+                        acknowledgementPending[ACK_IGNORE_IR_SENSORS] = 1;
+                    } else if (strcmp(key, "ignoreFloorSensors") == 0) {
+                        ignoreFloorSensors = (int)value;
+                        acknowledgementPending[ACK_IGNORE_FLOOR_SENSORS] = 1;
+                    } else if (strcmp(key, "pluggedIn") == 0) {
+                        pluggedIn = (int)value;
+                        acknowledgementPending[ACK_PLUGGED_IN] = 1;
+                    } else if (strcmp(key, "odomPeriod") == 0) {
+                        odomPeriod = limitPeriod(value, MIN_ODOM_PERIOD, MAX_ODOM_PERIOD);
+                        acknowledgementPending[ACK_ODOM_PERIOD] = 1;
+                    } else if (strcmp(key, "statusPeriod") == 0) {
+                        statusPeriod = limitPeriod(value, MIN_STATUS_PERIOD, MAX_STATUS_PERIOD);
+                        acknowledgementPending[ACK_STATUS_PERIOD] = 1;
+                    } else if (strcmp(key, "sensorPeriod") == 0) {
+                        sensorPeriod = limitPeriod(value, MIN_SENSOR_PERIOD, MAX_SENSOR_PERIOD);
+                        acknowledgementPending[ACK_SENSOR_PERIOD] = 1;
+                    }
+                }
             }
         }
 
@@ -487,10 +564,12 @@ http://forums.parallax.com/showthread.php/154963-measuring-speed-of-the-Activity
 */
 void broadcastOdometry(void *par) {
 
-    int dt = CLKFREQ / 10;
+    int dt;
     int t = CNT;
 
     while (1) {
+        // Read every time, because ROS can change odomPeriod at any time.
+        dt = (CLKFREQ / 1000) * odomPeriod;
         if (CNT - t > dt) {
             t += dt;
             getTicks();
@@ -570,8 +649,9 @@ void displayTicks(void) {
     #endif
 
     // Send a regular "status" update to ROS including information that does not need to be refreshed as often as the odometry.
-    throttleStatus = throttleStatus + 1;
-    if (throttleStatus > 9) {
+    // throttleStatus counts the milliseconds since the last status line.
+    throttleStatus = throttleStatus + odomPeriod;
+    if (throttleStatus >= statusPeriod) {
         // Check Motor Power
         double leftMotorPower = 4.69;
         double rightMotorPower = 4.69;
@@ -584,11 +664,69 @@ void displayTicks(void) {
         dprint(term, "s\t%d\t%d\t%d\t%d\t%d\t%d\t%.2f\t%.2f\t%d\t%d\n", safeToProceed, safeToRecede, Escaping, abd_speedLimit, abdR_speedLimit, minDistanceSensor, leftMotorPower, rightMotorPower, cliff, floorO);
         throttleStatus = 0;
     }
+    sendAcknowledgements();
     #ifdef debugModeOn
     dprint(term, "DEBUG: %d %d %d %d %d\n", ignoreProximity, ignoreCliffSensors, ignoreIRSensors, ignoreFloorSensors, pluggedIn);
     #endif
 }
 
+void sendAcknowledgements(void) {
+    // Key names must match DRIVE_PARAM_KEYS in propellerbot_node.py
+    if (acknowledgementPending[ACK_TRACK_WIDTH] == 1) {
+        acknowledgementPending[ACK_TRACK_WIDTH] = 0;
+        dprint(term, "a\ttrackWidth\t%f\n", trackWidth);
+    }
+    if (acknowledgementPending[ACK_DISTANCE_PER_COUNT] == 1) {
+        acknowledgementPending[ACK_DISTANCE_PER_COUNT] = 0;
+        dprint(term, "a\tdistancePerCount\t%f\n", distancePerCount);
+    }
+    if (acknowledgementPending[ACK_IGNORE_PROXIMITY] == 1) {
+        acknowledgementPending[ACK_IGNORE_PROXIMITY] = 0;
+        dprint(term, "a\tignoreProximity\t%d\n", ignoreProximity);
+    }
+    if (acknowledgementPending[ACK_IGNORE_CLIFF_SENSORS] == 1) {
+        acknowledgementPending[ACK_IGNORE_CLIFF_SENSORS] = 0;
+        dprint(term, "a\tignoreCliffSensors\t%d\n", ignoreCliffSensors);
+    }
+    if (acknowledgementPending[ACK_IGNORE_IR_SENSORS] == 1) {
+        acknowledgementPending[ACK_IGNORE_IR_SENSORS] = 0;
+        dprint(term, "a\tignoreIRSensors\t%d\n", ignoreIRSensors);
+    }
+    if (acknowledgementPending[ACK_IGNORE_FLOOR_SENSORS] == 1) {
+        acknowledgementPending[ACK_IGNORE_FLOOR_SENSORS] = 0;
+        dprint(term, "a\tignoreFloorSensors\t%d\n", ignoreFloorSensors);
+    }
+    if (acknowledgementPending[ACK_PLUGGED_IN] == 1) {
+        acknowledgementPending[ACK_PLUGGED_IN] = 0;
+        dprint(term, "a\tpluggedIn\t%d\n", pluggedIn);
+    }
+    if (acknowledgementPending[ACK_ODOM_PERIOD] == 1) {
+        acknowledgementPending[ACK_ODOM_PERIOD] = 0;
+        dprint(term, "a\todomPeriod\t%d\n", odomPeriod);
+    }
+    if (acknowledgementPending[ACK_STATUS_PERIOD] == 1) {
+        acknowledgementPending[ACK_STATUS_PERIOD] = 0;
+        dprint(term, "a\tstatusPeriod\t%d\n", statusPeriod);
+    }
+    if (acknowledgementPending[ACK_SENSOR_PERIOD] == 1) {
+        acknowledgementPending[ACK_SENSOR_PERIOD] = 0;
+        dprint(term, "a\tsensorPeriod\t%d\n", sensorPeriod);
+    }
+    if (acknowledgementPending[ACK_DRIVE_GEOMETRY] == 1) {
+        acknowledgementPending[ACK_DRIVE_GEOMETRY] = 0;
+        dprint(term, "a\td\t%f\t%f\t%d\t%d\t%d\t%d\t%d\n", trackWidth, distancePerCount, ignoreProximity, ignoreCliffSensors, ignoreIRSensors, ignoreFloorSensors, pluggedIn);
+    }
+}
+
+int limitPeriod(double requested, int minimum, int maximum) {
+    int period = (int)requested;
+    if (period < minimum)
+        period = minimum;
+    if (period > maximum)
+        period = maximum;
+    return (period);
+}
+
 volatile int abd_speedL;
 volatile int abd_speedR;
 
@@ -631,7 +769,11 @@ void pollPropBoard2(void *par) {
     int count = 0, pingSensorNumber = 0, irSensorNumber = 0;
     int rateLimit = 10; // This is the incoming rate limiter. Without some limit the entire Propeller will hang.
     while (1) {
-        pause(rateLimit);
+        // sensorPeriod can slow this down when ROS does not need fresh sensor data, but never speed it up.
+        if (sensorPeriod > rateLimit)
+            pause(sensorPeriod);
+        else
+            pause(rateLimit);
         // Tell the other end we are alive, so it doesn't just spin pointlessly.
         // It also keeps the sensors quiet when this end is in an idle state.
         dprint(propterm, "i");
@@ -699,6 +841,9 @@ void pollPingSensors(void *par) {
             }
             #endif
         }
+        // Rest between sweeps when ROS has asked for less frequent sensor data
+        if (sensorPeriod > 0)
+            pause(sensorPeriod);
     }
 }
 
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+import os
+import select
+import sys
+import threading
+import time
+import tty
+
+'''
+Pretends to be the Propeller Activity Board running "ROS Interface for ArloBot.c"
+on a pseudo terminal, so propellerbot_node can be run and timed without a robot.
+
+Point propellerbot_node at it with:
+rosparam set /arlobot/port <the port it prints>
+
+It speaks just enough of the protocol to get propellerbot_node going:
+"i" lines until it gets a "d" message, then "o" odometry and "s" status lines,
+and "a" acknowledgements for "d" and "u" messages.
+Every line propellerbot_node sends is kept with the time it arrived,
+so tests can wait for a particular command to show up.
+'''
+
+# Settings the Propeller board acknowledges as whole numbers, everything else is a float.
+INTEGER_SETTINGS = ('ignoreProximity', 'ignoreCliffSensors', 'ignoreIRSensors', 'ignoreFloorSensors',
+                    'pluggedIn', 'odomPeriod', 'statusPeriod', 'sensorPeriod')
+
+
+def _PrintLine(timestamp, line):
+    print("%.3f %s" % (timestamp, line))
+
+
+class FakePropeller(object):
+    '''
+    Helper class for running a fake Propeller board on a pty.
+    '''
+
+    def __init__(self, lineHandler=_PrintLine, motorVoltage=4.0, pingDistance=200):
+        '''
+        lineHandler: Called with (time received, line) for every line from ROS.
+        motorVoltage: Reported on the "s" line, the ADC reading before propellerbot_node scales it,
+        so 4.0 is about 12.8 volts. Below 1 volt propellerbot_node assumes the motors are off.
+        pingDistance: Distance in cm reported by every PING sensor.
+        '''
+        self._LineHandler = lineHandler
+        self.motorVoltage = motorVoltage
+        self._PingDistance = pingDistance
+        self._Master, self._Slave = os.openpty()
+        # Raw, so nothing is echoed back or translated before propellerbot_node opens the port.
+        tty.setraw(self._Slave)
+        self.port = os.ttyname(self._Slave)
+        self._KeepRunning = False
+        self._WriteLock = threading.Lock()
+        self._LinesLock = threading.Condition()
+        self._Lines = []  # (time received, line)
+        self.initialized = False
+        self.speed = (0.0, 0.0)
+        self.settings = {'odomPeriod': 100, 'statusPeriod': 1000, 'sensorPeriod': 0}
+
+    def Start(self):
+        self._KeepRunning = True
+        self._ReceiverThread = threading.Thread(target=self._Listen)
+        self._ReceiverThread.setDaemon(True)
+        self._ReceiverThread.start()
+        self._SenderThread = threading.Thread(target=self._Broadcast)
+        self._SenderThread.setDaemon(True)
+        self._SenderThread.start()
+
+    def Stop(self):
+        self._KeepRunning = False
+        time.sleep(0.1)
+        os.close(self._Master)
+        os.close(self._Slave)
+
+    def lines(self, since=0):
+        ''' Returns every (time received, line) received at or after since. '''
+        with self._LinesLock:
+            return [entry for entry in self._Lines if entry[0] >= since]
+
+    def clear_lines(self):
+        with self._LinesLock:
+            self._Lines = []
+
+    def wait_for_line(self, predicate, since=0, timeout=10.0):
+        '''
+        Wait for a line received at or after since that predicate(line) is True for.
+        Returns (time received, line), or None if it did not show up in time.
+        '''
+        deadline = time.time() + timeout
+        with self._LinesLock:
+            checked = 0
+            while True:
+                for entry in self._Lines[checked:]:
+                    if entry[0] >= since and predicate(entry[1]):
+                        return entry
+                checked = len(self._Lines)
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._LinesLock.wait(remaining)
+
+    def _write(self, line):
+        with self._WriteLock:
+            try:
+                os.write(self._Master, (line + '\n').encode('ascii'))
+            except OSError:
+                pass  # Nobody has the port open
+
+    def _Listen(self):
+        received = b''
+        while self._KeepRunning:
+            try:
+                ready, _, _ = select.select([self._Master], [], [], 0.1)
+                if not ready:
+                    continue
+                data = os.read(self._Master, 1024)
+            except (OSError, select.error, ValueError):
+                if not self._KeepRunning:
+                    break
+                raise
+            now = time.time()
+            received += data
+            while b'\r' in received:
+                raw_line, received = received.split(b'\r', 1)
+                line = raw_line.decode('ascii', 'replace').strip()
+                if not line:
+                    continue
+                self._handle_line(line)
+                with self._LinesLock:
+                    self._Lines.append((now, line))
+                    self._LinesLock.notify_all()
+                self._LineHandler(now, line)
+
+    def _handle_line(self, line):
+        parts = line.split(',')
+        try:
+            if parts[0] == 's' and len(parts) >= 3:
+                self.speed = (float(parts[1]), float(parts[2]))
+            elif parts[0] == 'd' and len(parts) >= 8:
+                values = ['%f' % float(value) for value in parts[1:3]] + ['%d' % int(float(value)) for value in parts[3:8]]
+                self.initialized = True
+                # Echo what we are "using", formatted like the real board does.
+                self._write('a\td\t' + '\t'.join(values))
+            elif parts[0] == 'u' and len(parts) == 3:
+                if parts[1] in INTEGER_SETTINGS:
+                    value = '%d' % int(float(parts[2]))
+                else:
+                    value = '%f' % float(parts[2])
+                if parts[1] in self.settings:
+                    self.settings[parts[1]] = int(value)
+                self._write('a\t%s\t%s' % (parts[1], value))
+        except ValueError:
+            pass  # The real board would just get garbage, so ignore it.
+
+    def _Broadcast(self):
+        last_status = 0
+        last_init = 0
+        x = 0.0
+        last_odometry = time.time()
+        while self._KeepRunning:
+            now = time.time()
+            if not self.initialized:
+                # The real board asks to be initialized about once a second, with the PIR state.
+                if now - last_init >= 1.0:
+                    self._write('i\t0')
+                    last_init = now
+                last_odometry = now
+                time.sleep(0.05)
+                continue
+            x += self.speed[0] * (now - last_odometry)
+            last_odometry = now
+            sensors = ','.join('"p%d":%d' % (i, self._PingDistance) for i in range(10))
+            self._write('o\t%.3f\t%.3f\t%.3f\t%.3f\t%.3f\t%.3f\t{%s}' % (x, 0.0, 0.0, 0.0,
+                                                                         self.speed[0], self.speed[1], sensors))
+            if (now - last_status) * 1000 >= self.settings['statusPeriod']:
+                self._write('s\t1\t1\t0\t100\t100\t0\t%.2f\t%.2f\t0\t0' % (self.motorVoltage, self.motorVoltage))
+                last_status = now
+            time.sleep(self.settings['odomPeriod'] / 1000.0)
+
+
+if __name__ == '__main__':
+    board = FakePropeller()
+    print("Fake Propeller board on " + board.port)
+    board.Start()
+
+    raw_input("Hit <Enter> to end.")
+    board.Stop()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+import array
+import threading
+import time
+import rospy
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+
+# Counter numbers, used as indexes into the counter arrays.
+LINES_ODOMETRY = 0
+LINES_STATUS = 1
+LINES_INIT = 2
+LINES_OTHER = 3
+PARSE_ERRORS = 4
+JSON_ERRORS = 5
+SHORT_LINES = 6
+LONG_LINES = 7
+BYTES_IN = 8
+BYTES_OUT = 9
+WRITE_ERRORS = 10
+WATCHDOG_RESETS = 11
+RECONNECTS = 12
+LINES_ACKNOWLEDGEMENT = 13
+
+COUNTER_NAMES = ('odometry lines', 'status lines', 'init lines', 'other lines',
+                 'parse errors', 'JSON errors', 'short lines', 'long lines',
+                 'bytes in', 'bytes out', 'write errors', 'watchdog resets', 'reconnects',
+                 'acknowledgement lines')
+
+# All of the counters for received lines.
+LINE_COUNTERS = (LINES_ODOMETRY, LINES_STATUS, LINES_INIT, LINES_OTHER, LINES_ACKNOWLEDGEMENT)
+
+# Any of these going up within the window means the link is degraded.
+ERROR_COUNTERS = (PARSE_ERRORS, JSON_ERRORS, SHORT_LINES, LONG_LINES, WRITE_ERRORS)
+
+
+def _link_always_expected():
+    return True
+
+
+class PropellerLinkDiagnostics(object):
+    '''
+    Keeps counters for the serial link to the Propeller board
+    and publishes them as diagnostic_msgs/DiagnosticArray on a timer.
+
+    Counting is just an array increment under an uncontended lock, so it is cheap enough to do for every line.
+    All of the rate math happens in the timer.
+    '''
+
+    def __init__(self, hardware_id="propeller", period=1.0, window=10, link_expected=_link_always_expected):
+        '''
+        hardware_id: Reported in the DiagnosticStatus, the serial port is a good choice.
+        period: Seconds between diagnostics messages.
+        window: Number of periods that rates and error checks are computed over.
+        link_expected: Function returning True when we expect lines from the board,
+        so that silence is only reported when the serial port is supposed to be up.
+        '''
+        self._HardwareId = hardware_id
+        self._Period = period
+        self._Window = max(int(window), 2)
+        self._LinkExpected = link_expected
+        # Doubles are used so that long running byte counters cannot overflow.
+        self._Counters = array.array('d', [0] * len(COUNTER_NAMES))
+        # Ring of counter snapshots taken by the timer, one per period.
+        self._History = [array.array('d', [0] * len(COUNTER_NAMES)) for _ in range(self._Window)]
+        self._HistoryTimes = array.array('d', [time.time()] * self._Window)
+        self._HistoryIndex = 0
+        self._LastReconnectDuration = 0.0
+        self._MaxReconnectDuration = 0.0
+        self._Lock = threading.Lock()
+        self._DiagnosticsPublisher = rospy.Publisher('/diagnostics', DiagnosticArray, queue_size=1)
+        self._Timer = None
+
+    def Start(self):
+        self._Timer = rospy.Timer(rospy.Duration(self._Period), self._publish_diagnostics)
+
+    def Stop(self):
+        if self._Timer is not None:
+            self._Timer.shutdown()
+
+    def count(self, counter, amount=1):
+        # Called from the serial thread while the timer thread snapshots the counters,
+        # and += is a read and a write, so an increment could be lost without the lock.
+        with self._Lock:
+            self._Counters[counter] += amount
+
+    def record_reconnect(self, duration):
+        with self._Lock:
+            self._Counters[RECONNECTS] += 1
+            self._LastReconnectDuration = duration
+            if duration > self._MaxReconnectDuration:
+                self._MaxReconnectDuration = duration
+
+    def _publish_diagnostics(self, event):
+        now = time.time()
+        with self._Lock:
+            # The oldest snapshot in the ring is the one we are about to overwrite.
+            oldest = self._History[self._HistoryIndex]
+            elapsed = now - self._HistoryTimes[self._HistoryIndex]
+            current = array.array('d', self._Counters)
+            deltas = [current[i] - oldest[i] for i in range(len(COUNTER_NAMES))]
+            self._History[self._HistoryIndex] = current
+            self._HistoryTimes[self._HistoryIndex] = now
+            self._HistoryIndex = (self._HistoryIndex + 1) % self._Window
+            last_reconnect = self._LastReconnectDuration
+            max_reconnect = self._MaxReconnectDuration
+        if elapsed <= 0:
+            return
+
+        status = DiagnosticStatus()
+        status.name = "arlobot: Propeller link"
+        status.hardware_id = self._HardwareId
+        status.level = DiagnosticStatus.OK
+        status.message = "OK"
+        lines_received = sum(deltas[i] for i in LINE_COUNTERS)
+        if deltas[WATCHDOG_RESETS] > 0:
+            status.level = DiagnosticStatus.ERROR
+            status.message = "Watchdog reset the serial connection"
+        elif self._LinkExpected() and lines_received == 0:
+            status.level = DiagnosticStatus.ERROR
+            status.message = "No data from Propeller board"
+        elif sum(deltas[i] for i in ERROR_COUNTERS) > 0:
+            status.level = DiagnosticStatus.WARN
+            status.message = "Serial errors from Propeller board"
+
+        for i, name in enumerate(COUNTER_NAMES):
+            status.values.append(KeyValue(name + " per second", "%.2f" % (deltas[i] / elapsed)))
+        for i, name in enumerate(COUNTER_NAMES):
+            status.values.append(KeyValue(name + " total", "%d" % current[i]))
+        status.values.append(KeyValue("last reconnect seconds", "%.3f" % last_reconnect))
+        status.values.append(KeyValue("max reconnect seconds", "%.3f" % max_reconnect))
+
+        diagnostics = DiagnosticArray()
+        diagnostics.header.stamp = rospy.Time.now()
+        diagnostics.status.append(status)
+        self._DiagnosticsPublisher.publish(diagnostics)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+'''
+Builds the fake laser scans from the PING and IR sensors for propellerbot_node.py,
+which puts them in LaserScans on ultrasonic_scan and infrared_scan.
+There is no ROS in here, so it can be timed with scan_benchmark.py in arlobot_navigation.
+'''
+
+# TODO: I'm doing this all in degrees and then converting to Radians later.
+# Is there any way to do this in Radians?
+# I just don't know how to create and fill an array with "Radians"
+# since they are not rational numbers, but multiples of PI, thus the degrees.
+NUM_READINGS = 360  # How about 1 per degree?
+#num_reeading_multiple = 2 # We have to track this so we know where to put the readings!
+#NUM_READINGS = 360 * num_reeading_multiple
+LASER_FREQUENCY = 100  # I'm not sure how to decide what to use here.
+# This is the fake distance to set all empty slots, and slots we consider "out of range"
+ARTIFICIAL_FAR_DISTANCE = 10
+
+# New idea here:
+# First, I do not think that this can be used for reliable for map generation.
+# If your room has objects that the Kinect
+# cannot map, then you will probably need to modify the room (cover mirrors, etc.) or try
+# other laser scanner options.
+# SO, since we only want to use it for cost planning, we should modify the data, because
+# it is easy for it to get bogged down with a lot of "stuff" everywhere.
+
+# From:
+# http://answers.ros.org/question/11446/costmaps-obstacle-does-not-clear-properly-under-sparse-environment/
+# "When clearing obstacles, costmap_2d only trusts laser scans returning a definite range.
+# Indoors, that makes sense. Outdoors, most scans return max range, which does not clear
+# intervening obstacles. A fake scan with slightly shorter ranges can be constructed that
+# does clear them out."
+# SO, we need to set all "hits" above the distance we want to pay attention to to a distance very far away,
+# but just within the range_max (which we can set to anything we want),
+# otherwise costmap will not clear items!
+# Also, 0 does not clear anything! So if we rotate, then it gets 0 at that point, and ignores it,
+# so we need to fill the unused slots with long distances.
+# NOTE: This does cause a "circle" to be drawn around the robot at the "artificalFarDistance",
+# but it shouldn't be a problem because we set
+# artificial_far_distance to a distance greater than the planner uses.
+# So while it clears things, it shouldn't cause a problem, and the Kinect should override it for things
+# in between.
+
+# Use:
+# roslaunch arlobot_rviz_launchers view_robot.launch
+# to view this well for debugging and testing.
+
+# Note that sensor orientation is important here!
+# If you have a different number or aim them differently this will not work!
+# TODO: Tweak this value based on real measurements!
+# TODO: Use both IR and PING sensors?
+# The offset between the pretend sensor location in the URDF
+# and real location needs to be added to these values. This may need to be tweaked.
+SENSOR_OFFSET = 0.217 # Measured, Calculated: 0.22545
+# This will be the max used range, anything beyond this is set to "artificial_far_distance"
+MAX_RANGE_ACCEPTED = .5
+
+# max_range_accepted Testing:
+# TODO: More tweaking here could be done.
+# I think it is a trade-off, so there is no end to the adjustment that could be done.
+# I did a lot of testing with gmappingn while building a map.
+# Obviously this would be slightly different from using a map we do not update.
+# It seems there are so many variables here that testing is difficult.
+# We could find one number works great in one situation but is hopeless in another.
+# Having a comprehensive test course to test in multiple modes for every possible value would be great,
+# but I think it would take months! :)
+# REMEMBER, the costmap only pays attention out to a certain set
+# for obstacle_range in costmap_common_params.yaml anyway.
+# Here are my notes for different values of "max_range_accepted":
+# 1 - looks good, and works ok, but
+# I am afraid that the costmap gets confused with things popping in and out of sight all of the time,
+# causing undue wandering.
+# 2 - This producing less wandering due to things popping in and out of the field of view,
+# BUT it also shows that we get odd affects at longer distances. i.e.
+#     A doorframe almost always has a hit right in the middle of it.
+#     In a hallway there is often a hit in the middle about 1.5 meters out.
+# .5 - This works very well to have the PING data ONLY provide obstacle avoidance,
+# and immediately forget about said obstacles.
+#     This prevents the navigation stack from fighting with the Activity Board code's
+# built in safety stops, and instead navigate around obstacles before the Activity Board
+# code gets involved (other than to set speed reductions).
+#     The only down side is if you tell ArloBot to go somewhere that he cannot due to low obstacles,
+# he will try forever. He won't just bounce off of the obstacle,
+#     but he will keep trying it and then go away, turn around,
+# and try again over and over. He may even start wandering around
+# the facility trying to find another way in,
+#     but he will eventually come back and try it again.
+#     I'm not sure what the solution to this is though,
+# because avoiding low lying obstacles and adding low lying
+# features to the map are really two different things.
+#     I think if this is well tuned to avoid low lying obstacles it
+# probably will not work well for mapping features.
+#     IF we could map features with the PING sensors, we wouldn't need the 3D sensor. :)
+# TODO: One option may be more PING sensors around back.
+# Right now when the robot spins, it clears the obstacles behind it,
+# because there are fewer sensors on the back side.
+# If the obstacle was seen all of the way around the robot, in the same spot,
+# it may stop returning to the same location as soon as it turns around?
+
+#     NOTE: The bump sensors on Turtlebot mark but do not clear.
+# I'm not sure how that works out. It seems like every bump would
+# end up being a "blot" in the landscape never to be returned to,
+# but maybe there is something I am missing?
+
+# NOTE: Could this be different for PING vs. IR?
+# Currently I'm not using IR! Just PING. The IR is not being used by costmap.
+# It is here for seeing in RVIZ, and the Propeller board uses it for emergency stopping,
+# but costmap isn't watching it at the moment. I think it is too erratic for that.
+
+# The sensors are 11cm from center to center at the front of the base plate.
+# The radius of the base plate is 22.545 cm
+# = 28 degree difference (http://ostermiller.org/calc/triangle.html)
+
+SENSOR_SEPERATION = 28
+
+# Spread code: NO LONGER USED
+# TODO: This could make sense to return to if used properly,
+# allowing obstacles to "fill" the space and smoothly move "around"
+# the robot as it rotates and objects move across the view of the PING
+# sensors, instead of "jumping" from one point to the next.
+# # "sensor_spread" is how wide we expand the sensor "point" in the fake laser scan.
+# # For the purpose of obstacle avoidance, I think this can actually be a single point,
+# # Since the costmap inflates these anyway.
+#
+# #One issue I am having is it seems that the "ray trace" to the maximum distance
+# #may not line up with near hits, so that the global cost map is not being cleared!
+# #Switching from a "spread" to a single point may fix this?
+# #Since the costmap inflates obstacles anyway, we shouldn't need the spread should we?
+#
+# #sensor_spread = 10 # This is how wide of an arc (in degrees) to paint for each "hit"
+# #sensor_spread = 2 # Testing. I think it has to be even numbers?
+#
+# #NOTE:
+# #This assumes that things get bigger as they are further away. This is true of the PING's area,
+# #and while it may or may not be true of the object the PING sees, we have no way of knowing if
+# #the object fills the ping's entire field of view or only a small part of it, a "hit" is a "hit".
+# #However for the IR sensor, the objects are points, that are the same size regardless of distance,
+# #so we are clearly inflating them here.
+#
+# for x in range(180 - sensor_spread / 2, 180 + sensor_spread / 2):
+#     PINGranges[x] = ping[5] # Rear Sensor
+#     IRranges[x] = ir[5] # Rear Sensor
+#
+# for x in range((360 - sensor_seperation * 2) - sensor_spread / 2,
+#                (360 - sensor_seperation * 2) + sensor_spread / 2):
+#     PINGranges[x] = ping[4]
+#     IRranges[x] = ir[4]
+#
+# for x in range((360 - sensor_seperation) - sensor_spread / 2,
+#                (360 - sensor_seperation) + sensor_spread / 2):
+#     PINGranges[x] = ping[3]
+#     IRranges[x] = ir[3]
+#
+# for x in range(360 - sensor_spread / 2, 360):
+#     PINGranges[x] = ping[2]
+#     IRranges[x] = ir[2]
+# # Crosses center line
+# for x in range(0, sensor_spread /2):
+#     PINGranges[x] = ping[2]
+#     IRranges[x] = ir[2]
+#
+# for x in range(sensor_seperation - sensor_spread / 2, sensor_seperation + sensor_spread / 2):
+#     PINGranges[x] = ping[1]
+#     IRranges[x] = ir[1]
+#
+# for x in range((sensor_seperation * 2) - sensor_spread / 2, (sensor_seperation * 2) + sensor_spread / 2):
+#     PINGranges[x] = ping[0]
+#     IRranges[x] = ir[0]
+
+# Single Point code:
+# The beam each sensor's reading goes in, by sensor number.
+# 0 to 4 are across the front, 2 straight ahead, and 5 to 9 across the back, 7 straight back.
+SENSOR_BEAMS = (SENSOR_SEPERATION * 2, SENSOR_SEPERATION, 0,
+                NUM_READINGS - SENSOR_SEPERATION, NUM_READINGS - SENSOR_SEPERATION * 2,
+                180 + SENSOR_SEPERATION * 2, 180 + SENSOR_SEPERATION, 180,
+                180 - SENSOR_SEPERATION, 180 - SENSOR_SEPERATION * 2)
+
+# Upper deck PING sensors, and the main sensor each one overwrites if it exists and is closer.
+# TODO: This is very manual. It won't break if you don't have these sensors, but
+# the positions are hard coded. :(
+UPPER_DECK_SENSORS = ((10, 1), (11, 2), (12, 3), (13, 7))
+
+
+def proximity_ranges(sensor_data):
+    '''
+    sensor_data: The sensor JSON from the Propeller's odometry line, decoded,
+                 with PING distances in centimeters as p0 to p13 and IR as i0 to i9.
+    Returns (ping_ranges, ir_ranges), NUM_READINGS ranges each in meters.
+    '''
+    # Fill array with artificial_far_distance (not 0) and then overlap with real readings
+    # If we use 0, then it won't clear the obstacles when we rotate away,
+    # because costmap2d ignores 0's and Out of Range!
+    ping_ranges = [ARTIFICIAL_FAR_DISTANCE] * NUM_READINGS
+    ir_ranges = [ARTIFICIAL_FAR_DISTANCE] * NUM_READINGS
+
+    ping = [ARTIFICIAL_FAR_DISTANCE] * len(SENSOR_BEAMS)
+    ir = [ARTIFICIAL_FAR_DISTANCE] * len(ping)
+
+    # Convert cm to meters and add offset
+    for i in range(0, len(ping)):
+        ping[i] = (sensor_data.get('p' + str(i), ARTIFICIAL_FAR_DISTANCE * 100) / 100.0) + SENSOR_OFFSET
+        # Set to "out of range" for distances over "max_range_accepted" to clear long range obstacles
+        # and use this for near range only.
+        if ping[i] > MAX_RANGE_ACCEPTED:
+            # Be sure "ultrasonic_scan.range_max" is set higher than this or
+            # costmap will ignore these and not clear the cost map!
+            ping[i] = ARTIFICIAL_FAR_DISTANCE
+        ir[i] = (sensor_data.get('i' + str(i), ARTIFICIAL_FAR_DISTANCE * 100) / 100.0) + SENSOR_OFFSET  # Convert cm to meters and add offset
+
+    # Overwrite main sensors with upper deck sensors if they exist and are closer,
+    for upper, main in UPPER_DECK_SENSORS:
+        if sensor_data.get('p' + str(upper)):
+            upperSensor = (sensor_data.get('p' + str(upper), ARTIFICIAL_FAR_DISTANCE * 100) / 100.0) + SENSOR_OFFSET
+            if upperSensor < ping[main]:
+                ping[main] = upperSensor
+
+    for i, beam in enumerate(SENSOR_BEAMS):
+        ping_ranges[beam] = ping[i]
+        ir_ranges[beam] = ir[i]
+
+    return ping_ranges, ir_ranges
+
+
+if __name__ == '__main__':
+    ping_ranges, ir_ranges = proximity_ranges({'p2': 20, 'p7': 150, 'p13': 10, 'i2': 30})
+    for sensor, beam in enumerate(SENSOR_BEAMS):
+        print("%d: beam %3d PING %6.3f IR %6.3f" % (sensor, beam, ping_ranges[beam], ir_ranges[beam]))
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+import threading
+import time
+import rospy
+
+
+class StartupTimer(object):
+    '''
+    Helper class for recording how long each phase of node startup takes
+    so that slow startups and regressions are easy to spot in the logs.
+    '''
+
+    def __init__(self, name="startup"):
+        self._Name = name
+        self._StartTime = time.time()
+        self._LastMarkTime = self._StartTime
+        self._Phases = []  # List of (phase, seconds since start, seconds since previous mark)
+        self._Lock = threading.Lock()
+        self.done = False
+
+    def mark(self, phase):
+        '''
+        Record that a startup phase has completed.
+        Phases may be marked from any thread.
+        '''
+        now = time.time()
+        with self._Lock:
+            since_start = now - self._StartTime
+            since_last = now - self._LastMarkTime
+            self._LastMarkTime = now
+            self._Phases.append((phase, since_start, since_last))
+        rospy.loginfo("%s: %s at +%.3fs (phase took %.3fs)" % (self._Name, phase, since_start, since_last))
+
+    def finish(self, phase=None):
+        '''
+        Log the full phase by phase report and save it to the parameter server.
+        Phases marked after this are still logged as they happen.
+        '''
+        if phase is not None:
+            self.mark(phase)
+        with self._Lock:
+            if self.done:
+                return
+            self.done = True
+            phases = list(self._Phases)
+        report = ["%s report:" % self._Name]
+        timing = {}
+        for phase_name, since_start, since_last in phases:
+            report.append("  +%7.3fs  %7.3fs  %s" % (since_start, since_last, phase_name))
+            timing[phase_name] = round(since_start, 3)
+        rospy.loginfo("\n".join(report))
+        # Saving it as a parameter allows startup times to be compared between runs:
+        # rosparam get /arlobot/startupTiming
+        rospy.set_param('~startupTiming', timing)
@@ -30,14 +30,27 @@
 
 from optparse import OptionParser
 
-from pylibftdi import Driver
-from pylibftdi import BitBangDevice
-
 from ctypes.util import find_library
 
+import os
+import signal
+import socket
 import sys
 import time
 
+# The board is reached through FtdiRelayBackend, which lives with the arlobot_usbrelay node,
+# so the same simulated board can stand in for the real one here too.
+# It is only imported when a device is used, so --client starts quickly.
+# The package is found with rospkg, or next to this one in the source tree if ROS is not set up.
+BACKEND_PACKAGE = 'arlobot_usbrelay'
+SOURCE_BACKEND_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', BACKEND_PACKAGE, 'scripts')
+BACKEND_ENVIRONMENT_VARIABLE = "ARLOBOT_RELAY_BACKEND"
+
+# --daemon keeps devices open and takes commands on this socket, --client sends them.
+DEFAULT_SOCKET = os.path.expanduser("~/.arlobot/drcontrol.sock")
+# Seconds the daemon waits on a client, so one that connects and sends nothing cannot block everyone else.
+CLIENT_TIMEOUT = 5.0
+
 # ----------------------------------------------------------------------------
 # VARIABLE CLASSS
 # ----------------------------------------------------------------------------
@@ -163,12 +176,32 @@ def get_relay_state( data, relay ):
 # ----------------------------------------------------------------------------
 
 def list_devices():
-    print "Vendor\t\tProduct\t\t\tSerial"
-    dev_list = []
-    for device in Driver().list_devices():
-        device = map(lambda x: x.decode('latin1'), device)
+    for line in device_list_lines():
+        print line
+
+def device_list_lines():
+    lines = ["Vendor\t\tProduct\t\t\tSerial"]
+    for device in backend.list_devices():
         vendor, product, serial = device
-        print "%s\t\t%s\t\t%s" % (vendor, product, serial)
+        lines.append("%s\t\t%s\t\t%s" % (vendor, product, serial))
+    return lines
+
+def backend_directory():
+    try:
+        import rospkg
+        directory = os.path.join(rospkg.RosPack().get_path(BACKEND_PACKAGE), 'scripts')
+    except ImportError:
+        return SOURCE_BACKEND_DIRECTORY
+    except rospkg.ResourceNotFound:
+        return SOURCE_BACKEND_DIRECTORY
+    if os.path.isfile(os.path.join(directory, 'FtdiRelayBackend.py')):
+        return directory
+    return SOURCE_BACKEND_DIRECTORY
+
+def load_backend(name):
+    sys.path.append(backend_directory())
+    import FtdiRelayBackend
+    return FtdiRelayBackend.get_backend(name)
 
 # ----------------------------------------------------------------------------
 # SET_RELAY()
@@ -178,82 +211,207 @@ def list_devices():
 
 def set_relay():
 
+    try:
+        with backend.open(cmdarg.device) as bb:
+            code, lines = relay_command(bb, cmdarg.device, cmdarg.relay, cmdarg.command, cmdarg.verbose)
+    except Exception, err:
+        print "Error: " + str(err)
+        sys.exit(1)
+
+    for line in lines:
+        print line
+    if code:
+        sys.exit(code)
+
+def relay_command(bb, device, relay_name, command, verbose):
+    """
+    Do one command on an already open device.
+    Returns (exit code, lines to print), so the daemon can send the same output back to its client.
+    """
+
+    lines = []
+    if verbose:
+        lines.append("Device:\t\t" + device)
+        if relay_name in relay.address:
+            lines.append("Send command:\tRelay " + relay_name + " (0x" + relay.address[relay_name] + ") to " + command.upper())
+
+    # Action towards specific relay
+    if relay_name.isdigit():
+
+        if int(relay_name) >= 1 and int(relay_name) <= 8:
+
+            # Turn relay ON
+            if command == "on":
+                if verbose:
+                    lines.append("Relay " + str(relay_name) + " to ON")
+                bb.port |= int(relay.address[relay_name], 16)
+
+            # Turn relay OFF
+            elif command == "off":
+                if verbose:
+                    lines.append("Relay "  + str(relay_name) + " to OFF")
+                bb.port &= ~int(relay.address[relay_name], 16)
+
+            # Print relay status
+            elif command == "state":
+                lines.append(state_line(bb.port, relay_name, verbose))
+
+    # Action towards all relays
+    elif relay_name == "all":
+
+        if command == "on":
+            if verbose:
+                lines.append("Relay " + str(relay_name) + " to ON")
+            bb.port |= int(relay.address[relay_name], 16)
+
+        elif command == "off":
+            if verbose:
+                lines.append("Relay "  + str(relay_name) + " to OFF")
+            bb.port &= ~int(relay.address[relay_name], 16)
+
+        elif command == "state":
+            # One read of the port has every relay in it.
+            port = bb.port
+            lines.append(str(port))
+            for i in range(1,9):
+                lines.append(state_line(port, str(i), verbose))
+
+        else:
+            lines.append("Error: Unknown command")
+
+    else:
+        lines.append("Error: Unknown relay number")
+        return 1, lines
+
+    return 0, lines
+
+def state_line(port, relay_name, verbose):
+    state = get_relay_state( port, relay_name )
+    if state == 0:
+        if verbose:
+            return "Relay " + relay_name + " state:\tOFF (" + str(state) + ")"
+        return "OFF"
+    if verbose:
+        return "Relay " + relay_name + " state:\tON (" + str(state) + ")"
+    return "ON"
+
+# ----------------------------------------------------------------------------
+# SERVE()
+#
+# Keep devices open and take commands from a Unix socket, one per connection:
+# "<device>\t<relay>\t<command>\t<verbose 0 or 1>\n", or "list\n"
+# The reply is the exit code on the first line and then the lines to print.
+# ----------------------------------------------------------------------------
+
+def serve(socket_path):
+
+    devices = {} # serial number: open device
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path) # Left over from a daemon that did not shut down cleanly
+    socket_directory = os.path.dirname(socket_path)
+    if socket_directory and not os.path.isdir(socket_directory):
+        os.makedirs(socket_directory)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    os.chmod(socket_path, 0600) # Only this user can switch relays
+    server.listen(5)
+
+    def stop(signum, frame):
+        sys.exit(0)
+    signal.signal(signal.SIGTERM, stop)
+
     if cmdarg.verbose:
-        print "Device:\t\t" + cmdarg.device
-        print "Send command:\tRelay " + cmdarg.relay + " (0x" + relay.address[cmdarg.relay] + ") to " + cmdarg.command.upper()
+        print "Listening on " + socket_path
 
     try:
-        with BitBangDevice(cmdarg.device) as bb:
-			
-            # Action towards specific relay
-            if cmdarg.relay.isdigit():
-				
-                if int(cmdarg.relay) >= 1 and int(cmdarg.relay) <= 8:
-
-                    # Turn relay ON
-                    if cmdarg.command == "on":
-                        if cmdarg.verbose:
-                            print "Relay " + str(cmdarg.relay) + " to ON"
-                        bb.port |= int(relay.address[cmdarg.relay], 16)
-
-                    # Turn relay OFF
-                    elif cmdarg.command == "off":
-                        if cmdarg.verbose:
-                            print "Relay "  + str(cmdarg.relay) + " to OFF"
-                        bb.port &= ~int(relay.address[cmdarg.relay], 16)
-
-                    # Print relay status
-                    elif cmdarg.command == "state":
-                        state = get_relay_state( bb.port, cmdarg.relay )
-                        if state == 0:
-                            if cmdarg.verbose:
-                                print "Relay " + cmdarg.relay + " state:\tOFF (" + str(state) + ")"
-                            else:
-                                print "OFF"
-                        else:
-                            if cmdarg.verbose:
-                                print "Relay " + cmdarg.relay + " state:\tON (" + str(state) + ")"
-                            else:
-                                print "ON"
-
-            # Action towards all relays
-            elif cmdarg.relay == "all":
-
-                if cmdarg.command == "on":
-                    if cmdarg.verbose:
-                        print "Relay " + str(cmdarg.relay) + " to ON"
-                    bb.port |= int(relay.address[cmdarg.relay], 16)
-
-                elif cmdarg.command == "off":
-                    if cmdarg.verbose:
-                        print "Relay "  + str(cmdarg.relay) + " to OFF"
-                    bb.port &= ~int(relay.address[cmdarg.relay], 16)
-
-                elif cmdarg.command == "state":
-                    #for i in range(1,8):
-                    print bb.port
-                    for i in range(1,9):
-                        state = get_relay_state( bb.port, str(i) )
-                        if state == 0:
-                            if cmdarg.verbose:
-                                print "Relay " + str(i) + " state:\tOFF (" + str(state) + ")"
-                            else:
-                                print "OFF"
-                        else:
-                            if cmdarg.verbose:
-                                print "Relay " + str(i) + " state:\tON (" + str(state) + ")"
-                            else:
-                                print "ON"
-
-                else:
-                    print "Error: Unknown command"
-
-            else:
-                print "Error: Unknown relay number"
-                sys.exit(1)
+        while True:
+            connection, address = server.accept()
+            connection.settimeout(CLIENT_TIMEOUT)
+            try:
+                request = read_request(connection)
+                code, lines = serve_request(devices, request)
+                connection.sendall("\n".join([str(code)] + lines) + "\n")
+            except socket.timeout:
+                if cmdarg.verbose:
+                    print "Client timed out"
+            except socket.error:
+                pass # The client went away, nothing to tell it.
+            finally:
+                connection.close()
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        for bb in devices.values():
+            bb.close()
+
+def read_request(connection):
+    data = ""
+    while not data.endswith("\n"):
+        chunk = connection.recv(1024)
+        if not chunk:
+            break
+        data += chunk
+    return data.strip()
+
+def serve_request(devices, request):
+
+    if request == "list":
+        try:
+            return 0, device_list_lines()
+        except Exception, err:
+            return 1, ["Error: " + str(err)]
+
+    parts = request.split("\t")
+    if len(parts) != 4:
+        return 1, ["Error: Bad request"]
+    device, relay_name, command, verbose = parts
 
+    try:
+        if device not in devices:
+            devices[device] = backend.open(device)
+        return relay_command(devices[device], device, relay_name.lower(), command.lower(), verbose == "1")
     except Exception, err:
-        print "Error: " + str(err)
+        # Open it again next time, in case it was unplugged.
+        if device in devices:
+            try:
+                devices.pop(device).close()
+            except Exception:
+                pass
+        return 1, ["Error: " + str(err)]
+
+# ----------------------------------------------------------------------------
+# CLIENT()
+#
+# Send one command to a running daemon, print the reply and exit with its code
+# ----------------------------------------------------------------------------
+
+def client(socket_path, request):
+
+    try:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(socket_path)
+        connection.sendall(request + "\n")
+        reply = ""
+        while True:
+            chunk = connection.recv(4096)
+            if not chunk:
+                break
+            reply += chunk
+        connection.close()
+    except socket.error, err:
+        print "Error: drcontrol daemon not reachable on " + socket_path + ": " + str(err)
+        sys.exit(1)
+
+    lines = reply.split("\n")
+    for line in lines[1:]:
+        if line:
+            print line
+    try:
+        sys.exit(int(lines[0]))
+    except ValueError:
+        print "Error: Bad reply from drcontrol daemon"
         sys.exit(1)
 
 def check():
@@ -276,15 +434,16 @@ if __name__ == '__main__':
     relay = relay_data()
     app = app_data()
 
-    # Do system check
-    check()
-
     parser = OptionParser()
     parser.add_option("-d", "--device", action="store", type="string", dest="device", help="The device serial, example A6VV5PHY")
     parser.add_option("-l", "--list", action="store_true", dest="list", default=False, help="List all devices")
     parser.add_option("-r", "--relay", action="store", type="string", dest="relay", help="Relay to command by number: 1...8 or all")
     parser.add_option("-c", "--command", action="store", type="string", dest="command", help="State: on, off, state")
     parser.add_option("-v", "--verbose", action="store_true", dest="verbose", default=False, help="Verbose, print all info on screen")
+    parser.add_option("-b", "--backend", action="store", type="string", dest="backend", help="Device backend: ftdi or simulated, default is $" + BACKEND_ENVIRONMENT_VARIABLE + " or ftdi")
+    parser.add_option("--daemon", action="store_true", dest="daemon", default=False, help="Keep devices open and take commands from --client on a Unix socket")
+    parser.add_option("--client", action="store_true", dest="client", default=False, help="Send the command to a running --daemon instead of opening the device")
+    parser.add_option("-s", "--socket", action="store", type="string", dest="socket", default=DEFAULT_SOCKET, help="Socket for --daemon and --client, default " + DEFAULT_SOCKET)
 
     (options, args) = parser.parse_args()
 
@@ -294,6 +453,29 @@ if __name__ == '__main__':
     else:
         cmdarg.verbose = False
 
+    if options.client:
+        # No backend or library check, the daemon has the device open.
+        if options.list:
+            client(options.socket, "list")
+        if not (options.device and options.relay and options.command):
+            print "Error: Need a device, relay and command to send"
+            sys.exit(1)
+        client(options.socket, "\t".join([options.device, options.relay, options.command, "1" if options.verbose else "0"]))
+
+    backend_name = options.backend or os.environ.get(BACKEND_ENVIRONMENT_VARIABLE, "ftdi")
+    if backend_name == "ftdi":
+        # Do system check
+        check()
+    try:
+        backend = load_backend(backend_name)
+    except ValueError, err:
+        print "Error: " + str(err)
+        sys.exit(1)
+
+    if options.daemon:
+        serve(options.socket)
+        sys.exit(0)
+
     if options.list:
         list_devices()
         sys.exit(0)
@@ -316,8 +498,3 @@ if __name__ == '__main__':
 
         set_relay()
         sys.exit(0)
-
-
-
-
-
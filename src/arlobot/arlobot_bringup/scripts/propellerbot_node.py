@@ -28,6 +28,7 @@ import time
 import json
 import subprocess
 import os
+import threading
 
 from geometry_msgs.msg import Quaternion
 from geometry_msgs.msg import Twist
@@ -36,10 +37,47 @@ from nav_msgs.msg import Odometry
 from std_msgs.msg import String
 from std_msgs.msg import Bool
 from arlobot_msgs.msg import usbRelayStatus, arloStatus, arloSafety
-from arlobot_msgs.srv import FindRelay, ToggleRelay
+from arlobot_msgs.srv import FindRelay, ToggleRelays
 
 from SerialDataGateway import SerialDataGateway
 from OdomStationaryBroadcaster import OdomStationaryBroadcaster
+from StartupTimer import StartupTimer
+import PropellerLinkDiagnostics as LinkDiagnostics
+import ProximityScan
+
+# arloStatus fields that cause an immediate publish when they change.
+# Everything else (heading, battery level, etc.) is only sent with the heartbeat.
+ARLO_STATUS_SAFETY_FIELDS = ('safeToProceed', 'safeToRecede', 'Escaping', 'abd_speedLimit', 'abdR_speedLimit',
+                             'leftMotorPower', 'rightMotorPower', 'robotBatteryLow', 'acPower',
+                             'cliff', 'floorObstacle')
+
+# Drive geometry settings in the order they appear in the 'd' message to the Propeller board.
+# The same names are used as keys in 'u' (update) messages and the 'a' (acknowledgement) replies.
+DRIVE_PARAM_KEYS = ('trackWidth', 'distancePerCount', 'ignoreProximity', 'ignoreCliffSensors',
+                    'ignoreIRSensors', 'ignoreFloorSensors', 'pluggedIn')
+
+# Telemetry periods in milliseconds, also sent as 'u' messages.
+# The Propeller board clamps them to these limits, so keep them in sync with the Propeller C code.
+TELEMETRY_RATE_KEYS = ('odomPeriod', 'statusPeriod', 'sensorPeriod')
+TELEMETRY_PERIOD_LIMITS = {'odomPeriod': (20, 1000), 'statusPeriod': (100, 10000), 'sensorPeriod': (0, 1000)}
+# Used if ~telemetryRates is not set. "idle" matches the Propeller board's defaults.
+DEFAULT_TELEMETRY_RATES = {
+    'active': {'odomPeriod': 50, 'statusPeriod': 500, 'sensorPeriod': 0},
+    'idle': {'odomPeriod': 100, 'statusPeriod': 1000, 'sensorPeriod': 0},
+    'charging': {'odomPeriod': 500, 'statusPeriod': 5000, 'sensorPeriod': 250}
+}
+
+
+def _same_param_value(sent, acknowledged):
+    """
+    The Propeller board echoes back what it parsed, printed its own way,
+    so the values are compared as numbers, allowing for the rounding of '%f'.
+    """
+    try:
+        sent, acknowledged = float(sent), float(acknowledged)
+    except (TypeError, ValueError):
+        return sent == acknowledged
+    return abs(sent - acknowledged) <= 1e-6 * max(1.0, abs(sent))
 
 
 class PropellerComm(object):
@@ -49,6 +87,7 @@ class PropellerComm(object):
 
     def __init__(self):
         rospy.init_node('arlobot')
+        self._StartupTimer = StartupTimer("Propellerbot_node startup")
 
         self.r = rospy.Rate(1) # 1hz refresh rate
         self._Counter = 0  # For Propeller code's _HandleReceivedLine and _write_serial
@@ -77,30 +116,41 @@ class PropellerComm(object):
         self.ignore_cliff_sensors = rospy.get_param("~ignoreCliffSensors", False);
         self.ignore_ir_sensors = rospy.get_param("~ignoreIRSensors", False);
         self.ignore_floor_sensors = rospy.get_param("~ignoreFloorSensors", False);
-        self.robotParamChanged = False
-
-        # Get motor relay numbers for use later in _HandleUSBRelayStatus if USB Relay is in use:
+        # Drive geometry changes are sent as keyed 'u' updates which the Propeller board acknowledges.
+        # Values are kept as the strings sent over the wire and compared with _same_param_value.
+        self._propellerInitialized = False  # True once the board is sending odometry
+        self._initDriveParams = None  # Values sent in the last 'd' initialization message
+        self._driveParamsAcknowledged = {}  # key: value the board has confirmed
+        self._pendingDriveParams = {}  # key: [value, time sent, attempts]
+        self._driveParamLock = threading.Lock()
+        self._driveParamAckTimeout = rospy.get_param("~driveParamAckTimeout", 1.0)
+        self._driveParamRetries = rospy.get_param("~driveParamRetries", 3)
+        # If a full 'd' message does not get a setting acknowledged either, wait longer before each next one.
+        self._driveParamMaxBackoff = rospy.get_param("~driveParamMaxBackoff", 60.0)
+        self._fullDriveParamUpdates = 0
+        self._nextFullDriveParamUpdate = 0
+        # Telemetry rates are picked from a profile based on what the robot is doing.
+        self._telemetryRates = rospy.get_param("~telemetryRates", DEFAULT_TELEMETRY_RATES)
+        self._telemetryProfileSetting = rospy.get_param("~telemetryProfile", "auto")
+        self._telemetryActiveTimeout = rospy.get_param("~telemetryActiveTimeout", 5.0)
+        self._telemetryProfile = "idle"
+        self._lastMotionCommandTime = 0
+        # arlo_status is published when a safety related field changes, or as a heartbeat.
+        self._arloStatusPublishOnChange = rospy.get_param("~arloStatusPublishOnChange", True)
+        self._arloStatusHeartbeatPeriod = rospy.get_param("~arloStatusHeartbeatPeriod", 5.0)
+        self._lastArloStatusState = None
+        self._lastArloStatusTime = 0
+
+        # Get motor relay labels for use later in _find_motor_relays if USB Relay is in use.
+        # The relay numbers themselves are looked up in the background by _find_motor_relays,
+        # so that waiting for arlobot_usbrelay does not hold up the serial port and odometry.
         self.relayExists = rospy.get_param("~usbRelayInstalled", False)
+        self._motorRelaysFound = False  # Set by _find_motor_relays once relay numbers are known
         if self.relayExists:
             # I think it is better to get these once than on every run of _HandleUSBRelayStatus
             self.usbLeftMotorRelayLabel = rospy.get_param("~usbLeftMotorRelayLabel", "")
             self.usbRightMotorRelayLabel = rospy.get_param("~usbRightMotorRelayLabel", "")
-            rospy.loginfo("Waiting for USB Relay find_relay service to start . . .")
-            rospy.wait_for_service('/arlobot_usbrelay/find_relay')
-            rospy.loginfo("USB Relay find_relay service started.")
-            try:
-                find_relay = rospy.ServiceProxy('/arlobot_usbrelay/find_relay', FindRelay)
-                self.leftMotorRelay = find_relay(self.usbLeftMotorRelayLabel)
-                self.rightMotorRelay = find_relay(self.usbRightMotorRelayLabel)
-                if self.leftMotorRelay.foundRelay and self.leftMotorRelay.foundRelay:
-                    rospy.loginfo("Left = " + str(self.leftMotorRelay.relayNumber) + " & Right = " + str(
-                        self.rightMotorRelay.relayNumber))
-                else:
-                    self.relayExists = False
-            except rospy.ServiceException as e:
-                rospy.loginfo("Service call failed: %s" % e)
-            rospy.Subscriber("arlobot_usbrelay/usbRelayStatus", usbRelayStatus,
-                             self._handle_usb_relay_status)  # Safety Shutdown
+        self._StartupTimer.mark("parameters loaded")
 
         # Subscriptions
         rospy.Subscriber("cmd_vel", Twist, self._handle_velocity_command)  # Is this line or the below bad redundancy?
@@ -109,7 +159,7 @@ class PropellerComm(object):
         # Publishers
         self._SerialPublisher = rospy.Publisher('serial', String, queue_size=10)
         self._pirPublisher = rospy.Publisher('~pirState', Bool, queue_size=1)  # for publishing PIR status
-        self._arlo_status_publisher = rospy.Publisher('arlo_status', arloStatus, queue_size=1)
+        self._arlo_status_publisher = rospy.Publisher('arlo_status', arloStatus, queue_size=1, latch=True)
 
         # IF the Odometry Transform is done with the robot_pose_ekf do not publish it,
         # but we are not using robot_pose_ekf, because it does nothing for us if you don't have a full IMU!
@@ -130,6 +180,48 @@ class PropellerComm(object):
         rospy.loginfo("Starting with serial port: " + port + ", baud rate: " + str(baud_rate))
         self._SerialDataGateway = SerialDataGateway(port, baud_rate, self._handle_received_line)
         self._OdomStationaryBroadcaster = OdomStationaryBroadcaster(self._broadcast_static_odometry_info)
+        # Serial link health is published on /diagnostics
+        self._LinkDiagnostics = LinkDiagnostics.PropellerLinkDiagnostics(port,
+                                                                         rospy.get_param("~diagnosticsPeriod", 1.0),
+                                                                         rospy.get_param("~diagnosticsWindow", 10),
+                                                                         self._link_expected)
+        self._StartupTimer.mark("publishers and subscribers created")
+
+    def _find_motor_relays(self):
+        """
+        Look up the motor relay numbers from arlobot_usbrelay.
+        This runs in its own thread so that the serial port and stationary odometry
+        can start while we wait for the arlobot_usbrelay node to come up.
+        """
+        rospy.loginfo("Waiting for USB Relay find_relay service to start . . .")
+        try:
+            rospy.wait_for_service('/arlobot_usbrelay/find_relay')
+        except rospy.ROSInterruptException:
+            return
+        rospy.loginfo("USB Relay find_relay service started.")
+        self._StartupTimer.mark("find_relay service available")
+        while not rospy.is_shutdown():
+            try:
+                find_relay = rospy.ServiceProxy('/arlobot_usbrelay/find_relay', FindRelay)
+                left_motor_relay = find_relay(self.usbLeftMotorRelayLabel)
+                right_motor_relay = find_relay(self.usbRightMotorRelayLabel)
+            except rospy.ServiceException as e:
+                rospy.loginfo("Service call failed: %s" % e)
+                time.sleep(1)
+                continue
+            if left_motor_relay.foundRelay and right_motor_relay.foundRelay:
+                self.leftMotorRelay = left_motor_relay
+                self.rightMotorRelay = right_motor_relay
+                rospy.loginfo("Left = " + str(self.leftMotorRelay.relayNumber) + " & Right = " + str(
+                    self.rightMotorRelay.relayNumber))
+                rospy.Subscriber("arlobot_usbrelay/usbRelayStatus", usbRelayStatus,
+                                 self._handle_usb_relay_status)  # Safety Shutdown
+                self._motorRelaysFound = True
+                self._StartupTimer.mark("motor relays found")
+            else:
+                rospy.logwarn("Motor relays not found by arlobot_usbrelay, motors will not be switched.")
+                self.relayExists = False
+            return
 
     def _handle_received_line(self, line):  # This is Propeller specific
         """
@@ -138,6 +230,9 @@ class PropellerComm(object):
         """
         self._Counter += 1
         self._serialTimeout = 0
+        if self._Counter == 1:
+            self._StartupTimer.mark("first line from Propeller board")
+        self._LinkDiagnostics.count(LinkDiagnostics.BYTES_IN, len(line) + 1)
         # rospy.logdebug(str(self._Counter) + " " + line)
         # if self._Counter % 50 == 0:
         self._SerialPublisher.publish(String(str(self._Counter) + ", in:  " + line))
@@ -146,67 +241,113 @@ class PropellerComm(object):
             line_parts = line.split('\t')
             # We should broadcast the odometry no matter what. Even if the motors are off, or location is useful!
             if line_parts[0] == 'o':
+                self._LinkDiagnostics.count(LinkDiagnostics.LINES_ODOMETRY)
+                if not self._propellerInitialized:
+                    self._handle_propeller_initialized()
                 self._broadcast_odometry_info(line_parts)
+                if not self._StartupTimer.done:
+                    self._StartupTimer.finish("first odometry from Propeller board")
                 return
             if line_parts[0] == 'i':
+                self._LinkDiagnostics.count(LinkDiagnostics.LINES_INIT)
+                self._propellerInitialized = False
                 self._initialize_drive_geometry(line_parts)
                 return
+            if line_parts[0] == 'a':  # Acknowledgement of a drive geometry update
+                self._LinkDiagnostics.count(LinkDiagnostics.LINES_ACKNOWLEDGEMENT)
+                self._handle_drive_param_acknowledgement(line_parts)
+                return
             if line_parts[0] == 's':  # Arlo Status info, such as sensors.
                 # rospy.loginfo("Propeller: " + line)
+                self._LinkDiagnostics.count(LinkDiagnostics.LINES_STATUS)
                 self._broadcast_arlo_status(line_parts)
                 return
+        self._LinkDiagnostics.count(LinkDiagnostics.LINES_OTHER)
+
+    def _count_bad_length_line(self, parts_count, expected_count):
+        if parts_count < expected_count:
+            self._LinkDiagnostics.count(LinkDiagnostics.SHORT_LINES)
+            rospy.logwarn("Short line from Propeller board: " + str(parts_count))
+        else:
+            self._LinkDiagnostics.count(LinkDiagnostics.LONG_LINES)
+            rospy.logwarn("Long line from Propeller board: " + str(parts_count))
+
+    def _link_expected(self):
+        # Used by the link diagnostics to decide if silence from the board is a problem.
+        return self._serialAvailable
 
     def _broadcast_arlo_status(self, line_parts):
-        arlo_status = arloStatus()
         # Order from ROS Interface for ArloBot.c
         # dprint(term, "s\t%d\t%d\t%d\t%d\t%d\n", safeToProceed, safeToRecede, Escaping, abd_speedLimit, abdR_speedLimit);
-        if int(line_parts[1]) == 1:
-            arlo_status.safeToProceed = True
-        else:
-            arlo_status.safeToProceed = False
-        if int(line_parts[2]) == 1:
-            arlo_status.safeToRecede = True
-        else:
-            arlo_status.safeToRecede = False
-        if int(line_parts[3]) == 1:
-            arlo_status.Escaping = True
-        else:
-            arlo_status.Escaping = False
-        arlo_status.abd_speedLimit = int(line_parts[4])
-        arlo_status.abdR_speedLimit = int(line_parts[5])
-        arlo_status.Heading = self.lastHeading
-        arlo_status.gyroHeading = self.alternate_heading
-        arlo_status.minDistanceSensor = int(line_parts[6])
-        left_motor_voltage = (15 / 4.69) * float(line_parts[7])
-        right_motor_voltage = (15 / 4.69) * float(line_parts[8])
-        arlo_status.robotBatteryLevel = 12.0
+        if len(line_parts) != 11:
+            self._count_bad_length_line(len(line_parts), 11)
+            return
+        try:
+            safe_to_proceed = int(line_parts[1]) == 1
+            safe_to_recede = int(line_parts[2]) == 1
+            escaping = int(line_parts[3]) == 1
+            abd_speed_limit = int(line_parts[4])
+            abdr_speed_limit = int(line_parts[5])
+            min_distance_sensor = int(line_parts[6])
+            left_motor_voltage = (15 / 4.69) * float(line_parts[7])
+            right_motor_voltage = (15 / 4.69) * float(line_parts[8])
+            cliff = int(line_parts[9]) == 1
+            floor_obstacle = int(line_parts[10]) == 1
+        except ValueError:
+            self._LinkDiagnostics.count(LinkDiagnostics.PARSE_ERRORS)
+            return
+        robot_battery_level = 12.0
         if left_motor_voltage < 1:
-            arlo_status.leftMotorPower = False
+            self._leftMotorPower = False
         else:
-            arlo_status.leftMotorPower = True
-            arlo_status.robotBatteryLevel = left_motor_voltage
-        self._leftMotorPower = arlo_status.leftMotorPower
+            self._leftMotorPower = True
+            robot_battery_level = left_motor_voltage
         if right_motor_voltage < 1:
-            arlo_status.rightMotorPower = False
+            self._rightMotorPower = False
         else:
-            arlo_status.rightMotorPower = True
-            arlo_status.robotBatteryLevel = right_motor_voltage
-        self._rightMotorPower = arlo_status.rightMotorPower
+            self._rightMotorPower = True
+            robot_battery_level = right_motor_voltage
         # 11.6 volts is the cutoff for an SLA battery.
-        if arlo_status.robotBatteryLevel < 12:
-            arlo_status.robotBatteryLow = True
-        else:
-            arlo_status.robotBatteryLow = False
+        robot_battery_low = robot_battery_level < 12
+
+        # Only publish right away if something safety related changed,
+        # otherwise just send a heartbeat now and then.
+        # The topic is latched so late subscribers still get the current state.
+        # Must be in the same order as ARLO_STATUS_SAFETY_FIELDS
+        safety_state = (safe_to_proceed, safe_to_recede, escaping, abd_speed_limit, abdr_speed_limit,
+                        self._leftMotorPower, self._rightMotorPower, robot_battery_low, self._acPower,
+                        cliff, floor_obstacle)
+        now = time.time()
+        changed_fields = []
+        if self._lastArloStatusState is not None:
+            for field, old_value, new_value in zip(ARLO_STATUS_SAFETY_FIELDS, self._lastArloStatusState, safety_state):
+                if old_value != new_value:
+                    changed_fields.append(field)
+            if self._arloStatusPublishOnChange and not changed_fields and \
+                    now - self._lastArloStatusTime < self._arloStatusHeartbeatPeriod:
+                return
+        self._lastArloStatusState = safety_state
+        self._lastArloStatusTime = now
+
+        arlo_status = arloStatus()
+        arlo_status.safeToProceed = safe_to_proceed
+        arlo_status.safeToRecede = safe_to_recede
+        arlo_status.Escaping = escaping
+        arlo_status.abd_speedLimit = abd_speed_limit
+        arlo_status.abdR_speedLimit = abdr_speed_limit
+        arlo_status.Heading = self.lastHeading
+        arlo_status.gyroHeading = self.alternate_heading
+        arlo_status.minDistanceSensor = min_distance_sensor
+        arlo_status.leftMotorPower = self._leftMotorPower
+        arlo_status.rightMotorPower = self._rightMotorPower
+        arlo_status.robotBatteryLevel = robot_battery_level
+        arlo_status.robotBatteryLow = robot_battery_low
         arlo_status.laptopBatteryPercent = self._laptop_battery_percent
         arlo_status.acPower = self._acPower
-        if int(line_parts[9]) == 1:
-            arlo_status.cliff = True
-        else:
-            arlo_status.cliff = False
-        if int(line_parts[10]) == 1:
-            arlo_status.floorObstacle = True
-        else:
-            arlo_status.floorObstacle = False
+        arlo_status.cliff = cliff
+        arlo_status.floorObstacle = floor_obstacle
+        # Empty on heartbeats and on the first message.
+        arlo_status.changedFields = changed_fields
         self._arlo_status_publisher.publish(arlo_status)
 
     def _handle_usb_relay_status(self, status):
@@ -237,7 +378,8 @@ class PropellerComm(object):
         old_ac_power = self._acPower
         self._acPower = status.acPower
         if not old_ac_power == self._acPower:
-            self.robotParamChanged = True
+            # Let the Propeller board know right away instead of waiting for the watchDog
+            self._update_drive_params()
 
         self._laptop_battery_percent = status.laptopBatteryPercent
         if not self._SafeToOperate:
@@ -246,6 +388,7 @@ class PropellerComm(object):
                 self._reset_serial_connection()
 
     def _reset_serial_connection(self):
+        reset_start_time = time.time()
         if self._motorsOn:
             self._switch_motors(False)
             # Wait for the motors to shut off
@@ -254,6 +397,7 @@ class PropellerComm(object):
         # Reset the propeller board, otherwise there are problems
         # if you bring up the motors again while it has been operating
         self._serialAvailable = False
+        self._propellerInitialized = False
         rospy.loginfo("Serial Data Gateway stopping . . .")
         try:
             self._SerialDataGateway.Stop()
@@ -263,6 +407,7 @@ class PropellerComm(object):
         rospy.loginfo("5 second pause to let Activity Board settle after serial port reset . . .")
         time.sleep(5)  # Give it time to settle.
         self.startSerialPort()
+        self._LinkDiagnostics.record_reconnect(time.time() - reset_start_time)
 
     def _broadcast_odometry_info(self, line_parts):
         """
@@ -276,17 +421,21 @@ class PropellerComm(object):
 
         # rospy.logwarn(partsCount)
         if parts_count != 8:  # Just discard short/long lines, increment this as lines get longer
-            rospy.logwarn("Short line from Propeller board: " + str(parts_count))
+            self._count_bad_length_line(parts_count, 8)
             return
 
-        x = float(line_parts[1])
-        y = float(line_parts[2])
-        # 3 is odom based heading and 4 is gyro based
-        theta = float(line_parts[3])  # On ArloBot odometry derived heading works best.
-        alternate_theta = float(line_parts[4])
-
-        vx = float(line_parts[5])
-        omega = float(line_parts[6])
+        try:
+            x = float(line_parts[1])
+            y = float(line_parts[2])
+            # 3 is odom based heading and 4 is gyro based
+            theta = float(line_parts[3])  # On ArloBot odometry derived heading works best.
+            alternate_theta = float(line_parts[4])
+
+            vx = float(line_parts[5])
+            omega = float(line_parts[6])
+        except ValueError:
+            self._LinkDiagnostics.count(LinkDiagnostics.PARSE_ERRORS)
+            return
 
         quaternion = Quaternion()
         quaternion.x = 0.0
@@ -399,258 +548,13 @@ class PropellerComm(object):
         # Some help:
         # http://goo.gl/ZU9XrJ
 
-        # TODO: I'm doing this all in degrees and then converting to Radians later.
-        # Is there any way to do this in Radians?
-        # I just don't know how to create and fill an array with "Radians"
-        # since they are not rational numbers, but multiples of PI, thus the degrees.
-        num_readings = 360  # How about 1 per degree?
-        #num_reeading_multiple = 2 # We have to track this so we know where to put the readings!
-        #num_readings = 360 * num_reeading_multiple
-        laser_frequency = 100  # I'm not sure how to decide what to use here.
-        # This is the fake distance to set all empty slots, and slots we consider "out of range"
-        artificial_far_distance = 10
-        #ranges = [1] * num_readings # Fill array with fake "1" readings for testing
-        # Fill array with artificial_far_distance (not 0) and then overlap with real readings
-        ping_ranges = [artificial_far_distance] * num_readings
-        # If we use 0, then it won't clear the obstacles when we rotate away,
-        # because costmap2d ignores 0's and Out of Range!
-        # Fill array with artificial_far_distance (not 0) and then overlap with real readings
-        ir_ranges = [artificial_far_distance] * num_readings
-
-        # New idea here:
-        # First, I do not think that this can be used for reliable for map generation.
-        # If your room has objects that the Kinect
-        # cannot map, then you will probably need to modify the room (cover mirrors, etc.) or try
-        # other laser scanner options.
-        # SO, since we only want to use it for cost planning, we should modify the data, because
-        # it is easy for it to get bogged down with a lot of "stuff" everywhere.
-
-        # From:
-        # http://answers.ros.org/question/11446/costmaps-obstacle-does-not-clear-properly-under-sparse-environment/
-        # "When clearing obstacles, costmap_2d only trusts laser scans returning a definite range.
-        # Indoors, that makes sense. Outdoors, most scans return max range, which does not clear
-        # intervening obstacles. A fake scan with slightly shorter ranges can be constructed that
-        # does clear them out."
-        # SO, we need to set all "hits" above the distance we want to pay attention to to a distance very far away,
-        # but just within the range_max (which we can set to anything we want),
-        # otherwise costmap will not clear items!
-        # Also, 0 does not clear anything! So if we rotate, then it gets 0 at that point, and ignores it,
-        # so we need to fill the unused slots with long distances.
-        # NOTE: This does cause a "circle" to be drawn around the robot at the "artificalFarDistance",
-        # but it shouldn't be a problem because we set
-        # artificial_far_distance to a distance greater than the planner uses.
-        # So while it clears things, it shouldn't cause a problem, and the Kinect should override it for things
-        # in between.
-
-        # Use:
-        # roslaunch arlobot_rviz_launchers view_robot.launch
-        # to view this well for debugging and testing.
-
-        # Note that sensor orientation is important here!
-        # If you have a different number or aim them differently this will not work!
-        # TODO: Tweak this value based on real measurements!
-        # TODO: Use both IR and PING sensors?
-        # The offset between the pretend sensor location in the URDF
-        # and real location needs to be added to these values. This may need to be tweaked.
-        sensor_offset = 0.217 # Measured, Calculated: 0.22545
-        # This will be the max used range, anything beyond this is set to "artificial_far_distance"
-        max_range_accepted = .5
-
-        # max_range_accepted Testing:
-        # TODO: More tweaking here could be done.
-        # I think it is a trade-off, so there is no end to the adjustment that could be done.
-        # I did a lot of testing with gmappingn while building a map.
-        # Obviously this would be slightly different from using a map we do not update.
-        # It seems there are so many variables here that testing is difficult.
-        # We could find one number works great in one situation but is hopeless in another.
-        # Having a comprehensive test course to test in multiple modes for every possible value would be great,
-        # but I think it would take months! :)
-        # REMEMBER, the costmap only pays attention out to a certain set
-        # for obstacle_range in costmap_common_params.yaml anyway.
-        # Here are my notes for different values of "max_range_accepted":
-        # 1 - looks good, and works ok, but
-        # I am afraid that the costmap gets confused with things popping in and out of sight all of the time,
-        # causing undue wandering.
-        # 2 - This producing less wandering due to things popping in and out of the field of view,
-        # BUT it also shows that we get odd affects at longer distances. i.e.
-        #     A doorframe almost always has a hit right in the middle of it.
-        #     In a hallway there is often a hit in the middle about 1.5 meters out.
-        # .5 - This works very well to have the PING data ONLY provide obstacle avoidance,
-        # and immediately forget about said obstacles.
-        #     This prevents the navigation stack from fighting with the Activity Board code's
-        # built in safety stops, and instead navigate around obstacles before the Activity Board
-        # code gets involved (other than to set speed reductions).
-        #     The only down side is if you tell ArloBot to go somewhere that he cannot due to low obstacles,
-        # he will try forever. He won't just bounce off of the obstacle,
-        #     but he will keep trying it and then go away, turn around,
-        # and try again over and over. He may even start wandering around
-        # the facility trying to find another way in,
-        #     but he will eventually come back and try it again.
-        #     I'm not sure what the solution to this is though,
-        # because avoiding low lying obstacles and adding low lying
-        # features to the map are really two different things.
-        #     I think if this is well tuned to avoid low lying obstacles it
-        # probably will not work well for mapping features.
-        #     IF we could map features with the PING sensors, we wouldn't need the 3D sensor. :)
-        # TODO: One option may be more PING sensors around back.
-        # Right now when the robot spins, it clears the obstacles behind it,
-        # because there are fewer sensors on the back side.
-        # If the obstacle was seen all of the way around the robot, in the same spot,
-        # it may stop returning to the same location as soon as it turns around?
-
-        #     NOTE: The bump sensors on Turtlebot mark but do not clear.
-        # I'm not sure how that works out. It seems like every bump would
-        # end up being a "blot" in the landscape never to be returned to,
-        # but maybe there is something I am missing?
-
-        # NOTE: Could this be different for PING vs. IR?
-        # Currently I'm not using IR! Just PING. The IR is not being used by costmap.
-        # It is here for seeing in RVIZ, and the Propeller board uses it for emergency stopping,
-        # but costmap isn't watching it at the moment. I think it is too erratic for that.
-
         try:
             sensor_data = json.loads(line_parts[7])
         except:
+            self._LinkDiagnostics.count(LinkDiagnostics.JSON_ERRORS)
             return
-        ping = [artificial_far_distance] * 10
-        ir = [artificial_far_distance] * len(ping)
-
-        # Convert cm to meters and add offset
-        for i in range(0, len(ping)):
-            # ping[0] = (int(line_parts[7]) / 100.0) + sensor_offset
-            ping[i] = (sensor_data.get('p' + str(i), artificial_far_distance * 100) / 100.0) + sensor_offset
-            # Set to "out of range" for distances over "max_range_accepted" to clear long range obstacles
-            # and use this for near range only.
-            if ping[i] > max_range_accepted:
-                # Be sure "ultrasonic_scan.range_max" is set higher than this or
-                # costmap will ignore these and not clear the cost map!
-                ping[i] = artificial_far_distance
-            ir[i] = (sensor_data.get('i' + str(i), artificial_far_distance * 100) / 100.0) + sensor_offset  # Convert cm to meters and add offset
-
-        # Overwrite main sensors with upper deck sensors if they exist and are closer,
-        # TODO: This code is very manual. It won't break if you don't have these sensors, but
-        # the positions are hard coded. :(
-
-        if sensor_data.get('p' + str(10)):
-            upperSensor = (sensor_data.get('p' + str(10), artificial_far_distance * 100) / 100.0) + sensor_offset
-            if upperSensor < ping[1]:
-                ping[1] = upperSensor
-        if sensor_data.get('p' + str(11)):
-            upperSensor = (sensor_data.get('p' + str(11), artificial_far_distance * 100) / 100.0) + sensor_offset
-            if upperSensor < ping[2]:
-                ping[2] = upperSensor
-        if sensor_data.get('p' + str(12)):
-            upperSensor = (sensor_data.get('p' + str(12), artificial_far_distance * 100) / 100.0) + sensor_offset
-            if upperSensor < ping[3]:
-                ping[3] = upperSensor
-        if sensor_data.get('p' + str(13)):
-            upperSensor = (sensor_data.get('p' + str(13), artificial_far_distance * 100) / 100.0) + sensor_offset
-            if upperSensor < ping[7]:
-                ping[7] = upperSensor
-        # TODO: Duduplicate the above code.
-
-        # The sensors are 11cm from center to center at the front of the base plate.
-        # The radius of the base plate is 22.545 cm
-        # = 28 degree difference (http://ostermiller.org/calc/triangle.html)
-
-        sensor_seperation = 28
-
-        # Spread code: NO LONGER USED
-        # TODO: This could make sense to return to if used properly,
-        # allowing obstacles to "fill" the space and smoothly move "around"
-        # the robot as it rotates and objects move across the view of the PING
-        # sensors, instead of "jumping" from one point to the next.
-        # # "sensor_spread" is how wide we expand the sensor "point" in the fake laser scan.
-        # # For the purpose of obstacle avoidance, I think this can actually be a single point,
-        # # Since the costmap inflates these anyway.
-        #
-        # #One issue I am having is it seems that the "ray trace" to the maximum distance
-        # #may not line up with near hits, so that the global cost map is not being cleared!
-        # #Switching from a "spread" to a single point may fix this?
-        # #Since the costmap inflates obstacles anyway, we shouldn't need the spread should we?
-        #
-        # #sensor_spread = 10 # This is how wide of an arc (in degrees) to paint for each "hit"
-        # #sensor_spread = 2 # Testing. I think it has to be even numbers?
-        #
-        # #NOTE:
-        # #This assumes that things get bigger as they are further away. This is true of the PING's area,
-        # #and while it may or may not be true of the object the PING sees, we have no way of knowing if
-        # #the object fills the ping's entire field of view or only a small part of it, a "hit" is a "hit".
-        # #However for the IR sensor, the objects are points, that are the same size regardless of distance,
-        # #so we are clearly inflating them here.
-        #
-        # for x in range(180 - sensor_spread / 2, 180 + sensor_spread / 2):
-        #     PINGranges[x] = ping[5] # Rear Sensor
-        #     IRranges[x] = ir[5] # Rear Sensor
-        #
-        # for x in range((360 - sensor_seperation * 2) - sensor_spread / 2,
-        #                (360 - sensor_seperation * 2) + sensor_spread / 2):
-        #     PINGranges[x] = ping[4]
-        #     IRranges[x] = ir[4]
-        #
-        # for x in range((360 - sensor_seperation) - sensor_spread / 2,
-        #                (360 - sensor_seperation) + sensor_spread / 2):
-        #     PINGranges[x] = ping[3]
-        #     IRranges[x] = ir[3]
-        #
-        # for x in range(360 - sensor_spread / 2, 360):
-        #     PINGranges[x] = ping[2]
-        #     IRranges[x] = ir[2]
-        # # Crosses center line
-        # for x in range(0, sensor_spread /2):
-        #     PINGranges[x] = ping[2]
-        #     IRranges[x] = ir[2]
-        #
-        # for x in range(sensor_seperation - sensor_spread / 2, sensor_seperation + sensor_spread / 2):
-        #     PINGranges[x] = ping[1]
-        #     IRranges[x] = ir[1]
-        #
-        # for x in range((sensor_seperation * 2) - sensor_spread / 2, (sensor_seperation * 2) + sensor_spread / 2):
-        #     PINGranges[x] = ping[0]
-        #     IRranges[x] = ir[0]
-
-        # Single Point code:
-        #for x in range(180 - sensor_spread / 2, 180 + sensor_spread / 2):
-        ping_ranges[180 + sensor_seperation * 2] = ping[5]
-        ir_ranges[180 + sensor_seperation * 2] = ir[5]
-
-        ping_ranges[180 + sensor_seperation] = ping[6]
-        ir_ranges[180 + sensor_seperation] = ir[6]
-
-        ping_ranges[180] = ping[7]  # Rear Sensor
-        ir_ranges[180] = ir[7]  # Rear Sensor
-
-        ping_ranges[180 - sensor_seperation] = ping[8]
-        ir_ranges[180 - sensor_seperation] = ir[8]
-
-        ping_ranges[180 - sensor_seperation * 2] = ping[9]
-        ir_ranges[180 - sensor_seperation * 2] = ir[9]
-
-        # for x in range((360 - sensor_seperation * 2) - sensor_spread / 2,
-        #                (360 - sensor_seperation * 2) + sensor_spread / 2):
-        ping_ranges[360 - sensor_seperation * 2] = ping[4]
-        ir_ranges[360 - sensor_seperation * 2] = ir[4]
-
-        # for x in range((360 - sensor_seperation) - sensor_spread / 2,
-        #                (360 - sensor_seperation) + sensor_spread / 2):
-        ping_ranges[360 - sensor_seperation] = ping[3]
-        ir_ranges[360 - sensor_seperation] = ir[3]
-
-        #for x in range(360 - sensor_spread / 2, 360):
-        #PINGranges[x] = ping[2]
-        #IRranges[x] = ir[2]
-        # Crosses center line
-        #for x in range(0, sensor_spread /2):
-        ping_ranges[0] = ping[2]
-        ir_ranges[0] = ir[2]
-
-        #for x in range(sensor_seperation - sensor_spread / 2, sensor_seperation + sensor_spread / 2):
-        ping_ranges[sensor_seperation] = ping[1]
-        ir_ranges[sensor_seperation] = ir[1]
-
-        #for x in range((sensor_seperation * 2) - sensor_spread / 2, (sensor_seperation * 2) + sensor_spread / 2):
-        ping_ranges[sensor_seperation * 2] = ping[0]
-        ir_ranges[sensor_seperation * 2] = ir[0]
+        # Where each sensor's reading goes, and why the rest are filled with a far distance, is in ProximityScan.py.
+        ping_ranges, ir_ranges = ProximityScan.proximity_ranges(sensor_data)
 
         # LaserScan: http://docs.ros.org/api/sensor_msgs/html/msg/LaserScan.html
         ultrasonic_scan = LaserScan()
@@ -671,12 +575,12 @@ class PropellerComm(object):
         #infrared_scan.angle_max = 2 * 3.14159 # Full circle # Letting it use default, which I think is the same.
         #ultrasonic_scan.scan_time = 3 # I think this is only really applied for 3D scanning
         #infrared_scan.scan_time = 3 # I think this is only really applied for 3D scanning
-        # Make sure the part you divide by num_readings is the same as your angle_max!
+        # Make sure the part you divide by NUM_READINGS is the same as your angle_max!
         # Might even make sense to use a variable here?
-        ultrasonic_scan.angle_increment = (2 * 3.14) / num_readings
-        infrared_scan.angle_increment = (2 * 3.14) / num_readings
-        ultrasonic_scan.time_increment = (1 / laser_frequency) / num_readings
-        infrared_scan.time_increment = (1 / laser_frequency) / num_readings
+        ultrasonic_scan.angle_increment = (2 * 3.14) / ProximityScan.NUM_READINGS
+        infrared_scan.angle_increment = (2 * 3.14) / ProximityScan.NUM_READINGS
+        ultrasonic_scan.time_increment = (1 / ProximityScan.LASER_FREQUENCY) / ProximityScan.NUM_READINGS
+        infrared_scan.time_increment = (1 / ProximityScan.LASER_FREQUENCY) / ProximityScan.NUM_READINGS
         # From: http://www.parallax.com/product/28015
         # Range: approximately 1 inch to 10 feet (2 cm to 3 m)
         # This should be adjusted based on the imaginary distance between the actual laser
@@ -689,9 +593,9 @@ class PropellerComm(object):
         # otherwise "hits" at artificial_far_distance will be ignored,
         # which means they will not be used to clear the cost map!
         # in Meters Distances above this will be ignored
-        ultrasonic_scan.range_max = artificial_far_distance + 1
+        ultrasonic_scan.range_max = ProximityScan.ARTIFICIAL_FAR_DISTANCE + 1
         # in Meters Distances above this will be ignored
-        infrared_scan.range_max = artificial_far_distance + 1
+        infrared_scan.range_max = ProximityScan.ARTIFICIAL_FAR_DISTANCE + 1
         ultrasonic_scan.ranges = ping_ranges
         infrared_scan.ranges = ir_ranges
         # "intensity" is a value specific to each laser scanner model.
@@ -702,11 +606,23 @@ class PropellerComm(object):
 
     def _write_serial(self, message):
         self._SerialPublisher.publish(String(str(self._Counter) + ", out: " + message))
-        self._SerialDataGateway.Write(message)
+        try:
+            self._SerialDataGateway.Write(message)
+        except:
+            self._LinkDiagnostics.count(LinkDiagnostics.WRITE_ERRORS)
+            raise
+        self._LinkDiagnostics.count(LinkDiagnostics.BYTES_OUT, len(message))
 
     def start(self):
+        self._LinkDiagnostics.Start()
         self._OdomStationaryBroadcaster.Start()
+        self._StartupTimer.mark("stationary odometry started")
+        if self.relayExists:
+            relay_thread = threading.Thread(target=self._find_motor_relays)
+            relay_thread.setDaemon(True)
+            relay_thread.start()
         self.startSerialPort()
+        self._StartupTimer.mark("serial port open")
         self._serialTimeout = 0
 
     def startSerialPort(self):
@@ -752,6 +668,7 @@ class PropellerComm(object):
             rospy.loginfo("Attempt to start nonexistent Serial device.")
         rospy.loginfo("_SerialDataGateway stopped.")
         self._OdomStationaryBroadcaster.Stop()
+        self._LinkDiagnostics.Stop()
 
     def _handle_velocity_command(self, twist_command):  # This is Propeller specific
         """ Handle movement requests. """
@@ -764,6 +681,11 @@ class PropellerComm(object):
             # rospy.logdebug("Handling twist command: " + str(v) + "," + str(omega))
             message = 's,%.3f,%.3f\r' % (v, omega)
             self._write_serial(message)
+            if v != 0 or omega != 0:
+                self._lastMotionCommandTime = time.time()
+                if self._telemetryProfile != "active":
+                    # Do not wait for the watchDog to speed up odometry once we start moving.
+                    self._update_telemetry_profile()
         elif self._clear_to_go("to_stop"):
             # WARNING! If you change this check the buffer length in the Propeller C code!
             message = 's,0.0,0.0\r'  # Tell it to be still if it is not safe to operate
@@ -773,29 +695,12 @@ class PropellerComm(object):
     def _initialize_drive_geometry(self, line_parts):
         """ Send parameters from YAML file to Propeller board. """
         if self._SafeToOperate:
-            if (self.ignore_proximity):
-                ignore_proximity = 1
-            else:
-                ignore_proximity = 0
-            if (self.ignore_cliff_sensors):
-                ignore_cliff_sensors = 1
-            else:
-                ignore_cliff_sensors = 0
-            if (self.ignore_ir_sensors):
-                ignore_ir_sensors = 1
-            else:
-                ignore_ir_sensors = 0
-            if (self.ignore_floor_sensors):
-                ignore_floor_sensors = 1
-            else:
-                ignore_floor_sensors = 0
-            if (self._acPower):
-                ac_power = 1
-            else:
-                ac_power = 0
+            drive_params = self._drive_param_values()
             # WARNING! If you change this check the buffer length in the Propeller C code!
-            message = 'd,%f,%f,%d,%d,%d,%d,%d,%f,%f,%f\r' % (self.track_width, self.distance_per_count, ignore_proximity, ignore_cliff_sensors, ignore_ir_sensors, ignore_floor_sensors, ac_power, self.lastX, self.lastY, self.lastHeading)
+            message = 'd,%s,%f,%f,%f\r' % (','.join(drive_params), self.lastX, self.lastY, self.lastHeading)
             rospy.logdebug("Sending drive geometry params message: " + message)
+            with self._driveParamLock:
+                self._initDriveParams = drive_params
             self._write_serial(message)
         else:
             if int(line_parts[1]) == 1:
@@ -803,6 +708,141 @@ class PropellerComm(object):
             else:
                 self._pirPublisher.publish(False)
 
+    def _drive_param_values(self):
+        """ Current drive geometry settings, formatted as they are sent to the Propeller board. """
+        return ('%f' % float(self.track_width), '%f' % float(self.distance_per_count),
+                '%d' % bool(self.ignore_proximity), '%d' % bool(self.ignore_cliff_sensors),
+                '%d' % bool(self.ignore_ir_sensors), '%d' % bool(self.ignore_floor_sensors),
+                '%d' % bool(self._acPower))
+
+    def _telemetry_rate_values(self):
+        """ Telemetry periods for the current profile, formatted as they are sent to the Propeller board. """
+        rates = self._telemetryRates.get(self._telemetryProfile, DEFAULT_TELEMETRY_RATES[self._telemetryProfile])
+        values = []
+        for key in TELEMETRY_RATE_KEYS:
+            minimum, maximum = TELEMETRY_PERIOD_LIMITS[key]
+            period = int(rates.get(key, DEFAULT_TELEMETRY_RATES[self._telemetryProfile][key]))
+            values.append('%d' % min(max(period, minimum), maximum))
+        return tuple(values)
+
+    def _select_telemetry_profile(self):
+        """
+        Fast odometry while driving, slow telemetry on the charger when nobody is listening,
+        and the Propeller board's default rates otherwise.
+        """
+        if not self._telemetryProfileSetting == "auto":
+            return self._telemetryProfileSetting
+        if self._motorsOn and time.time() - self._lastMotionCommandTime < self._telemetryActiveTimeout:
+            return "active"
+        listeners = self._OdometryPublisher.get_num_connections() + \
+                    self._UltraSonicPublisher.get_num_connections() + \
+                    self._InfraredPublisher.get_num_connections()
+        if self._acPower and not self._motorsOn and listeners == 0:
+            return "charging"
+        return "idle"
+
+    def _update_telemetry_profile(self):
+        profile = self._select_telemetry_profile()
+        if profile not in DEFAULT_TELEMETRY_RATES:
+            rospy.logwarn("Unknown telemetry profile " + str(profile) + ", using idle.")
+            profile = "idle"
+        if not profile == self._telemetryProfile:
+            rospy.loginfo("Telemetry profile changed from " + self._telemetryProfile + " to " + profile)
+            self._telemetryProfile = profile
+            self._update_drive_params()
+
+    def _handle_propeller_initialized(self):
+        """
+        The board sends odometry once it has accepted a 'd' message,
+        so whatever was in the last one is what the board has now.
+        """
+        with self._driveParamLock:
+            self._propellerInitialized = True
+            self._pendingDriveParams = {}
+            self._fullDriveParamUpdates = 0
+            self._nextFullDriveParamUpdate = 0
+            if self._initDriveParams is None:
+                self._driveParamsAcknowledged = {}
+            else:
+                self._driveParamsAcknowledged = dict(zip(DRIVE_PARAM_KEYS, self._initDriveParams))
+
+    def _update_drive_params(self):
+        """
+        Send a 'u' message for each drive geometry setting or telemetry rate that differs from
+        what the Propeller board has acknowledged, and resend any that have not been acknowledged in time.
+        If a drive geometry setting is still not acknowledged after all retries, send the entire 'd' message,
+        waiting twice as long before each further one, up to ~driveParamMaxBackoff.
+        """
+        if not self._propellerInitialized:
+            # The 'd' message sent during initialization will carry the current settings,
+            # and telemetry rates follow once the board is up.
+            return
+        drive_params = self._drive_param_values()
+        settings = list(zip(DRIVE_PARAM_KEYS, drive_params)) + \
+                   list(zip(TELEMETRY_RATE_KEYS, self._telemetry_rate_values()))
+        now = time.time()
+        messages = []
+        send_full_update = False
+        with self._driveParamLock:
+            for key, value in settings:
+                if _same_param_value(value, self._driveParamsAcknowledged.get(key)):
+                    self._pendingDriveParams.pop(key, None)
+                    continue
+                pending = self._pendingDriveParams.get(key)
+                if pending is None or pending[0] != value:
+                    self._pendingDriveParams[key] = [value, now, 1]
+                elif now - pending[1] < self._driveParamAckTimeout:
+                    continue
+                elif pending[2] < self._driveParamRetries:
+                    rospy.loginfo("Resending " + key + " to Propeller board.")
+                    pending[1] = now
+                    pending[2] += 1
+                elif key in DRIVE_PARAM_KEYS:
+                    send_full_update = True
+                    continue
+                else:
+                    rospy.logwarn("Propeller board did not acknowledge " + key + ", trying again.")
+                    pending[1] = now
+                    pending[2] = 1
+                # WARNING! If you change this check the buffer length in the Propeller C code!
+                messages.append('u,%s,%s\r' % (key, value))
+            if not any(key in self._pendingDriveParams for key in DRIVE_PARAM_KEYS):
+                self._fullDriveParamUpdates = 0
+                self._nextFullDriveParamUpdate = 0
+            if send_full_update and now >= self._nextFullDriveParamUpdate:
+                backoff = min(self._driveParamAckTimeout * 2 ** self._fullDriveParamUpdates,
+                              self._driveParamMaxBackoff)
+                self._fullDriveParamUpdates += 1
+                self._nextFullDriveParamUpdate = now + backoff
+                unacknowledged = [key for key in DRIVE_PARAM_KEYS if key in self._pendingDriveParams]
+                rospy.logerr("Propeller board did not acknowledge " + ", ".join(unacknowledged) +
+                             ", sending all drive geometry (attempt %d, next in %.0f seconds)."
+                             % (self._fullDriveParamUpdates, backoff))
+                messages.append('d,%s\r' % ','.join(drive_params))
+        for message in messages:
+            self._write_serial(message)
+
+    def _handle_drive_param_acknowledgement(self, line_parts):
+        """
+        The Propeller board replies to 'u' messages with a\t<key>\t<value>
+        and to 'd' messages with a\td\t<all values in DRIVE_PARAM_KEYS order>
+        echoing the values it is actually using.
+        """
+        if line_parts[1:2] == ['d']:
+            acknowledged = zip(DRIVE_PARAM_KEYS, line_parts[2:])
+        elif len(line_parts) == 3:
+            acknowledged = [(line_parts[1], line_parts[2])]
+        else:
+            self._count_bad_length_line(len(line_parts), 3)
+            return
+        with self._driveParamLock:
+            for key, value in acknowledged:
+                self._driveParamsAcknowledged[key] = value
+                pending = self._pendingDriveParams.get(key)
+                if pending is not None and _same_param_value(pending[0], value):
+                    del self._pendingDriveParams[key]
+                    rospy.loginfo("Propeller board acknowledged " + key + " = " + value)
+
     def _broadcast_static_odometry_info(self):
         """
         Broadcast last known odometry and transform while propeller board is offline
@@ -860,19 +900,24 @@ class PropellerComm(object):
         """ Switch Motors on and off as needed. """
         # Relay control was moved to its own package
         if self.relayExists:
+            if not self._motorRelaysFound:
+                # _find_motor_relays has not finished yet, the motors stay off until it does.
+                return
             if not self._SwitchingMotors:  # Prevent overlapping runs
                 self._SwitchingMotors = True
                 # Switch "on" to "off" if not safe to operate,
                 # then we can just pass state to arlobot_usbrelay
                 if not self._SafeToOperate:
                     state = False
-                rospy.wait_for_service('/arlobot_usbrelay/toggle_relay')
+                rospy.wait_for_service('/arlobot_usbrelay/toggle_relays')
                 rospy.loginfo("Switching motors.")
                 try:
-                    toggle_relay = rospy.ServiceProxy('/arlobot_usbrelay/toggle_relay', ToggleRelay)
-                    left_relay_result = toggle_relay(self.usbLeftMotorRelayLabel, state)
-                    right_relay_result = toggle_relay(self.usbRightMotorRelayLabel, state)
-                    if left_relay_result.toggleSuccess and right_relay_result.toggleSuccess:
+                    # Both motors are switched in one write, so one is never powered without the other.
+                    toggle_relays = rospy.ServiceProxy('/arlobot_usbrelay/toggle_relays', ToggleRelays)
+                    relay_result = toggle_relays([self.usbLeftMotorRelayLabel, self.usbRightMotorRelayLabel],
+                                                 [state, state])
+                    # relayOn is what the board reports after the write.
+                    if relay_result.toggleSuccess and all(relay_result.relayOn):
                         self._motorsOn = True
                     else:
                         self._motorsOn = False
@@ -891,65 +936,22 @@ class PropellerComm(object):
             #rospy.loginfo("Serial Timeout = " + str(self._serialTimeout))
             if self._serialTimeout > 19:
                 rospy.loginfo("Watchdog Timeout Reset initiated")
+                self._LinkDiagnostics.count(LinkDiagnostics.WATCHDOG_RESETS)
                 self._reset_serial_connection()
             if self._unPlugging or self._wasUnplugging:
                 self.UnplugRobot()
 
-            old_track_width = self.track_width
             self.track_width = rospy.get_param("~driveGeometry/trackWidth", "0")
-            if not old_track_width == self.track_width:
-                self.robotParamChanged = True
-
-            old_distance_per_count = self.distance_per_count
             self.distance_per_count = rospy.get_param("~driveGeometry/distancePerCount", "0")
-            if not old_distance_per_count == self.distance_per_count:
-                self.robotParamChanged = True
-
-            old_ignore_proximity = self.ignore_proximity
             self.ignore_proximity = rospy.get_param("~ignoreProximity", False);
-            if not old_ignore_proximity == self.ignore_proximity:
-                self.robotParamChanged = True
-
-            old_ignore_cliff_sensors = self.ignore_cliff_sensors
             self.ignore_cliff_sensors = rospy.get_param("~ignoreCliffSensors", False);
-            if not old_ignore_cliff_sensors == self.ignore_cliff_sensors:
-                self.robotParamChanged = True
-
-            old_ignore_ir_sensors = self.ignore_ir_sensors
             self.ignore_ir_sensors = rospy.get_param("~ignoreIRSensors", False);
-            if not old_ignore_ir_sensors == self.ignore_ir_sensors:
-                self.robotParamChanged = True
-
-            old_ignore_floor_sensors = self.ignore_floor_sensors
             self.ignore_floor_sensors = rospy.get_param("~ignoreFloorSensors", False);
-            if not old_ignore_floor_sensors == self.ignore_floor_sensors:
-                self.robotParamChanged = True
-
-            if self.robotParamChanged:
-                if (self.ignore_proximity):
-                    ignore_proximity = 1
-                else:
-                    ignore_proximity = 0
-                if (self.ignore_cliff_sensors):
-                    ignore_cliff_sensors = 1
-                else:
-                    ignore_cliff_sensors = 0
-                if (self.ignore_ir_sensors):
-                    ignore_ir_sensors = 1
-                else:
-                    ignore_ir_sensors = 0
-                if (self.ignore_floor_sensors):
-                    ignore_floor_sensors = 1
-                else:
-                    ignore_floor_sensors = 0
-                if (self._acPower):
-                    ac_power = 1
-                else:
-                    ac_power = 0
-                # WARNING! If you change this check the buffer length in the Propeller C code!
-                message = 'd,%f,%f,%d,%d,%d,%d,%d\r' % (self.track_width, self.distance_per_count, ignore_proximity, ignore_cliff_sensors, ignore_ir_sensors, ignore_floor_sensors, ac_power)
-                self._write_serial(message)
-                self.robotParamChanged = False
+            self._telemetryRates = rospy.get_param("~telemetryRates", DEFAULT_TELEMETRY_RATES)
+            self._telemetryProfileSetting = rospy.get_param("~telemetryProfile", "auto")
+            self._update_telemetry_profile()
+            # Sends only the settings that changed, and handles acknowledgement retries.
+            self._update_drive_params()
 
             self.r.sleep()
 
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import rospy
+import roslaunch
+import rosgraph
+from geometry_msgs.msg import Twist
+from arlobot_msgs.srv import UnPlug
+
+from FakePropeller import FakePropeller
+
+'''
+Measures how long it takes the robot to stop.
+
+propellerbot_node and arlobot_safety are started against a fake Propeller board on a pty,
+a fake /sys/class/power_supply tree and a temporary HOME, with cmd_vel streaming a forward command.
+Each scenario then does something that should stop the robot and times how long it takes
+for "s,0.0,0.0" to be written to the serial port:
+
+stop_file - A STOP file is created in ~/.arlobot/status
+door_file - A door file is created in ~/.arlobot/status/doors
+ac_power - The AC adapter is plugged in
+unplug - An unplug is cancelled while the robot is backing away from the charger
+
+Usage:
+rosrun arlobot_bringup stop_latency_benchmark.py --trials 50 --max-p99 500
+
+A roscore is started on its own port, so this does not touch a running robot.
+The exit code is 1 if a --max-p99 limit is given and any scenario is slower than it,
+so it can be run automatically to catch safety latency regressions.
+'''
+
+SCENARIOS = ('stop_file', 'door_file', 'ac_power', 'unplug')
+
+# Parameters a real robot would get from ~/.arlobot/arlobot.yaml
+NODE_PARAMS = {
+    '/arlobot/driveGeometry/trackWidth': 0.403,
+    '/arlobot/driveGeometry/distancePerCount': 0.00676,
+    '/arlobot/usbRelayInstalled': False,
+    '/arlobot/monitorACconnection': True,
+    '/arlobot/ignoreProximity': False,
+    '/arlobot/ignoreCliffSensors': False,
+    '/arlobot/ignoreIRSensors': False,
+    '/arlobot/ignoreFloorSensors': False,
+    '/arlobot/mapname': 'empty',
+    '/arlobot_safety/powerBackend': 'sysfs',
+}
+
+
+def _is_stop(line):
+    return line == 's,0.0,0.0'
+
+
+def _is_moving(line):
+    # Any speed command that is not a stop, or the unplugging crawl
+    return line.startswith('s,') and not _is_stop(line)
+
+
+def percentile(sorted_values, fraction):
+    ''' Nearest rank percentile of an already sorted list. '''
+    if not sorted_values:
+        return float('nan')
+    rank = int(round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[rank]
+
+
+class StopLatencyBenchmark(object):
+    '''
+    Sets up the fake robot, runs the scenarios and collects the latencies.
+    '''
+
+    def __init__(self, args):
+        self._Args = args
+        self._TempDir = tempfile.mkdtemp(prefix='arlobot_stop_latency_')
+        self._Home = os.path.join(self._TempDir, 'home')
+        self._StatusDir = os.path.join(self._Home, '.arlobot', 'status')
+        self._DoorDir = os.path.join(self._StatusDir, 'doors')
+        self._PowerSupplyDir = os.path.join(self._TempDir, 'power_supply')
+        self._Roscore = None
+        self._Launch = None
+        self._Board = None
+        self._CmdVelTimer = None
+
+    def setUp(self):
+        os.makedirs(self._DoorDir)
+        self._write_power_supply('AC', {'type': 'Mains', 'online': '0'})
+        self._write_power_supply('BAT0', {'type': 'Battery', 'capacity': '90'})
+
+        # Everything we start, including the nodes, uses the temporary HOME and our own roscore.
+        os.environ['HOME'] = self._Home
+        os.environ['ROS_MASTER_URI'] = 'http://localhost:%d' % self._Args.port
+        if rosgraph.is_master_online():
+            raise RuntimeError("Something is already using port %d, try another --port" % self._Args.port)
+        devnull = open(os.devnull, 'w')
+        self._Roscore = subprocess.Popen(['roscore', '-p', str(self._Args.port)], stdout=devnull, stderr=devnull)
+        deadline = time.time() + 30
+        while not rosgraph.is_master_online():
+            if time.time() > deadline:
+                raise RuntimeError("roscore did not start")
+            time.sleep(0.1)
+
+        self._Board = FakePropeller(lineHandler=self._ignore_line)
+        self._Board.Start()
+
+        rospy.init_node('stop_latency_benchmark')
+        for name, value in NODE_PARAMS.items():
+            rospy.set_param(name, value)
+        rospy.set_param('/arlobot/port', self._Board.port)
+        rospy.set_param('/arlobot_safety/powerSupplyPath', self._PowerSupplyDir)
+        rospy.set_param('/arlobot_safety/powerPollPeriod', self._Args.power_poll_period)
+
+        self._Launch = roslaunch.scriptapi.ROSLaunch()
+        self._Launch.start()
+        self._Launch.launch(roslaunch.core.Node('arlobot_safety', 'arlobot_safety.py', name='arlobot_safety'))
+        self._Launch.launch(roslaunch.core.Node('arlobot_bringup', 'propellerbot_node.py', name='arlobot'))
+
+        self._CmdVelPublisher = rospy.Publisher('cmd_vel', Twist, queue_size=1)
+        self._CmdVelTimer = rospy.Timer(rospy.Duration(1.0 / self._Args.cmd_vel_rate), self._send_cmd_vel)
+        rospy.wait_for_service('arlobot_unplug', timeout=30)
+        self._Unplug = rospy.ServiceProxy('arlobot_unplug', UnPlug)
+
+        if self._Board.wait_for_line(_is_moving, since=time.time(), timeout=60) is None:
+            raise RuntimeError("propellerbot_node never started driving the fake Propeller board")
+
+    def tearDown(self):
+        if self._CmdVelTimer is not None:
+            self._CmdVelTimer.shutdown()
+        if self._Launch is not None:
+            self._Launch.stop()
+        if self._Board is not None:
+            self._Board.Stop()
+        if self._Roscore is not None:
+            self._Roscore.terminate()
+            self._Roscore.wait()
+        shutil.rmtree(self._TempDir, ignore_errors=True)
+
+    @staticmethod
+    def _ignore_line(timestamp, line):
+        pass
+
+    def _send_cmd_vel(self, event):
+        twist = Twist()
+        twist.linear.x = 0.1
+        self._CmdVelPublisher.publish(twist)
+
+    def _write_power_supply(self, supply, attributes):
+        supply_dir = os.path.join(self._PowerSupplyDir, supply)
+        if not os.path.isdir(supply_dir):
+            os.makedirs(supply_dir)
+        for name, value in attributes.items():
+            # Write in place, like the kernel does, so open files see the new value.
+            with open(os.path.join(supply_dir, name), 'w') as f:
+                f.write(value + '\n')
+
+    def _set_ac_power(self, online):
+        self._write_power_supply('AC', {'online': '1' if online else '0'})
+
+    def _touch(self, path):
+        open(path, 'w').close()
+
+    def _wait_until_moving(self):
+        if self._Board.wait_for_line(_is_moving, since=time.time(), timeout=30) is None:
+            raise RuntimeError("The robot did not start moving again")
+
+    def _time_stop(self, action):
+        '''
+        Do action and return the seconds until the stop command reaches the serial port,
+        or None if it never did.
+        '''
+        # Do not line up with the cmd_vel timer every time.
+        time.sleep(random.uniform(0, 1.0 / self._Args.cmd_vel_rate))
+        start = time.time()
+        action()
+        stopped = self._Board.wait_for_line(_is_stop, since=start, timeout=self._Args.timeout)
+        if stopped is None:
+            return None
+        return stopped[0] - start
+
+    def run_scenario(self, scenario):
+        latencies = []
+        failures = 0
+        for trial in range(self._Args.trials):
+            if scenario == 'unplug':
+                latency = self._unplug_trial()
+            else:
+                self._wait_until_moving()
+                if scenario == 'stop_file':
+                    stop_file = os.path.join(self._StatusDir, 'STOP')
+                    latency = self._time_stop(lambda: self._touch(stop_file))
+                    os.remove(stop_file)
+                elif scenario == 'door_file':
+                    door_file = os.path.join(self._DoorDir, 'benchmark-door')
+                    latency = self._time_stop(lambda: self._touch(door_file))
+                    os.remove(door_file)
+                else:
+                    latency = self._time_stop(lambda: self._set_ac_power(True))
+                    self._set_ac_power(False)
+            if latency is None:
+                failures += 1
+            else:
+                latencies.append(latency)
+        if scenario == 'unplug':
+            self._set_ac_power(False)
+        return latencies, failures
+
+    def _unplug_trial(self):
+        # Sit on the charger, ask to unplug, and cancel once the robot starts backing away.
+        self._set_ac_power(True)
+        self._Board.wait_for_line(_is_stop, since=time.time(), timeout=30)
+        self._Unplug(True)
+        if self._Board.wait_for_line(lambda line: line.startswith('s,-'), since=time.time(), timeout=30) is None:
+            self._Unplug(False)
+            return None
+        return self._time_stop(lambda: self._Unplug(False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time how long it takes ArloBot to stop.")
+    parser.add_argument('--trials', type=int, default=50, help="Trials per scenario")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--cmd-vel-rate', type=float, default=10.0, help="Hz to send cmd_vel at")
+    parser.add_argument('--power-poll-period', type=float, default=0.5,
+                        help="Seconds between reads of the fake power supply by arlobot_safety")
+    parser.add_argument('--timeout', type=float, default=5.0, help="Seconds to wait for a stop")
+    parser.add_argument('--port', type=int, default=11399, help="Port for our own roscore")
+    parser.add_argument('--max-p99', type=float, default=None,
+                        help="Fail if any scenario's 99th percentile is over this many milliseconds")
+    args = parser.parse_args(rospy.myargv()[1:])
+
+    benchmark = StopLatencyBenchmark(args)
+    results = {}
+    try:
+        benchmark.setUp()
+        for scenario in args.scenarios:
+            results[scenario] = benchmark.run_scenario(scenario)
+    finally:
+        benchmark.tearDown()
+
+    failed = False
+    print("%-10s %6s %8s %8s %8s %8s %8s" % ('scenario', 'trials', 'p50 ms', 'p99 ms', 'min ms', 'max ms', 'missed'))
+    for scenario in args.scenarios:
+        latencies, failures = results[scenario]
+        latencies = sorted(latency * 1000 for latency in latencies)
+        p99 = percentile(latencies, 0.99)
+        print("%-10s %6d %8.1f %8.1f %8.1f %8.1f %8d" % (scenario, len(latencies) + failures,
+                                                          percentile(latencies, 0.5), p99,
+                                                          latencies[0] if latencies else float('nan'),
+                                                          latencies[-1] if latencies else float('nan'),
+                                                          failures))
+        if failures or (args.max_p99 is not None and not p99 <= args.max_p99):
+            failed = True
+    if failed:
+        print("FAILED: a stop was missed or took too long.")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+import threading
+import time
+
+import rospy
+from actionlib_msgs.msg import GoalStatus
+
+'''
+Sends move_base goals and waits for them to finish, for arlobot_explore.py, arlobot_goto.py
+and arlobot_movement_test.py.
+
+Instead of checking get_state() once a second, the wait is woken by the action client's
+done and feedback callbacks, by the active cmd_vel_mux controller changing and by pause requests,
+so a goal that finishes is noticed right away and the next one can be sent.
+'''
+
+# http://docs.ros.org/indigo/api/actionlib_msgs/html/msg/GoalStatus.html
+STATE_NAMES = dict((getattr(GoalStatus, name), name) for name in
+                   ('PENDING', 'ACTIVE', 'PREEMPTED', 'SUCCEEDED', 'ABORTED', 'REJECTED',
+                    'PREEMPTING', 'RECALLING', 'RECALLED', 'LOST'))
+
+# Give move_base this long to get going before taking an idle cmd_vel_mux to mean it gave up.
+IDLE_GRACE_SECONDS = 5
+
+
+class GoalMonitor(object):
+    '''
+    Helper class that runs one move_base goal at a time through a SimpleActionClient.
+    '''
+
+    def __init__(self, client):
+        self._Client = client
+        self._Condition = threading.Condition()
+        # Each goal gets a new number, so callbacks from a goal that was replaced are ignored.
+        self._Goal = 0
+        self._Done = False
+        self._State = None
+        self._ActiveController = ""
+        self._Paused = False
+        self.feedback = None
+        rospy.on_shutdown(self._notify)
+
+    def _notify(self):
+        with self._Condition:
+            self._Condition.notify_all()
+
+    def set_active_controller(self, controller):
+        ''' Call with every message from /cmd_vel_mux/active. '''
+        with self._Condition:
+            self._ActiveController = controller
+            self._Condition.notify_all()
+
+    def set_paused(self, paused):
+        ''' A goal sent with cancelOnPause is cancelled as soon as this is set. '''
+        with self._Condition:
+            self._Paused = paused
+            self._Condition.notify_all()
+
+    def _callbacks(self, goal):
+        def active():
+            rospy.loginfo("Goal is ACTIVE")
+
+        def feedback(feedback):
+            with self._Condition:
+                if goal == self._Goal:
+                    self.feedback = feedback
+
+        def done(state, result):
+            with self._Condition:
+                if goal == self._Goal:
+                    self._State = state
+                    self._Done = True
+                    self._Condition.notify_all()
+
+        return done, active, feedback
+
+    def _wait_until(self, deadline, stop, wake=None):
+        '''
+        Wait for the goal to be done, deadline (a time.time()) to pass, the node to shut down, or stop() to be true.
+        stop is called with the condition held and returns the reason to give up, or None.
+        wake: A time.time() at which stop() should be asked again even if nothing changed.
+        Returns the reason the wait ended, None if the goal is done.
+        '''
+        with self._Condition:
+            while not self._Done:
+                if rospy.is_shutdown():
+                    return "Shutting down"
+                reason = stop()
+                if reason is not None:
+                    return reason
+                now = time.time()
+                remaining = deadline - now
+                if remaining <= 0:
+                    return "Time-out reached while attempting to reach goal"
+                # Wake up for the end of the idle grace period too, nothing else would wake us then.
+                if wake is not None and wake > now:
+                    remaining = min(remaining, wake - now)
+                self._Condition.wait(remaining)
+        return None
+
+    def move_to(self, goal, timeoutSeconds, cancelOnIdle=True, cancelOnPause=False):
+        '''
+        Send goal, a MoveBaseGoal, to move_base and wait for it to finish.
+        It is cancelled after timeoutSeconds, if the cmd_vel_mux goes idle when cancelOnIdle is set,
+        or if set_paused(True) is called when cancelOnPause is set,
+        and then given as long again to show up as cancelled.
+        Returns the final GoalStatus state, -1 if it was never sent, and its name or "PAUSED".
+        '''
+        if rospy.is_shutdown():
+            return -1, ""
+        # NOTE: Do not use cancel_all_goals here as it can cancel future goals sometimes!
+        self._Client.cancel_goals_at_and_before_time(rospy.Time.now())
+        goal.target_pose.header.stamp = rospy.Time.now()
+        with self._Condition:
+            self._Goal += 1
+            self._Done = False
+            self._State = None
+            self.feedback = None
+            done, active, feedback = self._callbacks(self._Goal)
+        start = time.time()
+        self._Client.send_goal(goal, done_cb=done, active_cb=active, feedback_cb=feedback)
+
+        def stop():
+            if cancelOnPause and self._Paused:
+                return "Paused"
+            if cancelOnIdle and time.time() - start > IDLE_GRACE_SECONDS and self._ActiveController == "idle":
+                return "Navigation is idle"
+            return None
+
+        wake = start + IDLE_GRACE_SECONDS if cancelOnIdle else None
+        reason = self._wait_until(start + timeoutSeconds, stop, wake)
+        if reason is not None:
+            rospy.loginfo(reason + ", canceling!")
+            # NOTE: Do not use cancel_all_goals here as it can cancel future goals sometimes!
+            self._Client.cancel_goal()
+            self._wait_until(time.time() + timeoutSeconds, lambda: None)
+        with self._Condition:
+            done, result = self._Done, self._State
+        if not done:
+            # Not while holding the condition, actionlib holds its own lock while calling done.
+            result = self._Client.get_state()
+        resultText = STATE_NAMES.get(result, "")
+        if reason == "Paused":
+            resultText = "PAUSED"
+        rospy.loginfo("Goal finished after %.1f seconds: %s %s" % (time.time() - start, result, resultText))
+        return result, resultText
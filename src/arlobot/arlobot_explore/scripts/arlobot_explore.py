@@ -17,6 +17,8 @@ import actionlib
 from actionlib_msgs.msg import GoalID
 from actionlib_msgs.msg import GoalStatus
 
+from GoalMonitor import GoalMonitor
+
 '''
 An attempt at "autonomous" navigation.
 See:
@@ -35,6 +37,8 @@ class ArlobotExplore(object):
 
         # Creates the SimpleActionClient, passing the type of the action
         self._MoveBaseClient = actionlib.SimpleActionClient('move_base', move_base_msgs.msg.MoveBaseAction)
+        # Sends goals and wakes up as soon as they finish, go idle or the explorer is paused.
+        self._GoalMonitor = GoalMonitor(self._MoveBaseClient)
 
         # Listen to the transforms http://wiki.ros.org/tf/TfUsingPython
         self.tf_listener = tf.listener.TransformListener()
@@ -60,6 +64,7 @@ class ArlobotExplore(object):
 
     def _pause_explorer(self, pause_explorer):
         self._explorer_paused = pause_explorer.pause_explorer
+        self._GoalMonitor.set_paused(self._explorer_paused)
         rospy.set_param("~pause", self._explorer_paused);
         return self._explorer_paused
 
@@ -69,6 +74,7 @@ class ArlobotExplore(object):
         Set unPlugging variable to allow for safe unplug operation.
         """
         self._active_controller = status.data
+        self._GoalMonitor.set_active_controller(self._active_controller)
         rospy.loginfo(self._active_controller)
 
     def Stop(self):
@@ -244,11 +250,6 @@ class ArlobotExplore(object):
         rospy.loginfo("Clean Finish")
 
     def _movetoPositiononMap(self, position, quaternion, timeoutSeconds):
-        result = -1
-        resultText = ""
-        if not rospy.is_shutdown():
-            self._MoveBaseClient.cancel_goals_at_and_before_time(rospy.Time.now())
-            # NOTE: Do not use cancel_all_goals here as it can cancel future goals sometimes!
         goal = move_base_msgs.msg.MoveBaseGoal()
         goal.target_pose.header.frame_id = "map"
         goal.target_pose.pose.position.x = position[0]
@@ -258,65 +259,8 @@ class ArlobotExplore(object):
         goal.target_pose.pose.orientation.y = quaternion[1]
         goal.target_pose.pose.orientation.z = quaternion[2]
         goal.target_pose.pose.orientation.w = quaternion[3]
-        goal.target_pose.header.stamp = rospy.Time.now()
-        if not rospy.is_shutdown():
-            self._MoveBaseClient.send_goal(goal)
-            count = 0
-            finished = False
-            # Wait for action to finish or timeout to run out
-            # Use double timeout, but cancel if timeout is met
-            while count < (timeoutSeconds * 2) and not finished and not rospy.is_shutdown():
-                if count > timeoutSeconds:
-                    finished = True
-                    rospy.loginfo("Time-out reached while attempting to reach goal, canceling!")
-                if count > 5 and self._active_controller == "idle":
-                    finished = True
-                    rospy.loginfo("Navigation is idle, canceling!")
-                count += 1
-                rospy.sleep(1) # Set this delay as you see fit. If the robot is extremely fast this could be slowing you down!
-                result = self._MoveBaseClient.get_state()
-                resultText = ""
-                # http://docs.ros.org/indigo/api/actionlib_msgs/html/msg/GoalStatus.html
-                if result == GoalStatus.PENDING:
-                    resultText = "PENDING"
-                if result == GoalStatus.ACTIVE:
-                    resultText = "ACTIVE"
-                if result == GoalStatus.PREEMPTED:
-                    finished = True
-                    resultText = "PREEMPTED"
-                if result == GoalStatus.SUCCEEDED:
-                    finished = True
-                    resultText = "SUCCEEDED"
-                if result == GoalStatus.ABORTED:
-                    finished = True
-                    resultText = "ABORTED"
-                if result == GoalStatus.REJECTED:
-                    finished = True
-                    resultText = "REJECTED"
-                if result == GoalStatus.PREEMPTING:
-                    resultText = "PREEMPTING"
-                if result == GoalStatus.RECALLING:
-                    resultText = "RECALLING"
-                if result == GoalStatus.RECALLED:
-                    finished = True
-                    resultText = "RECALLED"
-                if result == GoalStatus.LOST:
-                    finished = True
-                    resultText = "LOST"
-                if self._explorer_paused:
-                    finished = True
-                    resultText = "PAUSED"
-                rospy.loginfo("Pending result:" + str(result) + " " + resultText + " Time-out in :" + str(timeoutSeconds - count))
-                # If it was determined that we are "finished" then cancel
-                # any pending goals right now, because the loop will not
-                # repeat.
-                if finished:
-                    # NOTE: Do not use cancel_all_goals here as it can cancel future goals sometimes!
-                    self._MoveBaseClient.cancel_goal()
-        #self._MoveBaseClient.send_goal(goal)
-        #rospy.loginfo("Waiting for response . . .");
-        #self._MoveBaseClient.wait_for_result()
-        return result, resultText
+        return self._GoalMonitor.move_to(goal, timeoutSeconds, cancelOnPause=True)
+
 
 if __name__ == '__main__':
     node = ArlobotExplore()
@@ -16,6 +16,8 @@ import actionlib
 from actionlib_msgs.msg import GoalID
 from actionlib_msgs.msg import GoalStatus
 
+from GoalMonitor import GoalMonitor
+
 '''
 This script should start a service,
 which allows you to send arbitrary map based
@@ -38,6 +40,7 @@ class ArlobotGoTo(object):
 
         # Creates the SimpleActionClient, passing the type of the action
         self._MoveBaseClient = actionlib.SimpleActionClient('move_base', move_base_msgs.msg.MoveBaseAction)
+        self._GoalMonitor = GoalMonitor(self._MoveBaseClient)
 
         # Listen to the transforms http://wiki.ros.org/tf/TfUsingPython
         self.tf_listener = tf.listener.TransformListener()
@@ -77,6 +80,7 @@ class ArlobotGoTo(object):
         Set unPlugging variable to allow for safe unplug operation.
         """
         self._active_controller = status.data
+        self._GoalMonitor.set_active_controller(self._active_controller)
         rospy.loginfo('Active Controller: ' + self._active_controller)
 
     def _go_to_goal(self, new_goal):
@@ -128,65 +132,9 @@ class ArlobotGoTo(object):
         #######################################
 
         rospy.loginfo("Sending goal");
-        # Sends the goal to the action server.
-        result = -1
-        resultText = ""
+        # Sends the goal to the action server, and wakes up as soon as it finishes or navigation goes idle.
         timeoutSeconds = 60 # TODO: Should this be sent as part of the call?
-        if not rospy.is_shutdown():
-            self._MoveBaseClient.cancel_goals_at_and_before_time(rospy.Time.now())
-            # NOTE: Do not use cancel_all_goals here as it can cancel future goals sometimes!
-        goal.target_pose.header.stamp = rospy.Time.now()
-        if not rospy.is_shutdown():
-            self._MoveBaseClient.send_goal(goal)
-            count = 0
-            finished = False
-            # Wait for action to finish or timeout to run out
-            # Use double timeout, but cancel if timeout is met
-            while count < (timeoutSeconds * 2) and not finished and not rospy.is_shutdown():
-                if count > timeoutSeconds:
-                    finished = True
-                    rospy.loginfo("Time-out reached while attempting to reach goal, canceling!")
-                if count > 5 and self._active_controller == "idle":
-                    finished = True
-                    rospy.loginfo("Navigation is idle, canceling!")
-                count += 1
-                rospy.sleep(1) # Set this delay as you see fit. If the robot is extremely fast this could be slowing you down!
-                result = self._MoveBaseClient.get_state()
-                resultText = ""
-                # http://docs.ros.org/indigo/api/actionlib_msgs/html/msg/GoalStatus.html
-                if result == GoalStatus.PENDING:
-                    resultText = "PENDING"
-                if result == GoalStatus.ACTIVE:
-                    resultText = "ACTIVE"
-                if result == GoalStatus.PREEMPTED:
-                    finished = True
-                    resultText = "PREEMPTED"
-                if result == GoalStatus.SUCCEEDED:
-                    finished = True
-                    resultText = "SUCCEEDED"
-                if result == GoalStatus.ABORTED:
-                    finished = True
-                    resultText = "ABORTED"
-                if result == GoalStatus.REJECTED:
-                    finished = True
-                    resultText = "REJECTED"
-                if result == GoalStatus.PREEMPTING:
-                    resultText = "PREEMPTING"
-                if result == GoalStatus.RECALLING:
-                    resultText = "RECALLING"
-                if result == GoalStatus.RECALLED:
-                    finished = True
-                    resultText = "RECALLED"
-                if result == GoalStatus.LOST:
-                    finished = True
-                    resultText = "LOST"
-                rospy.loginfo("Pending result:" + str(result) + " " + resultText + " Time-out in :" + str(timeoutSeconds - count))
-                # If it was determined that we are "finished" then cancel
-                # any pending goals right now, because the loop will not
-                # repeat.
-                if finished:
-                    # NOTE: Do not use cancel_all_goals here as it can cancel future goals sometimes!
-                    self._MoveBaseClient.cancel_goal()
+        result, resultText = self._GoalMonitor.move_to(goal, timeoutSeconds)
 
         #current_odom = self.currentOdom
         t = self.tf_listener.getLatestCommonTime("/map", "/base_link")
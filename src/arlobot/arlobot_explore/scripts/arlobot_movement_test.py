@@ -15,6 +15,8 @@ import actionlib
 from actionlib_msgs.msg import GoalID
 from actionlib_msgs.msg import GoalStatus
 
+from GoalMonitor import GoalMonitor
+
 '''
 An attempt at "autonomous" navigation.
 See:
@@ -42,6 +44,7 @@ class ArlobotExplore(object):
         
         # Creates the SimpleActionClient, passing the type of the action
         self._MoveBaseClient = actionlib.SimpleActionClient('move_base', move_base_msgs.msg.MoveBaseAction)
+        self._GoalMonitor = GoalMonitor(self._MoveBaseClient)
         
         # Listen to the transforms http://wiki.ros.org/tf/TfUsingPython
         self.tf_listener = tf.listener.TransformListener()
@@ -718,11 +721,6 @@ class ArlobotExplore(object):
         rospy.loginfo("Clean Finish")
         
     def _movetoPositiononMap(self, position, quaternion, timeoutSeconds):
-        result = -1
-        resultText = ""
-        if not rospy.is_shutdown():
-            self._MoveBaseClient.cancel_goals_at_and_before_time(rospy.Time.now())
-            # NOTE: Do not use cancel_all_goals here as it can cancel future goals sometimes!
         goal = move_base_msgs.msg.MoveBaseGoal()
         goal.target_pose.header.frame_id = "map"
         goal.target_pose.pose.position.x = position[0]
@@ -732,56 +730,13 @@ class ArlobotExplore(object):
         goal.target_pose.pose.orientation.y = quaternion[1]
         goal.target_pose.pose.orientation.z = quaternion[2]
         goal.target_pose.pose.orientation.w = quaternion[3]
-        goal.target_pose.header.stamp = rospy.Time.now()
-        if not rospy.is_shutdown():
-            self._MoveBaseClient.send_goal(goal)
-            count = 0
-            finished = False
-            # Wait for action to finish or timeout to run out
-            # Use double timeout, but cancel if timeout is met
-            while count < (timeoutSeconds * 2) and not finished and not rospy.is_shutdown():
-                if count > timeoutSeconds:
-                    self._MoveBaseClient.cancel_goal()
-                    # NOTE: Do not use cancel_all_goals here as it can cancel future goals sometimes!
-                    print "Timeout reached, canceling!"
-                count += 1
-                rospy.sleep(1) # Set this delay as you see fit. If the robot is extremely fast this could be slowing you down!
-                result = self._MoveBaseClient.get_state()
-                resultText = ""
-                # http://docs.ros.org/indigo/api/actionlib_msgs/html/msg/GoalStatus.html
-                if result == GoalStatus.PENDING:
-                    resultText = "PENDING"
-                if result == GoalStatus.ACTIVE:
-                    resultText = "ACTIVE"
-                if result == GoalStatus.PREEMPTED:
-                    finished = True
-                    resultText = "PREEMPTED"
-                if result == GoalStatus.SUCCEEDED:
-                    finished = True
-                    resultText = "SUCCEEDED"
-                if result == GoalStatus.ABORTED:
-                    finished = True
-                    resultText = "ABORTED"
-                if result == GoalStatus.REJECTED:
-                    finished = True
-                    resultText = "REJECTED"
-                if result == GoalStatus.PREEMPTING:
-                    resultText = "PREEMPTING"
-                if result == GoalStatus.RECALLING:
-                    resultText = "RECALLING"
-                if result == GoalStatus.RECALLED:
-                    finished = True
-                    resultText = "RECALLED"
-                if result == GoalStatus.LOST:
-                    finished = True
-                    resultText = "LOST"
-                print str(result) + " " + resultText
-        #self._MoveBaseClient.send_goal(goal)
-        #rospy.loginfo("Waiting for response . . .");
-        #self._MoveBaseClient.wait_for_result()
+        # Nothing here watches the cmd_vel_mux, so only the time-out cancels a goal.
+        result, resultText = self._GoalMonitor.move_to(goal, timeoutSeconds, cancelOnIdle=False)
+        print str(result) + " " + resultText
         return result, resultText
         
 
+
 if __name__ == '__main__':
     node = ArlobotExplore()
     rospy.on_shutdown(node.Stop)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+import array
+import math
+import time
+
+'''
+Fixed memory history of a power reading (laptop battery percent, robot battery volts)
+with an estimate of how long until it reaches "empty".
+
+Samples are averaged into rings at several resolutions,
+by default the last 5 minutes by the second, 4 hours by the minute and a week by the hour,
+so a robot that runs for months uses the same memory as one that just started.
+
+The time to empty comes from an exponentially weighted least squares line
+that is updated with each sample, so it costs the same no matter how much history there is.
+'''
+
+# (seconds per slot, number of slots)
+DEFAULT_RESOLUTIONS = ((1, 300), (60, 240), (3600, 168))
+
+
+class _Ring(object):
+    '''
+    Averages samples into slots of a fixed number of seconds and keeps the last few slots.
+    '''
+
+    def __init__(self, step, size):
+        self.step = step
+        self.size = size
+        self._Times = array.array('d', [0.0] * size)
+        self._Values = array.array('d', [0.0] * size)
+        self._Next = 0  # Slot to write next
+        self._Count = 0  # Slots written so far, up to size
+        self._SlotStart = None
+        self._SlotSum = 0.0
+        self._SlotSamples = 0
+
+    def add(self, timestamp, value):
+        slot_start = timestamp - (timestamp % self.step)
+        if self._SlotStart is not None and slot_start != self._SlotStart:
+            self._close_slot()
+        self._SlotStart = slot_start
+        self._SlotSum += value
+        self._SlotSamples += 1
+
+    def _close_slot(self):
+        if self._SlotSamples == 0:
+            return
+        self._Times[self._Next] = self._SlotStart
+        self._Values[self._Next] = self._SlotSum / self._SlotSamples
+        self._Next = (self._Next + 1) % self.size
+        self._Count = min(self._Count + 1, self.size)
+        self._SlotSum = 0.0
+        self._SlotSamples = 0
+
+    def samples(self):
+        '''
+        Returns a list of (slot start time, average value), oldest first.
+        The slot that is still filling is not included.
+        '''
+        start = (self._Next - self._Count) % self.size
+        return [(self._Times[(start + i) % self.size], self._Values[(start + i) % self.size])
+                for i in range(self._Count)]
+
+
+class PowerHistory(object):
+    '''
+    Helper class that stores one power reading over time
+    and estimates when it will reach emptyLevel.
+    '''
+
+    def __init__(self, emptyLevel, window=900.0, minimumSpan=120.0, resolutions=DEFAULT_RESOLUTIONS):
+        '''
+        emptyLevel: The reading that counts as empty, i.e. 11.6 volts for an SLA battery.
+        window: Seconds, older samples count for less in the estimate, fading by 1/e over this long.
+        minimumSpan: Seconds of samples required before there is an estimate.
+        resolutions: (seconds per slot, number of slots) for each ring.
+        '''
+        self._EmptyLevel = emptyLevel
+        self._Window = float(window)
+        self._MinimumSpan = minimumSpan
+        self.resolutions = tuple(tuple(resolution) for resolution in resolutions)
+        self._Rings = [_Ring(step, size) for step, size in self.resolutions]
+        self.latest = None
+        self.reset_estimate()
+
+    def reset_estimate(self):
+        '''
+        Start the estimate over, i.e. when the charger is plugged in or unplugged,
+        because the old line no longer means anything.
+        The history rings are kept.
+        '''
+        # Weighted sums for least squares, with time measured from the latest sample
+        # so the numbers stay small no matter how long we run.
+        self._LastTime = None
+        self._FirstTime = None
+        self._S0 = 0.0
+        self._St = 0.0
+        self._Sv = 0.0
+        self._Stt = 0.0
+        self._Stv = 0.0
+
+    def add(self, value, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        self.latest = value
+        for ring in self._Rings:
+            ring.add(timestamp, value)
+        if self._LastTime is not None:
+            dt = timestamp - self._LastTime
+            if dt < 0:
+                # The clock went backwards, nothing sensible to do but start over.
+                self.reset_estimate()
+            else:
+                # Fade the old samples, then move time zero to this sample.
+                decay = math.exp(-dt / self._Window)
+                self._S0 *= decay
+                self._St *= decay
+                self._Sv *= decay
+                self._Stt *= decay
+                self._Stv *= decay
+                self._Stt = self._Stt - 2 * dt * self._St + dt * dt * self._S0
+                self._Stv = self._Stv - dt * self._Sv
+                self._St = self._St - dt * self._S0
+        if self._FirstTime is None:
+            self._FirstTime = timestamp
+        self._LastTime = timestamp
+        self._S0 += 1.0
+        self._Sv += value
+
+    def rate(self):
+        '''
+        Returns (fitted level now, change per second),
+        or (None, None) if there is not enough history yet.
+        '''
+        if self._LastTime is None or self._LastTime - self._FirstTime < self._MinimumSpan:
+            return None, None
+        denominator = self._S0 * self._Stt - self._St * self._St
+        if denominator <= 0:
+            return None, None
+        slope = (self._S0 * self._Stv - self._St * self._Sv) / denominator
+        # Time zero is the latest sample, so the intercept is the level now.
+        level = (self._Sv - slope * self._St) / self._S0
+        return level, slope
+
+    def seconds_to_empty(self):
+        '''
+        Returns the estimated seconds until emptyLevel is reached,
+        0 if we are already there, or None if it is not going down or there is not enough history.
+        '''
+        level, slope = self.rate()
+        if level is None or slope >= 0:
+            return None
+        if level <= self._EmptyLevel:
+            return 0.0
+        return (self._EmptyLevel - level) / slope
+
+    def samples(self, resolution=0):
+        '''
+        Returns (time, value) pairs from one of the rings, oldest first.
+        resolution: Index into the resolutions given to __init__, 0 being the finest.
+        '''
+        return self._Rings[resolution].samples()
+
+
+if __name__ == '__main__':
+    # A battery losing 1% every 36 seconds with a little noise, should be 100% to 0% in an hour.
+    import random
+    history = PowerHistory(0, window=600)
+    start = time.time()
+    for second in range(1800):
+        history.add(100 - second / 36.0 + random.uniform(-0.5, 0.5), start + second)
+    print("Level, rate per hour: %.1f, %.1f" % (history.rate()[0], history.rate()[1] * 3600))
+    print("Minutes to empty: %.1f (should be about 30)" % (history.seconds_to_empty() / 60))
+    print("Minute averages: %d" % len(history.samples(1)))
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+import os
+import subprocess
+import sys
+import threading
+import time
+
+'''
+Keeps track of the laptop's AC power and battery state without
+starting a new process every time we want to know.
+
+Backends:
+sysfs - Reads /sys/class/power_supply/*/ directly. This is the cheapest
+        and works without UPower, so it is preferred.
+upower_dbus - Listens for UPower PropertiesChanged signals on D-Bus,
+              so there is no polling at all. Needs python dbus and GLib.
+upower - The old way, running the upower command. Only used if nothing else works.
+
+The sysfs backend can be pointed at any directory laid out like
+/sys/class/power_supply, so it can be tested with a fake tree:
+mkdir -p /tmp/ps/AC /tmp/ps/BAT0
+echo Mains > /tmp/ps/AC/type; echo 1 > /tmp/ps/AC/online
+echo Battery > /tmp/ps/BAT0/type; echo 95 > /tmp/ps/BAT0/capacity
+./PowerSupplyMonitor.py sysfs /tmp/ps
+echo 0 > /tmp/ps/AC/online
+'''
+
+DEFAULT_SYSFS_ROOT = '/sys/class/power_supply'
+UPOWER_AC_DEVICE = '/org/freedesktop/UPower/devices/line_power_AC'
+UPOWER_DISPLAY_DEVICE = '/org/freedesktop/UPower/devices/DisplayDevice'
+BACKENDS = ('sysfs', 'upower_dbus', 'upower')
+
+
+def _PrintChange(acOnline, batteryPercent):
+    print("AC online: " + str(acOnline) + " Battery: " + str(batteryPercent) + "%")
+
+
+def _PrintLog(message):
+    print(message)
+
+
+class PowerSupplyUnavailable(Exception):
+    pass
+
+
+class SysfsPowerSupply(object):
+    '''
+    Reads AC and battery state from the kernel's power_supply class.
+    The attribute files are kept open and re-read from the start on each poll,
+    so a poll is just a few small reads.
+    '''
+
+    def __init__(self, root=DEFAULT_SYSFS_ROOT):
+        self._Root = root
+        self._OnlineFiles = []
+        self._CapacityFile = None
+        if not os.path.isdir(root):
+            raise PowerSupplyUnavailable("No power supply directory at " + root)
+        # Sort so that the "first" battery is always the same one, like upower reports.
+        for supply in sorted(os.listdir(root)):
+            supply_type = self._read_file(os.path.join(root, supply, 'type'))
+            if supply_type in ('Mains', 'USB', 'USB_C', 'UPS'):
+                online_path = os.path.join(root, supply, 'online')
+                if os.path.exists(online_path):
+                    self._OnlineFiles.append(open(online_path, 'r'))
+            elif supply_type == 'Battery' and self._CapacityFile is None:
+                capacity_path = os.path.join(root, supply, 'capacity')
+                if os.path.exists(capacity_path):
+                    self._CapacityFile = open(capacity_path, 'r')
+        if not self._OnlineFiles and self._CapacityFile is None:
+            raise PowerSupplyUnavailable("No AC adapter or battery found in " + root)
+
+    @staticmethod
+    def _read_file(path):
+        try:
+            with open(path, 'r') as f:
+                return f.read().strip()
+        except (IOError, OSError):
+            return None
+
+    @staticmethod
+    def _read_open_file(f):
+        f.seek(0)
+        return f.read().strip()
+
+    def read(self):
+        '''
+        Returns (acOnline, batteryPercent).
+        Either may be None if this computer does not have one.
+        '''
+        ac_online = None
+        for f in self._OnlineFiles:
+            # Any power source being online means we are plugged in.
+            if self._read_open_file(f) == '1':
+                ac_online = True
+                break
+            ac_online = False
+        battery_percent = None
+        if self._CapacityFile is not None:
+            battery_percent = int(self._read_open_file(self._CapacityFile))
+        return ac_online, battery_percent
+
+    def close(self):
+        for f in self._OnlineFiles:
+            f.close()
+        if self._CapacityFile is not None:
+            self._CapacityFile.close()
+
+
+class UpowerCommandPowerSupply(object):
+    '''
+    Runs the upower command to get the state.
+    This is what arlobot_safety always used to do, so it is the last resort.
+    '''
+
+    def __init__(self):
+        try:
+            subprocess.call(['upower', '--version'], stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+        except OSError:
+            raise PowerSupplyUnavailable("upower command not found")
+
+    def read(self):
+        laptopPowerState = subprocess.Popen(['upower', '-d', UPOWER_AC_DEVICE], stdout=subprocess.PIPE,
+                                            stderr=subprocess.STDOUT, close_fds=True)
+        ac_online = None
+        battery_percent = None
+        for line in iter(laptopPowerState.stdout.readline, ""):
+            upowerOutput = line.split()
+            if 'online' in line and len(upowerOutput) > 1:
+                ac_online = upowerOutput[1] == 'yes'
+            # Only grab the FIRST battery percentage!
+            if 'percentage' in line and battery_percent is None and len(upowerOutput) > 1:
+                battery_percent = int(float(upowerOutput[1].rstrip('%')))
+        laptopPowerState.stdout.close()
+        laptopPowerState.wait()
+        return ac_online, battery_percent
+
+    def close(self):
+        pass
+
+
+class UpowerDBusPowerSupply(object):
+    '''
+    Gets the state from UPower over D-Bus, and then waits for PropertiesChanged
+    signals instead of asking again.
+    '''
+
+    def __init__(self, changeHandler):
+        try:
+            import dbus
+            from dbus.mainloop.glib import DBusGMainLoop
+        except ImportError:
+            raise PowerSupplyUnavailable("python dbus is not installed")
+        try:
+            from gi.repository import GLib as MainLoopModule
+        except ImportError:
+            try:
+                import gobject as MainLoopModule
+            except ImportError:
+                raise PowerSupplyUnavailable("GLib is not installed")
+        self._ChangeHandler = changeHandler
+        self._MainLoopModule = MainLoopModule
+        DBusGMainLoop(set_as_default=True)
+        try:
+            self._Bus = dbus.SystemBus()
+            ac_device = self._Bus.get_object('org.freedesktop.UPower', UPOWER_AC_DEVICE)
+            display_device = self._Bus.get_object('org.freedesktop.UPower', UPOWER_DISPLAY_DEVICE)
+            self._AcProperties = dbus.Interface(ac_device, 'org.freedesktop.DBus.Properties')
+            self._DisplayProperties = dbus.Interface(display_device, 'org.freedesktop.DBus.Properties')
+            self._AcOnline = bool(self._AcProperties.Get('org.freedesktop.UPower.Device', 'Online'))
+            self._BatteryPercent = int(self._DisplayProperties.Get('org.freedesktop.UPower.Device', 'Percentage'))
+        except dbus.DBusException as e:
+            raise PowerSupplyUnavailable("UPower is not available on D-Bus: " + str(e))
+        self._AcProperties.connect_to_signal('PropertiesChanged', self._ac_properties_changed)
+        self._DisplayProperties.connect_to_signal('PropertiesChanged', self._display_properties_changed)
+        self._MainLoop = None
+
+    def _ac_properties_changed(self, interface, changed, invalidated):
+        if 'Online' in changed:
+            self._AcOnline = bool(changed['Online'])
+            self._ChangeHandler()
+
+    def _display_properties_changed(self, interface, changed, invalidated):
+        if 'Percentage' in changed:
+            self._BatteryPercent = int(changed['Percentage'])
+            self._ChangeHandler()
+
+    def read(self):
+        return self._AcOnline, self._BatteryPercent
+
+    def run(self):
+        self._MainLoop = self._MainLoopModule.MainLoop()
+        self._MainLoop.run()
+
+    def close(self):
+        if self._MainLoop is not None:
+            self._MainLoop.quit()
+
+
+class PowerSupplyMonitor(object):
+    '''
+    Helper class that calls changeHandler(acOnline, batteryPercent)
+    whenever the AC or battery state changes.
+    The latest values are also available as acOnline and batteryPercent.
+    '''
+
+    def __init__(self, changeHandler=_PrintChange, backend='auto', sysfsRoot=DEFAULT_SYSFS_ROOT,
+                 pollPeriod=0.5, log=_PrintLog):
+        '''
+        backend: 'auto' to use the first of BACKENDS that works, or one of BACKENDS.
+        sysfsRoot: Directory laid out like /sys/class/power_supply
+        pollPeriod: Seconds between reads for the backends that have to poll.
+        '''
+        self._ChangeHandler = changeHandler
+        self._PollPeriod = pollPeriod
+        self._Log = log
+        self._Lock = threading.Lock()
+        self._KeepRunning = False
+        self._Thread = None
+        self.acOnline = None
+        self.batteryPercent = None
+        if backend == 'auto':
+            candidates = BACKENDS
+        elif backend in BACKENDS:
+            candidates = (backend,)
+        else:
+            raise ValueError("Unknown power backend " + str(backend))
+        self._Supply = None
+        for candidate in candidates:
+            try:
+                if candidate == 'sysfs':
+                    self._Supply = SysfsPowerSupply(sysfsRoot)
+                elif candidate == 'upower_dbus':
+                    self._Supply = UpowerDBusPowerSupply(self._check_for_change)
+                else:
+                    self._Supply = UpowerCommandPowerSupply()
+            except PowerSupplyUnavailable as e:
+                self._Log("Power backend " + candidate + " unavailable: " + str(e))
+                continue
+            self.backend = candidate
+            break
+        if self._Supply is None:
+            raise PowerSupplyUnavailable("No power backend available from " + ", ".join(candidates))
+        self._Log("Using " + self.backend + " power backend.")
+        # Have values right away, so nobody has to wait for the first poll.
+        self._check_for_change()
+
+    def Start(self):
+        self._KeepRunning = True
+        if self.backend == 'upower_dbus':
+            self._Thread = threading.Thread(target=self._Supply.run)
+        else:
+            self._Thread = threading.Thread(target=self._Poll)
+        self._Thread.setDaemon(True)
+        self._Thread.start()
+
+    def Stop(self):
+        self._KeepRunning = False
+        self._Supply.close()
+
+    def _Poll(self):
+        while self._KeepRunning:
+            try:
+                self._check_for_change()
+            except (IOError, OSError, ValueError) as e:
+                self._Log("Power supply read error: " + str(e))
+            time.sleep(self._PollPeriod)
+
+    def _check_for_change(self):
+        with self._Lock:
+            ac_online, battery_percent = self._Supply.read()
+            if ac_online == self.acOnline and battery_percent == self.batteryPercent:
+                return
+            self.acOnline = ac_online
+            self.batteryPercent = battery_percent
+        self._ChangeHandler(ac_online, battery_percent)
+
+
+if __name__ == '__main__':
+    # ./PowerSupplyMonitor.py [backend] [sysfs root]
+    backend = 'auto'
+    root = DEFAULT_SYSFS_ROOT
+    if len(sys.argv) > 1:
+        backend = sys.argv[1]
+    if len(sys.argv) > 2:
+        root = sys.argv[2]
+    monitor = PowerSupplyMonitor(backend=backend, sysfsRoot=root)
+    monitor.Start()
+
+    raw_input("Hit <Enter> to end.")
+    monitor.Stop()
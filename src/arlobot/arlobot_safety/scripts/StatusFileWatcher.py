@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+'''
+Keeps an in memory copy of the files in ~/.arlobot/status
+and ~/.arlobot/status/doors, so that checking for STOP or door files
+does not mean listing the directories over and over.
+
+Door files are named <map name>-<door>, so they are also indexed by every
+possible map name prefix, making "is a door on this map closed?" a single lookup.
+
+On Linux inotify tells us about each file as it is created or deleted,
+so changes are seen within milliseconds.
+Anywhere inotify is not available the directories are polled instead.
+
+Try it with:
+./StatusFileWatcher.py ~/.arlobot/status
+touch ~/.arlobot/status/STOP
+'''
+
+# From /usr/include/linux/inotify.h
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+DOOR_DIRECTORY_NAME = 'doors'
+DOOR_INDEX = 1  # Index of the doors directory in StatusFileWatcher._Directories
+
+
+def _PrintChange():
+    print("Status files changed.")
+
+
+def _PrintLog(message):
+    print(message)
+
+
+def _door_map_prefixes(name):
+    '''
+    Every map name that a door file name could belong to.
+    A map name may have dashes in it too, so "my-house-kitchen" gives "my" and "my-house".
+    '''
+    position = name.find('-')
+    while position > 0:
+        yield name[:position]
+        position = name.find('-', position + 1)
+
+
+class _Inotify(object):
+    '''
+    Just enough of inotify through ctypes to watch a couple of directories.
+    '''
+
+    def __init__(self):
+        library = ctypes.util.find_library('c')
+        if library is None:
+            raise OSError("libc not found")
+        self._Libc = ctypes.CDLL(library, use_errno=True)
+        if not hasattr(self._Libc, 'inotify_init1'):
+            raise OSError("inotify is not available")
+        self._Libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._Libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = self._Libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path, mask):
+        if not isinstance(path, bytes):
+            path = path.encode(sys.getfilesystemencoding())
+        wd = self._Libc.inotify_add_watch(self.fd, path, mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed", path)
+        return wd
+
+    def rm_watch(self, wd):
+        self._Libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self):
+        '''
+        Returns a list of (wd, mask, name) for every waiting event.
+        '''
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            if not data:
+                break
+            offset = 0
+            while offset + EVENT_HEADER.size <= len(data):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                if not isinstance(name, str):
+                    name = name.decode(sys.getfilesystemencoding())
+                offset += length
+                events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class StatusFileWatcher(object):
+    '''
+    Helper class that tracks the files in the status directory and its doors directory,
+    and calls changeHandler() whenever either one changes.
+
+    A missing directory is tracked as well,
+    because arlobot_safety treats a missing directory as a reason to stop.
+    '''
+
+    def __init__(self, statusDir, changeHandler=_PrintChange, pollPeriod=0.25, log=_PrintLog):
+        '''
+        statusDir: The status directory, usually ~/.arlobot/status
+        pollPeriod: Seconds between directory listings when inotify is not available,
+        and between checks for missing directories to be created when it is.
+        '''
+        self._Directories = (statusDir, os.path.join(statusDir, DOOR_DIRECTORY_NAME))
+        self._ChangeHandler = changeHandler
+        self._PollPeriod = pollPeriod
+        self._Log = log
+        self._Lock = threading.Lock()
+        self._KeepRunning = False
+        self._Thread = None
+        # For each directory, a set of file names, or None if the directory does not exist.
+        self._Files = [None, None]
+        # Map name prefix: set of door file names with that prefix.
+        self._DoorsByMap = {}
+        self._WatchDescriptors = {}  # wd: index into self._Directories
+        try:
+            self._Inotify = _Inotify()
+            self.method = 'inotify'
+        except (OSError, AttributeError) as e:
+            self._Log("inotify not available, polling status files instead: " + str(e))
+            self._Inotify = None
+            self.method = 'polling'
+        for index in range(len(self._Directories)):
+            self._rescan(index)
+
+    def Start(self):
+        self._KeepRunning = True
+        if self._Inotify is not None:
+            self._Thread = threading.Thread(target=self._Watch)
+        else:
+            self._Thread = threading.Thread(target=self._Poll)
+        self._Thread.setDaemon(True)
+        self._Thread.start()
+
+    def is_alive(self):
+        ''' False if the watcher thread is not running, so the status files are no longer being followed. '''
+        return self._Thread is not None and self._Thread.is_alive()
+
+    def Stop(self):
+        self._KeepRunning = False
+        if self._Thread is not None:
+            self._Thread.join(self._PollPeriod * 2)
+        if self._Inotify is not None:
+            self._Inotify.close()
+
+    def status_files(self):
+        '''
+        Returns a frozenset of the names in the status directory,
+        or None if the directory does not exist.
+        '''
+        with self._Lock:
+            if self._Files[0] is None:
+                return None
+            return frozenset(self._Files[0])
+
+    def door_files(self):
+        '''
+        Returns a frozenset of the names in the doors directory,
+        or None if the directory does not exist.
+        '''
+        with self._Lock:
+            if self._Files[DOOR_INDEX] is None:
+                return None
+            return frozenset(self._Files[DOOR_INDEX])
+
+    def has_status_file(self, name):
+        '''
+        Returns True if the file is in the status directory,
+        or None if the directory does not exist.
+        '''
+        with self._Lock:
+            if self._Files[0] is None:
+                return None
+            return name in self._Files[0]
+
+    def door_count(self, map_name=None):
+        '''
+        Returns the number of door files for map_name, meaning files named map_name-*,
+        or all door files if map_name is None.
+        Returns None if the doors directory does not exist.
+        '''
+        with self._Lock:
+            if self._Files[DOOR_INDEX] is None:
+                return None
+            if map_name is None:
+                return len(self._Files[DOOR_INDEX])
+            return len(self._DoorsByMap.get(map_name, ()))
+
+    def _index_door(self, name):
+        for prefix in _door_map_prefixes(name):
+            self._DoorsByMap.setdefault(prefix, set()).add(name)
+
+    def _unindex_door(self, name):
+        for prefix in _door_map_prefixes(name):
+            doors = self._DoorsByMap.get(prefix)
+            if doors is not None:
+                doors.discard(name)
+                if not doors:
+                    del self._DoorsByMap[prefix]
+
+    def _rescan(self, index):
+        '''
+        List a directory from scratch, and start watching it if we can.
+        Returns True if anything changed.
+        '''
+        directory = self._Directories[index]
+        if self._Inotify is not None and index not in self._WatchDescriptors.values():
+            # Watch before listing, so nothing created in between is missed.
+            try:
+                self._WatchDescriptors[self._Inotify.add_watch(directory, WATCH_MASK)] = index
+            except OSError:
+                pass  # Directory is missing, _Watch will check for it again.
+        try:
+            files = set(os.listdir(directory))
+        except OSError:
+            files = None
+        with self._Lock:
+            changed = files != self._Files[index]
+            self._Files[index] = files
+            if changed and index == DOOR_INDEX:
+                self._DoorsByMap = {}
+                for name in files or ():
+                    self._index_door(name)
+        return changed
+
+    def _update(self, index, add=None, remove=None):
+        with self._Lock:
+            files = self._Files[index]
+            if files is None:
+                return False
+            if add is not None and add not in files:
+                files.add(add)
+                if index == DOOR_INDEX:
+                    self._index_door(add)
+                return True
+            if remove is not None and remove in files:
+                files.discard(remove)
+                if index == DOOR_INDEX:
+                    self._unindex_door(remove)
+                return True
+        return False
+
+    def _handle_events(self, events):
+        changed = False
+        rescan = set()
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, so start over.
+                rescan.update(range(len(self._Directories)))
+                continue
+            index = self._WatchDescriptors.get(wd)
+            if index is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                del self._WatchDescriptors[wd]
+                if not mask & IN_IGNORED:
+                    self._Inotify.rm_watch(wd)
+                rescan.add(index)
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                changed = self._update(index, add=name) or changed
+                if index == 0 and name == DOOR_DIRECTORY_NAME and mask & IN_ISDIR:
+                    rescan.add(DOOR_INDEX)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                changed = self._update(index, remove=name) or changed
+                if index == 0 and name == DOOR_DIRECTORY_NAME and mask & IN_ISDIR:
+                    rescan.add(DOOR_INDEX)
+        for index in rescan:
+            changed = self._rescan(index) or changed
+        return changed
+
+    def _rescan_all(self):
+        changed = False
+        for index in range(len(self._Directories)):
+            changed = self._rescan(index) or changed
+        return changed
+
+    def _notify(self):
+        # Nothing may end the thread, or a new STOP file would never be seen.
+        try:
+            self._ChangeHandler()
+        except Exception as e:
+            self._Log("Status file change handler failed: " + str(e))
+
+    def _watch_once(self):
+        ready, _, _ = select.select([self._Inotify.fd], [], [], self._PollPeriod)
+        changed = False
+        if ready:
+            changed = self._handle_events(self._Inotify.read_events())
+        # A directory that does not exist cannot be watched,
+        # so keep looking for it to be created.
+        for index in range(len(self._Directories)):
+            if index not in self._WatchDescriptors.values():
+                changed = self._rescan(index) or changed
+        return changed
+
+    def _Watch(self):
+        while self._KeepRunning:
+            try:
+                changed = self._watch_once()
+            except Exception as e:
+                if not self._KeepRunning:
+                    break
+                # Events may have been lost, so list both directories again, like _Poll does.
+                self._Log("Watching status files failed, listing them again: " + str(e))
+                time.sleep(self._PollPeriod)
+                try:
+                    changed = self._rescan_all()
+                except Exception as e:
+                    self._Log("Listing status files failed: " + str(e))
+                    continue
+            if changed:
+                self._notify()
+
+    def _Poll(self):
+        while self._KeepRunning:
+            try:
+                changed = self._rescan_all()
+            except Exception as e:
+                self._Log("Listing status files failed: " + str(e))
+                changed = False
+            if changed:
+                self._notify()
+            time.sleep(self._PollPeriod)
+
+
+if __name__ == '__main__':
+    def _print_files():
+        print("Status: " + str(watcher.status_files()) + " Doors: " + str(watcher.door_files()))
+
+    status_dir = os.path.expanduser("~/.arlobot/status")
+    if len(sys.argv) > 1:
+        status_dir = sys.argv[1]
+    watcher = StatusFileWatcher(status_dir, _print_files)
+    print("Watching " + status_dir + " using " + watcher.method)
+    _print_files()
+    watcher.Start()
+
+    raw_input("Hit <Enter> to end.")
+    watcher.Stop()
@@ -1,11 +1,15 @@
 #!/usr/bin/env python
 import rospy
-import subprocess
 import os
-import fnmatch
+import threading
+import time
+import collections
 from std_msgs.msg import Bool
-from arlobot_msgs.msg import arloSafety
-from arlobot_msgs.srv import UnPlug
+from arlobot_msgs.msg import arloSafety, arloStatus, arloPowerEstimate
+from arlobot_msgs.srv import UnPlug, GetPowerHistory, GetPowerHistoryResponse
+from PowerSupplyMonitor import PowerSupplyMonitor, PowerSupplyUnavailable, DEFAULT_SYSFS_ROOT
+from StatusFileWatcher import StatusFileWatcher
+from PowerHistory import PowerHistory
 
 '''
 This node will monitor various items and let ROS know if it is safe
@@ -22,7 +26,21 @@ class ArlobotSafety(object):
     def __init__(self):
         rospy.init_node('arlobot_safety')
         # http://wiki.ros.org/rospy_tutorials/Tutorials/WritingPublisherSubscriber
-        self.r = rospy.Rate(1) # 1hz refresh rate
+        self.r = rospy.Rate(1) # 1hz refresh rate, changes are published as soon as they happen
+        # Safety status is evaluated by Run and by the file and power callbacks, one at a time.
+        self._EvaluateLock = threading.Lock()
+        # safetyStatus is only published when it changes, or every heartbeatPeriod seconds.
+        self._heartbeatPeriod = rospy.get_param('~heartbeatPeriod', 5.0)
+        self._lastSafetyState = None
+        self._lastPublishTime = 0
+        # Time from an input event to safetyStatus being published, in seconds.
+        self._publishLatencies = collections.deque(maxlen=100)
+        self._maxPublishLatency = 0.0
+        self._lastLatencyReportTime = 0
+        # Read in Run instead of on every event, because it is a parameter server round trip.
+        self._checkAC = self._read_check_ac()
+        # Kept up to date by _check_map_name.
+        self._mapName = rospy.get_param_cached("/arlobot/mapname", "empty")
 
         # Global variable for whether we've been asked to unplug or not
         self._unPlug = False
@@ -30,17 +48,67 @@ class ArlobotSafety(object):
         # Track battery
         self._laptopBatteryPercent = 100
 
+        # Keep a fixed size history of the laptop and robot batteries to estimate how long they will last.
+        power_estimate_window = rospy.get_param('~powerEstimateWindow', 900.0)
+        self._LaptopBatteryHistory = PowerHistory(rospy.get_param('~laptopEmptyPercent', 5.0), power_estimate_window)
+        # 11.6 volts is the cutoff for an SLA battery.
+        self._RobotBatteryHistory = PowerHistory(rospy.get_param('~robotBatteryEmptyVolts', 11.6), power_estimate_window)
+        self._PowerHistoryLock = threading.Lock()
+        self._powerEstimatePeriod = rospy.get_param('~powerEstimatePeriod', 30.0)
+        self._lastPowerEstimateTime = 0
+        self._powerEstimatePublisher = rospy.Publisher('~powerEstimate', arloPowerEstimate, queue_size=1, latch=True)
+        # Robot battery voltage comes from the Propeller board by way of propellerbot_node.
+        rospy.Subscriber('arlo_status', arloStatus, self._handle_arlo_status)
+
         # I am going to set the AC power status as a parameter, so that it can be checked by low priority nodes,
         # and publish the "arloSafety" as a topic so that it can be subscribed to and acted upon immediately
         self.acPower = True # Status of whether laptop is plugged in or not. We assume 1, connected, to start with because that is the most restrictive state.
         rospy.set_param('~ACpower', self.acPower) # Publish initial state
+        # The parameter is updated from Run, a parameter server round trip should not hold up publishing.
+        self._acPowerParam = self.acPower
+
+        # Latched, so that subscribers get the current status as soon as they connect.
+        self._safetyStatusPublisher = rospy.Publisher('~safetyStatus', arloSafety, queue_size=1, latch=True) # for publishing status of AC adapter
+
+        # The status file and power callbacks both call _evaluate_and_publish,
+        # so neither is started until everything it reads is set.
+        self._PowerSupply = None
 
-        self._safetyStatusPublisher = rospy.Publisher('~safetyStatus', arloSafety, queue_size=1) # for publishing status of AC adapter
+        # STOP and door files are tracked by watching ~/.arlobot/status
+        # instead of listing the directories every time.
+        self._StatusFiles = StatusFileWatcher(os.path.expanduser("~/.arlobot/status"),
+                                              self._handle_status_file_change,
+                                              rospy.get_param('~statusPollPeriod', 0.25),
+                                              rospy.loginfo)
+        rospy.loginfo("Watching status files using " + self._StatusFiles.method)
+
+        # Power state is read directly from sysfs or UPower instead of running upower every time.
+        try:
+            self._PowerSupply = PowerSupplyMonitor(self._handle_power_change,
+                                                   rospy.get_param('~powerBackend', 'auto'),
+                                                   rospy.get_param('~powerSupplyPath', DEFAULT_SYSFS_ROOT),
+                                                   rospy.get_param('~powerPollPeriod', 0.5),
+                                                   rospy.loginfo)
+            self._PowerSupply.Start()
+        except PowerSupplyUnavailable as e:
+            # Without a power source we will assume we are plugged in, which keeps the robot still.
+            rospy.logerr("Cannot monitor AC power: " + str(e))
+            self._PowerSupply = None
+        self._StatusFiles.Start()
 
         unplugger = rospy.Service('arlobot_unplug', UnPlug, self._handle_unplug_request)
+        # get_param_cached subscribes to changes of the map name, so checking it often costs no round trips,
+        # and the doors for a new map are checked right away.
+        rospy.Timer(rospy.Duration(rospy.get_param('~mapNameCheckPeriod', 0.1)), self._check_map_name)
+        # The averaged history behind the estimates, i.e. for graphing on a web page:
+        # rosservice call /arlobot_safety/get_power_history robot 1
+        rospy.Service('~get_power_history', GetPowerHistory, self._handle_power_history_request)
 
     def Stop(self):
         rospy.loginfo("ArlobotSafety id is shutting down.")
+        self._StatusFiles.Stop()
+        if self._PowerSupply is not None:
+            self._PowerSupply.Stop()
         # Delete plugged in status, since it is no longer a valid parameter without anyone to monitor it
         if rospy.has_param('~ACpower'):
             rospy.delete_param('~ACpower')
@@ -48,45 +116,64 @@ class ArlobotSafety(object):
     def Run(self):
         while not rospy.is_shutdown():
             #rospy.loginfo("Looping . . .")
+            self._checkAC = self._read_check_ac()
+            if not self._StatusFiles.is_alive():
+                # Until it is running again the robot is stopped, see _evaluate_and_publish.
+                rospy.logerr("Status file watcher stopped, restarting it.")
+                self._StatusFiles.Start()
+            # Publishes if monitorACconnection changed, or if the heartbeat is due.
+            self._evaluate_and_publish()
+            acPower = self.acPower
+            if not acPower == self._acPowerParam:
+                rospy.set_param('~ACpower', acPower)
+                self._acPowerParam = acPower
+            if time.time() - self._lastLatencyReportTime >= self._heartbeatPeriod:
+                self._report_publish_latency()
+            if self._PowerSupply is not None and self._PowerSupply.batteryPercent is not None:
+                with self._PowerHistoryLock:
+                    self._LaptopBatteryHistory.add(self._PowerSupply.batteryPercent)
+            if time.time() - self._lastPowerEstimateTime >= self._powerEstimatePeriod:
+                self._publish_power_estimate()
+            self.r.sleep() # Sleep long enough to maintain the rate set in __init__
 
-            # Check computer's AC power status and set it as a ROS parameter
-            if rospy.has_param('/arlobot/monitorACconnection'): # If arlobot_bringup is running
-                checkAC = rospy.get_param('/arlobot/monitorACconnection') # Use parameter from arlobot_bringup to decide if we should monitor AC or not
-            else:
-                checkAC = True # Otherwise monitor it if arlobot_bringup isn't running
+    def _read_check_ac(self):
+        # Check computer's AC power status and set it as a ROS parameter
+        if rospy.has_param('/arlobot/monitorACconnection'): # If arlobot_bringup is running
+            return rospy.get_param('/arlobot/monitorACconnection') # Use parameter from arlobot_bringup to decide if we should monitor AC or not
+        else:
+            return True # Otherwise monitor it if arlobot_bringup isn't running
+
+    def _evaluate_and_publish(self, reason=None, eventTime=None):
+        """
+        Work out if it is safe to go, and publish it if anything changed or the heartbeat is due.
+        reason: What changed, for the log. None for the regular Run loop.
+        eventTime: When the input event happened, to measure how long it took to publish.
+        """
+        with self._EvaluateLock:
+            checkAC = self._checkAC
 
             if checkAC: # Unless we were told not to
-                #upower -i /org/freedesktop/UPower/devices/line_power_AC
-                laptopPowerState = subprocess.Popen(['upower', '-d', '/org/freedesktop/UPower/devices/line_power_AC'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, close_fds=True)
-                # Only grab the FIRST battery percentage!
-                gotBatteryPercent = False
-                for line in iter(laptopPowerState.stdout.readline, ""):
-                    #rospy.loginfo(line) # for Debugging
-                    if 'online' in line:
-                        #rospy.loginfo(line) # Just so we know it is working (for debugging)
-                        upowerOutput = line.split()
-                        #print upowerOutput[1]
-                        if upowerOutput[1] == 'no':
-                            if self.acPower: # Only log and set parameters if there is a change!
-                                rospy.loginfo("AC Power DISconnected.")
-                                self.acPower = False
-                                rospy.set_param('~ACpower', self.acPower)
-                        elif upowerOutput[1] == 'yes':
-                            if self.acPower is False: # Only log and set parameters if there is a change!
-                                rospy.loginfo("AC Power Connected.")
-                                self.acPower = True
-                                rospy.set_param('~ACpower', self.acPower)
-                    if 'percentage' in line and not gotBatteryPercent:
-                        upowerOutput = line.split()
-                        #rospy.loginfo(upowerOutput[1].rstrip('%'))
-                        self._laptopBatteryPercent = int(upowerOutput[1].rstrip('%'))
-                        gotBatteryPercent = True
-                laptopPowerState.stdout.close()
-                laptopPowerState.wait()
+                if self._PowerSupply is not None:
+                    acOnline = self._PowerSupply.acOnline
+                    batteryPercent = self._PowerSupply.batteryPercent
+                else:
+                    acOnline = None
+                    batteryPercent = None
+                # None means the power source does not know, so keep what we had.
+                if acOnline is False:
+                    if self.acPower: # Only log if there is a change!
+                        rospy.loginfo("AC Power DISconnected.")
+                        self.acPower = False
+                        self._reset_power_estimates()
+                elif acOnline is True:
+                    if self.acPower is False: # Only log if there is a change!
+                        rospy.loginfo("AC Power Connected.")
+                        self.acPower = True
+                        self._reset_power_estimates()
+                if batteryPercent is not None:
+                    self._laptopBatteryPercent = batteryPercent
             else: # Just set to 0 if we were told to ignore AC power status.
-                if self.acPower: # Only log and set parameters if there is a change!
-                    self.acPower = False
-                    rospy.set_param('~ACpower', self.acPower)
+                self.acPower = False
 
             # arloSafty Status message
             safety_status = arloSafety()
@@ -123,12 +210,9 @@ class ArlobotSafety(object):
             # This allows any program anywhere to put a file named
             # STOP into ~/.arlobot/status and stop the robot.
             # This folder should exist, otherwise we are going to stop!
-            status_dir = os.path.expanduser("~/.arlobot/status")
-            if os.path.isdir(status_dir):
-                for file in os.listdir(status_dir):
-                    if fnmatch.fnmatch(file, 'STOP'):
-                        safety_status.safeToGo = False
-            else:
+            # has_status_file returns None if the folder does not exist.
+            # If the watcher is not running we cannot know, so that is a STOP too.
+            if not self._StatusFiles.is_alive() or self._StatusFiles.has_status_file('STOP') is not False:
                 safety_status.safeToGo = False
 
             # This checks for files left by the door checking system.
@@ -136,29 +220,119 @@ class ArlobotSafety(object):
             # ANY file will stop the robot.
             # The web server has a button to delete all files in the
             # ~/.arlobot/status/doors folder.
-            door_dir = os.path.expanduser("~/.arlobot/status/doors")
-            # This folder should exist, otherwise we are going to stop!
-            if os.path.isdir(door_dir):
-                map_name = rospy.get_param("/arlobot/mapname", "empty")
-                # If we do not know the name of a map
-                if map_name == 'empty':
-                    for file in os.listdir(door_dir):
-                        # Then ANY file in this folder will stop the robot
-                        if fnmatch.fnmatch(file, '*'):
-                            safety_status.safeToGo = False
-                else:
-                    for file in os.listdir(door_dir):
-                        # If we know the map name, only look for files with
-                        # the map_name as a prefix so that other doors
-                        # do not stop us.
-                        if fnmatch.fnmatch(file, map_name+'-*'):
-                            safety_status.safeToGo = False
+            # The door files are indexed by map name, so this is just a lookup
+            # no matter how many door files there are.
+            map_name = self._mapName
+            # If we do not know the name of a map
+            if map_name == 'empty':
+                # Then ANY file in this folder will stop the robot
+                door_count = self._StatusFiles.door_count()
             else:
+                # If we know the map name, only look for files with
+                # the map_name as a prefix so that other doors
+                # do not stop us.
+                door_count = self._StatusFiles.door_count(map_name)
+            # This folder should exist, otherwise we are going to stop!
+            # door_count is None if it does not.
+            if door_count is None or door_count > 0:
                 safety_status.safeToGo = False
 
+            safety_state = (safety_status.safeToGo, safety_status.safeToOperate, safety_status.unPlugging,
+                            safety_status.acPower, safety_status.laptopBatteryPercent)
+            now = time.time()
+            changed = safety_state != self._lastSafetyState
+            if not changed and now - self._lastPublishTime < self._heartbeatPeriod:
+                return
             self._safetyStatusPublisher.publish(safety_status) # Publish safety status
+            self._lastSafetyState = safety_state
+            self._lastPublishTime = now
+            if changed and eventTime is not None:
+                latency = time.time() - eventTime
+                self._publishLatencies.append(latency)
+                if latency > self._maxPublishLatency:
+                    self._maxPublishLatency = latency
+                rospy.loginfo("Safety status changed by %s, safeToGo: %s, published in %.1f ms"
+                              % (reason, safety_status.safeToGo, latency * 1000))
 
-            self.r.sleep() # Sleep long enough to maintain the rate set in __init__
+    def _report_publish_latency(self):
+        """
+        Save the event to publish latency to the parameter server:
+        rosparam get /arlobot_safety/publishLatency
+        """
+        self._lastLatencyReportTime = time.time()
+        latencies = list(self._publishLatencies)
+        if not latencies:
+            return
+        rospy.set_param('~publishLatency', {'lastMs': round(latencies[-1] * 1000, 3),
+                                            'averageMs': round(sum(latencies) / len(latencies) * 1000, 3),
+                                            'maxMs': round(self._maxPublishLatency * 1000, 3),
+                                            'count': len(latencies)})
+
+    def _handle_arlo_status(self, status):
+        # Without motor power the Propeller board cannot see the battery, and robotBatteryLevel is just a default.
+        if status.leftMotorPower or status.rightMotorPower:
+            with self._PowerHistoryLock:
+                self._RobotBatteryHistory.add(status.robotBatteryLevel)
+
+    def _reset_power_estimates(self):
+        # Charging or discharging has started, so the old trend no longer applies.
+        with self._PowerHistoryLock:
+            self._LaptopBatteryHistory.reset_estimate()
+            self._RobotBatteryHistory.reset_estimate()
+
+    def _publish_power_estimate(self):
+        self._lastPowerEstimateTime = time.time()
+        estimate = arloPowerEstimate()
+        with self._PowerHistoryLock:
+            estimate.laptopBatteryPercent, estimate.laptopPercentPerHour, estimate.laptopSecondsToEmpty = \
+                self._power_estimate(self._LaptopBatteryHistory)
+            estimate.robotBatteryLevel, estimate.robotVoltsPerHour, estimate.robotSecondsToEmpty = \
+                self._power_estimate(self._RobotBatteryHistory)
+        self._powerEstimatePublisher.publish(estimate)
+
+    @staticmethod
+    def _power_estimate(history):
+        """ Returns (level, change per hour, seconds to empty) with -1 for anything we do not know yet. """
+        level, slope = history.rate()
+        if level is None:
+            # Not enough history for a trend yet, so just report the latest reading.
+            level = history.latest
+            slope = 0.0
+        if level is None:
+            level = -1.0
+        seconds_to_empty = history.seconds_to_empty()
+        if seconds_to_empty is None:
+            seconds_to_empty = -1.0
+        return level, slope * 3600, seconds_to_empty
+
+    def _handle_power_history_request(self, request):
+        response = GetPowerHistoryResponse()
+        histories = {'laptop': self._LaptopBatteryHistory, 'robot': self._RobotBatteryHistory}
+        history = histories.get(request.battery)
+        if history is None or request.resolution >= len(history.resolutions):
+            return response
+        with self._PowerHistoryLock:
+            samples = history.samples(request.resolution)
+        response.found = True
+        response.secondsPerSample = history.resolutions[request.resolution][0]
+        response.times = [sample[0] for sample in samples]
+        response.values = [sample[1] for sample in samples]
+        return response
+
+    def _check_map_name(self, event):
+        map_name = rospy.get_param_cached("/arlobot/mapname", "empty")
+        if not map_name == self._mapName:
+            rospy.loginfo("Map name changed to " + map_name + ", checking doors for the new map.")
+            self._mapName = map_name
+            self._evaluate_and_publish("map name change", time.time())
+
+    def _handle_power_change(self, acOnline, batteryPercent):
+        # Called from the PowerSupplyMonitor thread
+        self._evaluate_and_publish("AC power change", time.time())
+
+    def _handle_status_file_change(self):
+        # Called from the StatusFileWatcher thread
+        self._evaluate_and_publish("status file change", time.time())
 
     def _handle_unplug_request(self, request):
         if request:
@@ -166,6 +340,7 @@ class ArlobotSafety(object):
         else:
             rospy.loginfo("Unplug cancel requested.")
         self._unPlug = request.unPlug
+        self._evaluate_and_publish("unplug request", time.time())
         return True
 
 if __name__ == '__main__':
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+import os
+import random
+import threading
+import time
+
+'''
+Device backends for the SainSmart USB relay board.
+
+"ftdi" is the real board through pylibftdi.
+"simulated" is an 8 relay board in memory, so the relay code can be run and timed without one.
+
+Both give the same small interface:
+backend.list_devices() returns a list of (vendor, product, serial number)
+backend.open(serialNumber) returns a device with a read/write "port" byte and close()
+backend.errors is the tuple of exceptions a device can raise
+
+The backend is picked by name, or from the ARLOBOT_RELAY_BACKEND environment variable.
+The simulated board is set up with these environment variables:
+ARLOBOT_RELAY_SIM_SERIALS - Comma separated serial numbers, one board each, default SIM00001
+ARLOBOT_RELAY_SIM_LATENCY - Seconds every port read or write takes, default 0.002
+ARLOBOT_RELAY_SIM_FAILURE_RATE - Fraction of port reads and writes that fail, default 0
+
+Try it with:
+ARLOBOT_RELAY_BACKEND=simulated ./FtdiRelayBackend.py
+'''
+
+BACKEND_ENVIRONMENT_VARIABLE = 'ARLOBOT_RELAY_BACKEND'
+DEFAULT_BACKEND = 'ftdi'
+DEFAULT_SIMULATED_SERIALS = ('SIM00001',)
+
+
+class SimulatedRelayError(IOError):
+    pass
+
+
+class FtdiBackend(object):
+    '''
+    The real board. pylibftdi is only imported when this backend is used,
+    so the simulated backend works without it.
+    '''
+    name = 'ftdi'
+
+    def __init__(self):
+        from pylibftdi import BitBangDevice, Driver, FtdiError
+        self._BitBangDevice = BitBangDevice
+        self._Driver = Driver
+        self.errors = (FtdiError, OSError)
+
+    def list_devices(self):
+        devices = []
+        for device in self._Driver().list_devices():
+            devices.append(tuple(x.decode('latin1') for x in device))
+        return devices
+
+    def open(self, serialNumber):
+        return self._BitBangDevice(serialNumber)
+
+
+class _SimulatedBoard(object):
+    def __init__(self):
+        self.port = 0
+        self.lock = threading.Lock()
+        self.reads = 0
+        self.writes = 0
+
+
+class SimulatedDevice(object):
+    '''
+    Stands in for pylibftdi.BitBangDevice.
+    Every device opened with the same serial number shares one board, like the real thing.
+    '''
+
+    def __init__(self, backend, board):
+        self._Backend = backend
+        self._Board = board
+        self.closed = False
+
+    def _access(self):
+        if self.closed:
+            raise SimulatedRelayError("Simulated relay device is closed")
+        if self._Backend.latency > 0:
+            time.sleep(self._Backend.latency)
+        if self._Backend.failureRate > 0 and self._Backend.random.random() < self._Backend.failureRate:
+            raise SimulatedRelayError("Simulated relay board failure")
+
+    @property
+    def port(self):
+        self._access()
+        with self._Board.lock:
+            self._Board.reads += 1
+            return self._Board.port
+
+    @port.setter
+    def port(self, value):
+        self._access()
+        with self._Board.lock:
+            self._Board.writes += 1
+            self._Board.port = value & 0xFF
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SimulatedBackend(object):
+    '''
+    In memory relay boards.
+    serialNumbers: One board is made for each.
+    latency: Seconds every port read or write takes, a real board is a USB round trip.
+    failureRate: Fraction of port reads and writes that raise SimulatedRelayError.
+    '''
+    name = 'simulated'
+    errors = (SimulatedRelayError, OSError)
+
+    def __init__(self, serialNumbers=DEFAULT_SIMULATED_SERIALS, latency=0.002, failureRate=0.0, seed=None):
+        self.latency = latency
+        self.failureRate = failureRate
+        self.random = random.Random(seed)
+        self.boards = dict((serialNumber, _SimulatedBoard()) for serialNumber in serialNumbers)
+
+    def list_devices(self):
+        return [('FTDI', 'Simulated 8 relay board', serialNumber) for serialNumber in sorted(self.boards)]
+
+    def open(self, serialNumber):
+        if serialNumber not in self.boards:
+            raise SimulatedRelayError("No simulated relay board with serial number " + str(serialNumber))
+        return SimulatedDevice(self, self.boards[serialNumber])
+
+
+def _simulated_from_environment():
+    serials = os.environ.get('ARLOBOT_RELAY_SIM_SERIALS', '')
+    serialNumbers = [serial.strip() for serial in serials.split(',') if serial.strip()]
+    return SimulatedBackend(serialNumbers or DEFAULT_SIMULATED_SERIALS,
+                            latency=float(os.environ.get('ARLOBOT_RELAY_SIM_LATENCY', 0.002)),
+                            failureRate=float(os.environ.get('ARLOBOT_RELAY_SIM_FAILURE_RATE', 0)))
+
+
+def get_backend(name=None):
+    '''
+    Returns the backend called name, or the one named by ARLOBOT_RELAY_BACKEND if name is empty.
+    Raises ValueError for a name we do not know,
+    and ImportError if the ftdi backend is picked but pylibftdi is not installed.
+    '''
+    if not name:
+        name = os.environ.get(BACKEND_ENVIRONMENT_VARIABLE, DEFAULT_BACKEND)
+    if name == 'ftdi':
+        return FtdiBackend()
+    if name == 'simulated':
+        return _simulated_from_environment()
+    raise ValueError("Unknown relay backend: " + str(name))
+
+
+if __name__ == '__main__':
+    backend = get_backend()
+    print("Backend: " + backend.name)
+    print("Vendor\t\tProduct\t\t\tSerial")
+    for vendor, product, serial in backend.list_devices():
+        print("%s\t\t%s\t\t%s" % (vendor, product, serial))
+    if backend.name == 'simulated':
+        device = backend.open(backend.list_devices()[0][2])
+        device.port |= 0x22
+        print("Port after turning on relays 2 and 6: %02X" % device.port)
+        device.close()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+'''
+Serializes everything done to a relay board through one worker thread.
+
+Callers add a command and wait for it to be done.
+Commands that pile up while the worker is busy are merged,
+so any number of relay changes cost one read-modify-write of the port,
+and a status read waiting behind them gets the port as it is after the write.
+
+Nothing here knows about ROS, it only calls the two functions it is given:
+readPort() returns the port byte,
+writeRelays(onMask, offMask) turns relays on and off and returns the new port byte.
+'''
+
+
+class RelayCommandTimeout(Exception):
+    pass
+
+
+class _Command(object):
+    def __init__(self, onMask=0, offMask=0, write=True):
+        self.onMask = onMask
+        self.offMask = offMask
+        self.write = write
+        self.done = threading.Event()
+        self.port = None
+        self.error = None
+        # Claimed by the worker, or cancelled by a caller that gave up waiting, whichever comes first.
+        self.claimed = False
+        self.cancelled = False
+
+
+class RelayCommandQueue(object):
+    '''
+    Helper class that owns all access to a relay board.
+    '''
+
+    def __init__(self, readPort, writeRelays):
+        self._ReadPort = readPort
+        self._WriteRelays = writeRelays
+        self._Queue = queue.Queue()
+        self._ClaimLock = threading.Lock()
+        self._KeepRunning = False
+        self._Thread = None
+
+    def Start(self):
+        self._KeepRunning = True
+        self._Thread = threading.Thread(target=self._Work)
+        self._Thread.setDaemon(True)
+        self._Thread.start()
+
+    def Stop(self, timeout=5.0):
+        # Commands already queued are still carried out before the worker ends.
+        self._KeepRunning = False
+        self._Queue.put(None)
+        if self._Thread is not None:
+            self._Thread.join(timeout)
+
+    def read_port(self, timeout=None):
+        '''
+        Returns the port byte, holding the state of every relay.
+        Raises RelayCommandTimeout if it was not done in time, or the error readPort raised.
+        '''
+        return self.wait(self.submit_read(), timeout)
+
+    def set_relays(self, onMask, offMask, timeout=None):
+        '''
+        Turn the relays in onMask on and the relays in offMask off in one write.
+        Returns the port byte after the write.
+        Raises RelayCommandTimeout if it was not done in time, or the error writeRelays raised.
+        A command that times out before the worker gets to it is dropped, never done late.
+        '''
+        return self.wait(self.submit_relays(onMask, offMask), timeout)
+
+    def submit_read(self):
+        '''
+        Like read_port, but returns right away with a command to pass to wait(),
+        so several boards can be read at the same time.
+        '''
+        return self._submit(_Command(write=False))
+
+    def submit_relays(self, onMask, offMask):
+        '''
+        Like set_relays, but returns right away with a command to pass to wait().
+        '''
+        return self._submit(_Command(onMask, offMask & ~onMask))
+
+    def _submit(self, command):
+        if not self._KeepRunning:
+            raise RelayCommandTimeout("Relay command queue is stopped")
+        self._Queue.put(command)
+        return command
+
+    def wait(self, command, timeout=None):
+        '''
+        Wait for a command from submit_read or submit_relays, and return the port byte.
+        Raises the same errors as read_port and set_relays.
+        '''
+        if not command.done.wait(timeout):
+            with self._ClaimLock:
+                if not command.claimed:
+                    command.cancelled = True
+            if command.cancelled:
+                raise RelayCommandTimeout("Relay command not done in %s seconds" % timeout)
+            # The worker already has it, so it is about to finish.
+            command.done.wait()
+        if command.error is not None:
+            raise command.error
+        return command.port
+
+    def _claim(self, command):
+        with self._ClaimLock:
+            if command.cancelled:
+                return False
+            command.claimed = True
+            return True
+
+    def _next_batch(self):
+        '''
+        Wait for a command, then take everything else that is waiting with it.
+        Returns None when it is time to stop.
+        '''
+        batch = []
+        command = self._Queue.get()
+        while True:
+            if command is None:
+                if not batch and not self._KeepRunning:
+                    return None
+                # Stop() was called, finish what is here first.
+                if not self._KeepRunning:
+                    self._Queue.put(None)
+                break
+            if self._claim(command):
+                batch.append(command)
+            try:
+                command = self._Queue.get_nowait()
+            except queue.Empty:
+                break
+        return batch
+
+    def _Work(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            if not batch:
+                continue
+            # Later commands win when they touch the same relay.
+            onMask = 0
+            offMask = 0
+            write = False
+            for command in batch:
+                if command.write:
+                    write = True
+                    onMask = (onMask & ~command.offMask) | command.onMask
+                    offMask = (offMask & ~command.onMask) | command.offMask
+            port = None
+            error = None
+            try:
+                if write:
+                    port = self._WriteRelays(onMask, offMask)
+                else:
+                    port = self._ReadPort()
+            except Exception as e:
+                error = e
+            for command in batch:
+                command.port = port
+                command.error = error
+                command.done.set()
+
+
+if __name__ == '__main__':
+    import time
+
+    state = {'port': 0, 'writes': 0}
+
+    def read_port():
+        return state['port']
+
+    def write_relays(onMask, offMask):
+        time.sleep(0.05)  # About what a USB round trip costs
+        state['port'] = (state['port'] & ~offMask) | onMask
+        state['writes'] += 1
+        return state['port']
+
+    commands = RelayCommandQueue(read_port, write_relays)
+    commands.Start()
+    threads = [threading.Thread(target=commands.set_relays, args=(1 << i, 0, 5.0)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print("Port: %02X after %d writes for 8 relay changes" % (commands.read_port(5.0), state['writes']))
+    commands.Stop()
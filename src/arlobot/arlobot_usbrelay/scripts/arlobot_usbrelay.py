@@ -8,15 +8,18 @@ import rospy
 import tf
 import sys
 import time
+import threading
 
 from std_msgs.msg import String
 from std_msgs.msg import Bool
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
 from arlobot_msgs.msg import usbRelayStatus
 from arlobot_msgs.srv import *
 
-#For USB relay board
-from pylibftdi import BitBangDevice
-from pylibftdi import Driver # Required to get serial number of unknown USB Relay device.
+#For USB relay board, pylibftdi or a simulated board, see FtdiRelayBackend.py
+import FtdiRelayBackend
+
+from RelayCommandQueue import RelayCommandQueue, RelayCommandTimeout
 
 # From:
 # ----------------------------------------------------------------------------
@@ -78,22 +81,21 @@ def testBit(int_type, offset):
 # Routine modified from the original pylibftdi example by Ben Bass
 # ----------------------------------------------------------------------------
 
-def list_devices():
+def list_devices(backend):
     print "Vendor\t\tProduct\t\t\tSerial"
     dev_list = []
-    for device in Driver().list_devices():
-        device = map(lambda x: x.decode('latin1'), device)
+    for device in backend.list_devices():
         vendor, product, serial = device
         print "%s\t\t%s\t\t%s" % (vendor, product, serial)
 
-def return_device_serial_number():
+def return_device_serial_numbers(backend):
     #print "Vendor\t\tProduct\t\t\tSerial"
     dev_list = []
-    for device in Driver().list_devices():
-        device = map(lambda x: x.decode('latin1'), device)
+    for device in backend.list_devices():
         vendor, product, serial = device
         #print "%s\t\t%s\t\t%s" % (vendor, product, serial)
-    return serial
+        dev_list.append(serial)
+    return dev_list
 
 # For SainSmart 8 port USB model http://www.sainsmart.com/sainsmart-4-channel-12-v-usb-relay-board-module-controller-for-automation-robotics-1.html
 def get_relay_state( data, relay ):
@@ -114,6 +116,105 @@ def get_relay_state( data, relay ):
     if relay == "8":
         return testBit(data, 7)
 
+RELAYS_PER_BOARD = 8
+# Tries at turning the relays off when shutting down before giving up on a board.
+STOP_ATTEMPTS = 3
+
+class RelayBoard(object):
+    '''
+    One USB Relay board, with its own worker thread,
+    so a busy or failing board does not hold up relays on the others.
+    The board is kept open while the node runs, and the FTDI driver only lets one program open it,
+    so drcontrol.py cannot reach the board until this node has stopped.
+    '''
+
+    def __init__(self, backend, serialNumber):
+        self.serialNumber = serialNumber
+        self._Backend = backend
+        self.errors = backend.errors
+        # One BitBangDevice is kept open for the life of the node,
+        # opening it is a full USB open/close every time.
+        self._Device = None
+        # All access to the board goes through the worker, which merges waiting relay changes into one write.
+        self.commands = RelayCommandQueue(self._read_port, self._write_relays)
+        self.lastPort = None # Last port byte read, so a failed read does not blank this board's relays.
+        self.reset_poll_stats()
+
+    def Start(self):
+        self.commands.Start()
+
+    def Stop(self):
+        # Let the worker finish what it has, after that nothing else touches the board and we can plow ahead:
+        self.commands.Stop()
+        allRelays = int(relay_data.address["all"], 16)
+        port = allRelays
+        attempts = 0
+        while not (port & allRelays) == 0: # Loop if they don't shut off.
+            if attempts == STOP_ATTEMPTS:
+                rospy.logerr("USB Relay " + str(self.serialNumber) + " relays did not turn off, port is " + str(port))
+                break
+            attempts += 1
+            try:
+                port = self._write_relays(0, allRelays)
+            except self.errors:
+                port = allRelays
+                time.sleep(0.1)
+        self._close_device()
+
+    def reset_poll_stats(self):
+        # Poll cost since the last diagnostics report
+        self.pollCount = 0
+        self.pollErrors = 0
+        self.pollSeconds = 0.0
+        self.pollMaxSeconds = 0.0
+
+    def _record_poll(self, seconds):
+        self.pollCount += 1
+        self.pollSeconds += seconds
+        if seconds > self.pollMaxSeconds:
+            self.pollMaxSeconds = seconds
+
+    def _open_device(self):
+        if self._Device is None:
+            self._Device = self._Backend.open(self.serialNumber)
+        return self._Device
+
+    def _close_device(self):
+        if self._Device is not None:
+            try:
+                self._Device.close()
+            except self.errors:
+                pass
+            self._Device = None
+
+    def _device_operation(self, operation):
+        """
+        Run operation(device) on the open device.
+        If the USB connection has gone bad, reopen it and try once more.
+        """
+        try:
+            return operation(self._open_device())
+        except self.errors as e:
+            rospy.logwarn("USB Relay " + str(self.serialNumber) + " error, reconnecting: " + str(e))
+            self._close_device()
+        return operation(self._open_device())
+
+    def _read_port(self):
+        # The port byte holds the state of all 8 relays.
+        # Only Run reads the port, so this times the polls.
+        start = time.time()
+        try:
+            return self._device_operation(lambda device: device.port)
+        finally:
+            self._record_poll(time.time() - start)
+
+    def _write_relays(self, onMask, offMask):
+        """ Turn the relays in onMask on and those in offMask off, and return the new port byte. """
+        def write(device):
+            device.port = (device.port & ~offMask) | onMask
+            return device.port
+        return self._device_operation(write)
+
 class UsbRelay(object):
     '''
     Helper class for communicating with a Propeller board over serial port
@@ -122,39 +223,174 @@ class UsbRelay(object):
     def __init__(self):
         rospy.init_node('arlobot_usbrelay')
         # http://wiki.ros.org/rospy_tutorials/Tutorials/WritingPublisherSubscriber
-        self.r = rospy.Rate(0.25) # 1hz refresh rate
-        #self.r = rospy.Rate(1) # 1hz refresh rate
+        # A poll is one port read, so it is cheap enough to notice a relay change right away.
+        self._pollRate = rospy.get_param("~pollRate", 10.0)
+        self.r = rospy.Rate(self._pollRate)
+        # usbRelayStatus is only published when it changes, or every heartbeatPeriod seconds.
+        # The same period is used for the poll cost diagnostics.
+        self._heartbeatPeriod = rospy.get_param("~heartbeatPeriod", 5.0)
 
-        # Prevent overlapping calls to the serial port
-        self._Busy = False
+        # Service calls wait up to commandTimeout seconds for their turn at a board.
+        self._commandTimeout = rospy.get_param("~commandTimeout", 5.0)
+        # The real board through pylibftdi, unless ~deviceBackend or ARLOBOT_RELAY_BACKEND say "simulated".
+        self._Backend = FtdiRelayBackend.get_backend(rospy.get_param("~deviceBackend", ""))
+        self._CommandErrors = self._Backend.errors + (RelayCommandTimeout,)
+        # One RelayBoard per board in use, in the order their relays appear in usbRelayStatus.
+        # A board listed in ~boards that is not attached keeps its place as None,
+        # so the relay numbers of the boards after it do not change.
+        self._Boards = []
+        self._BoardSerialNumbers = []
 
-        # Wait for the arlobot_bringup launch file to initiate the usbRelayInstalled parameter before starting:
-        while not rospy.has_param('/arlobot/usbRelayInstalled') and not rospy.is_shutdown():
-            rospy.loginfo("arlobot_bringup not started yet, waiting . . .")
-            rospy.sleep(1)
+        # Relay labels and enabled flags from usbrelay.yaml, as one tuple so it is swapped atomically:
+        # ({label: [(board index, relay number)]}, [bit mask of enabled relays for each board])
+        # Rebuilt in Run only when the parameters change, instead of asking the master every time.
+        self._RelayParams = None
+        self._RelayIndex = ({}, [])
+        self._relayIndexRefreshPeriod = rospy.get_param("~relayIndexRefreshPeriod", 10.0)
 
-        self.relayExists = rospy.get_param("/arlobot/usbRelayInstalled", False)
-        if self.relayExists:
-            #list_devices()
-            #NOTE: This will return the LAST device, so if you have multiple USB Relay boards this will have to be modified
-            self.relaySerialNumber = return_device_serial_number()
-
-        else:
-            rospy.loginfo("No USB Relay board installed.")
+        # Board discovery happens in the background in _initialize_board,
+        # so that the services below are available right away.
+        # Service calls made before discovery finishes wait for it.
+        self.relayExists = False
+        self._BoardReady = threading.Event()
+        boardThread = threading.Thread(target=self._initialize_board)
+        boardThread.setDaemon(True)
+        boardThread.start()
 
         # Create a service that can be called to toggle any relay by name:
         # http://wiki.ros.org/ROS/Tutorials/CreatingMsgAndSrv
         # http://wiki.ros.org/ROS/Tutorials/WritingServiceClient%28python%29
         relayToggle = rospy.Service('~toggle_relay', ToggleRelay, self._ToggleRelayByName)
         relayFind = rospy.Service('~find_relay', FindRelay, self._FindRelayByName)
+        # Set several relays at once, i.e. both motors, with one write to each board.
+        relaysToggle = rospy.Service('~toggle_relays', ToggleRelays, self._ToggleRelaysByName)
 
         # Publishers
-        self._usbRelayStatusPublisher = rospy.Publisher('~usbRelayStatus', usbRelayStatus, queue_size=1) # for publishing status of USB Relays
+        self._usbRelayStatusPublisher = rospy.Publisher('~usbRelayStatus', usbRelayStatus, queue_size=1, latch=True) # for publishing status of USB Relays
+        self._DiagnosticsPublisher = rospy.Publisher('/diagnostics', DiagnosticArray, queue_size=1)
+
+    def _initialize_board(self):
+        # Wait for the arlobot_bringup launch file to initiate the usbRelayInstalled parameter before starting:
+        waitLogged = False
+        while not rospy.has_param('/arlobot/usbRelayInstalled') and not rospy.is_shutdown():
+            if not waitLogged:
+                rospy.loginfo("arlobot_bringup not started yet, waiting . . .")
+                waitLogged = True
+            rospy.sleep(0.1)
+
+        try:
+            if rospy.get_param("/arlobot/usbRelayInstalled", False):
+                #list_devices(self._Backend)
+                attached = return_device_serial_numbers(self._Backend)
+                configured = rospy.get_param("~boards", {})
+                if configured:
+                    serialNumbers = sorted(str(key) for key in configured)
+                else:
+                    # Without a boards list the relay settings are for one board, the last one found.
+                    serialNumbers = attached[-1:]
+                for serialNumber in serialNumbers:
+                    if serialNumber in attached:
+                        board = RelayBoard(self._Backend, serialNumber)
+                        board.Start()
+                    else:
+                        rospy.logerr("USB Relay board " + serialNumber + " from usbrelay.yaml is not attached.")
+                        board = None
+                    self._Boards.append(board)
+                self._BoardSerialNumbers = serialNumbers
+                if any(self._Boards):
+                    rospy.loginfo("USB Relay boards: " + ", ".join(serialNumbers))
+                    self._refresh_relay_index()
+                    self.relayExists = True
+                else:
+                    rospy.logerr("No USB Relay board found by the " + self._Backend.name + " backend.")
+            else:
+                rospy.loginfo("No USB Relay board installed.")
+        except Exception as e:
+            # A USB error or a backend that cannot be loaded must not leave the services waiting forever.
+            rospy.logerr("USB Relay board discovery failed: " + str(e))
+            for board in self._Boards:
+                if board is not None:
+                    board.commands.Stop()
+            self._Boards = []
+            self._BoardSerialNumbers = []
+            self.relayExists = False
+        finally:
+            self._BoardReady.set()
+
+    def _refresh_relay_index(self):
+        # One round trip to the master gets every parameter for this node.
+        try:
+            params = rospy.get_param("~", {})
+        except (KeyError, rospy.ROSException):
+            return
+        configured = params.get("boards") or {}
+        configured = dict((str(key), value) for key, value in configured.items())
+        relayParams = []
+        for board, serialNumber in zip(self._Boards, self._BoardSerialNumbers):
+            # Each board has its own relay settings under boards/<serial number>,
+            # or without a boards list, the single board uses the top level settings.
+            # A board that is not attached has every relay disabled, so nothing tries to use it.
+            settings = configured.get(serialNumber, params) if configured else params
+            if board is None:
+                settings = {}
+            relayParams.append([(settings.get("relay" + str(i) + "enabled", False),
+                                 settings.get("relay" + str(i) + "label", "No Label")) for i in range(1,9)])
+        if relayParams == self._RelayParams:
+            return
+        labels = {}
+        enabledMasks = []
+        for boardIndex, boardParams in enumerate(relayParams):
+            enabledMask = 0
+            for i in range(1,9):
+                relayEnabled, relayLabel = boardParams[i-1]
+                if relayEnabled: # Do not touch (poll or anything) Relays that are not listed as enabled.
+                    labels.setdefault(relayLabel, []).append((boardIndex, i))
+                    enabledMask |= int(relay_data.address[str(i)], 16)
+            enabledMasks.append(enabledMask)
+        self._RelayIndex = (labels, enabledMasks)
+        self._RelayParams = relayParams
+
+    def _relay_masks(self, label):
+        """ Returns {board index: mask} for every enabled relay with this label. """
+        masks = {}
+        for boardIndex, i in self._RelayIndex[0].get(label, ()):
+            masks[boardIndex] = masks.get(boardIndex, 0) | int(relay_data.address[str(i)], 16)
+        return masks
+
+    def _set_board_relays(self, onMasks, offMasks):
+        """
+        Send the changes to every board at once, so each board's worker does its part in parallel.
+        Returns {board index: port byte after the write}, leaving out boards that failed.
+        """
+        commands = {}
+        for boardIndex in set(onMasks) | set(offMasks):
+            try:
+                commands[boardIndex] = self._Boards[boardIndex].commands.submit_relays(onMasks.get(boardIndex, 0),
+                                                                                        offMasks.get(boardIndex, 0))
+            except RelayCommandTimeout as e:
+                rospy.logerr("USB Relay " + self._Boards[boardIndex].serialNumber + " could not be changed: " + str(e))
+        ports = {}
+        for boardIndex, command in commands.items():
+            board = self._Boards[boardIndex]
+            try:
+                ports[boardIndex] = board.commands.wait(command, self._commandTimeout)
+            except self._CommandErrors as e:
+                rospy.logerr("USB Relay " + board.serialNumber + " could not be changed: " + str(e))
+        return ports
+
+    def _wait_for_board(self):
+        # Returns False if ROS shut down before board discovery finished.
+        while not self._BoardReady.wait(0.5):
+            if rospy.is_shutdown():
+                return False
+        return True
 
     def _FindRelayByName(self, req):
         # This function will return the relay number for a given name based on the usbrelay.yaml loaded parameters
         # In theory any node can do this, but it helps to make this service available, since the topic we publish requires
         # You to know the number of the relay to figure out which array entry is the one you want.
+        # Relays on the second board are numbered 9 to 16, and so on, to match usbRelayStatus.relayOn.
+        self._wait_for_board()
         boardExists = False
         foundRelay = False
         relayNumber = 0
@@ -162,89 +398,195 @@ class UsbRelay(object):
             if self.relayExists: # Do not do this if no relay exists.
                 # Toggle Relay
                 boardExists = True
-                for i in range(1,9): # Walk the relays to find the one with the right name.
-                    relayEnabled = rospy.get_param("~relay" + str(i) + "enabled", False)
-                    if relayEnabled: # Do not touch (poll or anything) Relays that are not listed as enabled.
-                        relayLabel = rospy.get_param("~relay" + str(i) + "label", "No Label")
-                        if relayLabel == req.relay:
-                            foundRelay = True
-                            relayNumber = i
+                relays = self._RelayIndex[0].get(req.relay)
+                if relays:
+                    foundRelay = True
+                    boardIndex, i = relays[-1] # If a label is used twice, the highest numbered relay is found.
+                    relayNumber = boardIndex * RELAYS_PER_BOARD + i
         return(boardExists, foundRelay, relayNumber)
 
     def _ToggleRelayByName(self, req):
+        self._wait_for_board()
         boardExists = False
         foundRelay = False
         toggleSuccess = False
         if self.relayExists: # Do not do this if no relay exists.
             # Toggle Relay
             boardExists = True
-            for i in range(1,9): # Walk the relays to find the one with the right name.
-                relayEnabled = rospy.get_param("~relay" + str(i) + "enabled", False)
-                if relayEnabled: # Do not touch (poll or anything) Relays that are not listed as enabled.
-                    relayLabel = rospy.get_param("~relay" + str(i) + "label", "No Label")
-                    if relayLabel == req.relay:
-                        foundRelay = True
-                        while self._Busy: # Prevent simultaneous polling of serial port by multiple processes within this app due to ROS threading.
-                            rospy.loginfo("BitBangDevice Busy . . .")
-                            rospy.sleep(0.4)
-                        self._Busy = True
-                        rospy.loginfo("Changing relay " + str(self.relaySerialNumber) + " to " + str(req.state))
-                        if req.state:
-                            BitBangDevice(self.relaySerialNumber).port |= int(relay_data.address[str(i)], 16)
-                            #BitBangDevice(relaySerialNumber).port |= int(relay.address[leftMotorRelay], 16)
-                        elif not req.state:
-                            BitBangDevice(self.relaySerialNumber).port &= ~int(relay_data.address[str(i)], 16)
-                        checkState = get_relay_state( BitBangDevice(self.relaySerialNumber).port, str(i) )
-                        self._Busy = False
-                        if checkState == 0:
-                            newState = False
-                        else:
-                            newState = True
-                        if newState == req.state:
-                            toggleSuccess = True
+            masks = self._relay_masks(req.relay)
+            if masks:
+                foundRelay = True
+                rospy.loginfo("Changing relay " + req.relay + " to " + str(req.state))
+                if req.state:
+                    ports = self._set_board_relays(masks, {})
+                else:
+                    ports = self._set_board_relays({}, masks)
+                toggleSuccess = True
+                for boardIndex, mask in masks.items():
+                    port = ports.get(boardIndex)
+                    if port is None:
+                        toggleSuccess = False
+                    elif req.state and (port & mask) != mask:
+                        toggleSuccess = False
+                    elif not req.state and (port & mask) != 0:
+                        toggleSuccess = False
         return(boardExists, foundRelay, toggleSuccess)
 
+    def _ToggleRelaysByName(self, req):
+        # Like _ToggleRelayByName, but for a list of labels and states,
+        # all of which are set in the same write to each board so they change together.
+        self._wait_for_board()
+        boardExists = False
+        allFound = False
+        toggleSuccess = False
+        relayOn = [False] * len(req.relays)
+        if len(req.states) != len(req.relays):
+            rospy.logerr("toggle_relays needs one state for each relay.")
+            return(boardExists, allFound, toggleSuccess, relayOn)
+        if self.relayExists: # Do not do this if no relay exists.
+            boardExists = True
+            relayMasks = []
+            onMasks = {}
+            offMasks = {}
+            allFound = True
+            for relay, state in zip(req.relays, req.states):
+                masks = self._relay_masks(relay)
+                if not masks:
+                    allFound = False
+                for boardIndex, mask in masks.items():
+                    if state:
+                        onMasks[boardIndex] = onMasks.get(boardIndex, 0) | mask
+                        offMasks[boardIndex] = offMasks.get(boardIndex, 0) & ~mask
+                    else:
+                        offMasks[boardIndex] = offMasks.get(boardIndex, 0) | mask
+                        onMasks[boardIndex] = onMasks.get(boardIndex, 0) & ~mask
+                relayMasks.append(masks)
+            if onMasks or offMasks:
+                rospy.loginfo("Changing relays " + str(req.relays) + " to " + str(req.states))
+                ports = self._set_board_relays(onMasks, offMasks)
+                toggleSuccess = allFound
+                for index, masks in enumerate(relayMasks):
+                    relayOn[index] = bool(masks)
+                    for boardIndex, mask in masks.items():
+                        port = ports.get(boardIndex)
+                        if port is None:
+                            toggleSuccess = False
+                            relayOn[index] = False
+                        elif (port & mask) != mask:
+                            relayOn[index] = False
+                    if masks and relayOn[index] != req.states[index]:
+                        toggleSuccess = False
+        return(boardExists, allFound, toggleSuccess, relayOn)
+
     def Run(self):
         # Get and broadcast status of all USB Relays.
+        if not self._wait_for_board():
+            return
+        lastIndexRefresh = time.time()
+        lastState = None
+        lastPublishTime = 0
+        lastReportTime = time.time()
+        serialNumbers = self._BoardSerialNumbers
         while not rospy.is_shutdown():
+            now = time.time()
+            if now - lastIndexRefresh >= self._relayIndexRefreshPeriod:
+                self._refresh_relay_index()
+                lastIndexRefresh = now
+            if now - lastReportTime >= self._heartbeatPeriod:
+                self._publish_diagnostics(now - lastReportTime)
+                lastReportTime = now
             relaystatus = usbRelayStatus()
-            relaystatus.relayOn = [False] * 8 # Fill array for use.
+            relaystatus.relayOn = [False] * (RELAYS_PER_BOARD * len(self._Boards)) # Fill array for use.
+            relaystatus.boardSerialNumbers = serialNumbers
             if self.relayExists: # Only poll if the relay exists.
                 relaystatus.relayPresent = True
-                # Gather USB Relay status for each relay and publish
-                for i in range(1,9):
-                    if not rospy.is_shutdown(): # ROS tends to get shut down while this is looping and throw a lot of errors
-                        relayEnabled = rospy.get_param("~relay" + str(i) + "enabled", False)
-                        if relayEnabled: # Do not touch (poll or anything) Relays that are not listed as enabled.
-                            relayLabel = rospy.get_param("~relay" + str(i) + "label", "No Label")
-                            while self._Busy: # Prevent simultaneous polling of serial port by multiple processes within this app due to ROS threading.
-                                rospy.loginfo("BitBangDevice Busy . . .")
-                                rospy.sleep(0.2)
-                            self._Busy = True
-                            state = get_relay_state( BitBangDevice(self.relaySerialNumber).port, str(i) )
-                            self._Busy = False
-                            if state == 0:
-                                #print "Relay " + str(i) + " state:\tOFF (" + str(state) + ")"
-                                #print str(i) + " - " + relayLabel + ": OFF"
-                                relaystatus.relayOn[i-1] = False
-                            else:
-                                #print "Relay " + str(i) + " state:\tON (" + str(state) + ")"
-                                #print str(i) + " - " + relayLabel + ": ON"
-                                relaystatus.relayOn[i-1] = True
+                # One read gets all of the relays on a board, which are then picked out with bit masks.
+                # Every board is asked at once, so each is read by its own worker.
+                commands = []
+                for board in self._Boards:
+                    try:
+                        commands.append(None if board is None else board.commands.submit_read())
+                    except RelayCommandTimeout:
+                        commands.append(None)
+                enabledMasks = self._RelayIndex[1]
+                for boardIndex, board in enumerate(self._Boards):
+                    if board is None:
+                        continue # Not attached, its relays stay False.
+                    try:
+                        if commands[boardIndex] is None:
+                            raise RelayCommandTimeout("USB Relay " + board.serialNumber + " is stopped")
+                        port = board.commands.wait(commands[boardIndex], self._commandTimeout)
+                    except self._CommandErrors as e:
+                        # At pollRate this would flood the log, so only say it once per heartbeat.
+                        rospy.logerr_throttle(self._heartbeatPeriod, "USB Relay " + board.serialNumber +
+                                              " status could not be read: " + str(e))
+                        port = None
+                    if port is None:
+                        board.pollErrors += 1
+                        port = board.lastPort # Report what we last knew for this board.
+                        if port is None:
+                            continue
+                    board.lastPort = port
+                    # Gather USB Relay status for each relay and publish
+                    enabledMask = enabledMasks[boardIndex] if boardIndex < len(enabledMasks) else 0
+                    for i in range(1,9):
+                        mask = int(relay_data.address[str(i)], 16)
+                        if enabledMask & mask: # Only report Relays that are listed as enabled.
+                            relaystatus.relayOn[boardIndex * RELAYS_PER_BOARD + i - 1] = (port & mask) != 0
             else: # If the relay does not exist just broadcast "False" to everything.
                 relaystatus.relayPresent = False
-            self._usbRelayStatusPublisher.publish(relaystatus) # Publish USB Relay status
+            state = (relaystatus.relayPresent, tuple(relaystatus.relayOn))
+            if state != lastState or time.time() - lastPublishTime >= self._heartbeatPeriod:
+                self._usbRelayStatusPublisher.publish(relaystatus) # Publish USB Relay status
+                lastState = state
+                lastPublishTime = time.time()
             self.r.sleep() # Sleep long enough to maintain the rate set in __init__
 
+    def _publish_diagnostics(self, elapsed):
+        diagnostics = DiagnosticArray()
+        diagnostics.header.stamp = rospy.Time.now()
+        if not any(self._Boards):
+            status = DiagnosticStatus()
+            status.name = "arlobot: USB Relay"
+            status.level = DiagnosticStatus.OK
+            status.message = "No USB Relay board"
+            diagnostics.status.append(status)
+        for board, serialNumber in zip(self._Boards, self._BoardSerialNumbers):
+            if board is None:
+                status = DiagnosticStatus()
+                status.name = "arlobot: USB Relay " + serialNumber
+                status.hardware_id = serialNumber
+                status.level = DiagnosticStatus.ERROR
+                status.message = "USB Relay board from usbrelay.yaml is not attached"
+                diagnostics.status.append(status)
+                continue
+            status = DiagnosticStatus()
+            status.name = "arlobot: USB Relay " + board.serialNumber
+            status.hardware_id = board.serialNumber
+            status.level = DiagnosticStatus.OK
+            status.message = "OK"
+            if board.pollErrors:
+                status.level = DiagnosticStatus.WARN
+                status.message = "USB Relay status could not be read"
+            status.values.append(KeyValue("polls per second", "%.2f" % (board.pollCount / elapsed)))
+            status.values.append(KeyValue("poll errors", "%d" % board.pollErrors))
+            if board.pollCount:
+                status.values.append(KeyValue("average poll ms", "%.3f" % (board.pollSeconds / board.pollCount * 1000)))
+            status.values.append(KeyValue("max poll ms", "%.3f" % (board.pollMaxSeconds * 1000)))
+            # Fraction of the time spent reading the board, the cost of polling this fast.
+            status.values.append(KeyValue("board busy percent", "%.2f" % (board.pollSeconds / elapsed * 100)))
+            board.reset_poll_stats()
+            diagnostics.status.append(status)
+        self._DiagnosticsPublisher.publish(diagnostics)
+
     def Stop(self):
+        if not self.relayExists:
+            return
         rospy.loginfo("Shutting off all relays . . .")
         # At this point ROS is shutting down, so any attempts to check parameters or log may crash.
-        self._Busy = True # We are shutting down, so make everyone else stall and plow ahead:
-        for i in range(1,9): # Walk the relays
-            state = get_relay_state( BitBangDevice(self.relaySerialNumber).port, str(i) )
-            while not state == 0: # Loop if it doesn't shut off.
-                BitBangDevice(self.relaySerialNumber).port &= ~int(relay_data.address[str(i)], 16)
-                state = get_relay_state( BitBangDevice(self.relaySerialNumber).port, str(i) )
+        for board in self._Boards:
+            if board is not None:
+                board.Stop()
 
 if __name__ == '__main__':
     node = UsbRelay()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+import argparse
+import sys
+import threading
+import time
+
+from FtdiRelayBackend import SimulatedBackend
+from RelayCommandQueue import RelayCommandTimeout
+from arlobot_usbrelay import RelayBoard
+
+'''
+Measures relay toggle latency and throughput against the simulated relay board,
+through the arlobot_usbrelay node's own RelayBoard and its RelayCommandQueue worker,
+so no board or roscore is needed, just a sourced ROS workspace for the node's imports.
+
+sequential - One caller toggles one relay after another
+concurrent - --threads callers toggle their own relays at the same time,
+             which is where merging waiting changes into one write pays off
+
+Usage:
+./relay_benchmark.py --toggles 200 --threads 8 --latency 0.004 --failure-rate 0.01
+
+The exit code is 1 if a --max-p99 limit is given and any scenario is slower than it.
+'''
+
+SCENARIOS = ('sequential', 'concurrent')
+
+
+def percentile(sorted_values, fraction):
+    ''' Nearest rank percentile of an already sorted list. '''
+    if not sorted_values:
+        return float('nan')
+    rank = int(round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[rank]
+
+
+class RelayBenchmark(object):
+    '''
+    One simulated board, driven by the node's RelayBoard.
+    '''
+
+    def __init__(self, args):
+        self._Args = args
+        self._Backend = SimulatedBackend(latency=args.latency, failureRate=args.failure_rate, seed=args.seed)
+        serialNumber = self._Backend.list_devices()[0][2]
+        self._Board = self._Backend.boards[serialNumber]
+        self._RelayBoard = RelayBoard(self._Backend, serialNumber)
+        self._Commands = self._RelayBoard.commands
+
+    def Start(self):
+        self._RelayBoard.Start()
+
+    def Stop(self):
+        # Turns every relay off and closes the device, as the node does when it shuts down.
+        self._RelayBoard.Stop()
+
+    def _toggle(self, relay, state, latencies, failures):
+        mask = 1 << (relay % 8)
+        start = time.time()
+        try:
+            if state:
+                port = self._Commands.set_relays(mask, 0, self._Args.timeout)
+            else:
+                port = self._Commands.set_relays(0, mask, self._Args.timeout)
+        except self._Backend.errors + (RelayCommandTimeout,):
+            failures.append(relay)
+            return
+        latencies.append(time.time() - start)
+        if bool(port & mask) != state:
+            failures.append(relay)
+
+    def _toggle_many(self, relay, count, latencies, failures):
+        for toggle in range(count):
+            self._toggle(relay, toggle % 2 == 0, latencies, failures)
+
+    def run_scenario(self, scenario):
+        '''
+        Returns (latencies, failures, seconds taken, port writes).
+        '''
+        latencies = []
+        failures = []
+        writes = self._Board.writes
+        start = time.time()
+        if scenario == 'sequential':
+            self._toggle_many(0, self._Args.toggles, latencies, failures)
+        else:
+            # Split the toggles between the threads, each on its own relay.
+            per_thread = max(1, self._Args.toggles // self._Args.threads)
+            threads = [threading.Thread(target=self._toggle_many, args=(relay, per_thread, latencies, failures))
+                       for relay in range(self._Args.threads)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return latencies, len(failures), time.time() - start, self._Board.writes - writes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time relay toggles against a simulated USB relay board.")
+    parser.add_argument('--toggles', type=int, default=200, help="Toggles per scenario")
+    parser.add_argument('--threads', type=int, default=8, help="Callers in the concurrent scenario")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help="Seconds each simulated port read or write takes")
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help="Fraction of simulated port reads and writes that fail")
+    parser.add_argument('--timeout', type=float, default=5.0, help="Seconds a toggle may wait for the board")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for failure injection")
+    parser.add_argument('--max-p99', type=float, default=None,
+                        help="Fail if any scenario's 99th percentile is over this many milliseconds")
+    args = parser.parse_args()
+
+    benchmark = RelayBenchmark(args)
+    results = {}
+    benchmark.Start()
+    try:
+        for scenario in args.scenarios:
+            results[scenario] = benchmark.run_scenario(scenario)
+    finally:
+        benchmark.Stop()
+
+    failed = False
+    print("%-10s %7s %8s %8s %8s %10s %8s %7s" % ('scenario', 'toggles', 'p50 ms', 'p99 ms', 'max ms',
+                                               'toggles/s', 'writes', 'failed'))
+    for scenario in args.scenarios:
+        latencies, failures, seconds, writes = results[scenario]
+        toggles = len(latencies) + failures
+        latencies = sorted(latency * 1000 for latency in latencies)
+        p99 = percentile(latencies, 0.99)
+        print("%-10s %7d %8.2f %8.2f %8.2f %10.1f %8d %7d" % (scenario, toggles,
+                                                           percentile(latencies, 0.5), p99,
+                                                           latencies[-1] if latencies else float('nan'),
+                                                           toggles / seconds if seconds > 0 else float('nan'),
+                                                           writes, failures))
+        if args.max_p99 is not None and not p99 <= args.max_p99:
+            failed = True
+    if failed:
+        print("FAILED: a toggle took too long.")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+import math
+import time
+
+import numpy as np
+
+'''
+Cleans up LaserScan ranges with NumPy, for laser_filter.py.
+
+The filter is a chain of stages, set up from a list of dicts like the ~stages parameter of laser_filter.py:
+- {type: range, mode: replace, replacement: 4.9} - Fix ranges outside of range_min to range_max
+- {type: median, window: 3, max_difference: 0.2} - Replace speckles that are far from their neighbours' median
+- {type: shadow, min_angle: 10, max_angle: 170, window: 1} - Remove veiling points along object edges
+- {type: crop, min_angle: -1.57, max_angle: 1.57} - Remove beams outside of these angles, in radians
+- {type: intensity, lower: 0, upper: 10000} - Remove beams with an intensity outside of this range
+Stages run in the order given. Removed beams become NaN, which the costmaps ignore.
+
+The ranges are copied once into a float32 buffer that is kept between scans,
+and every stage works in place on that buffer with work arrays of its own that are also kept,
+so filtering a scan does not allocate anything once the first scan of a size is seen.
+How long each stage takes is kept, so it can be reported.
+
+ScanDecimator can then make the scan smaller and less frequent for the costmaps,
+keeping the nearest range of every few beams and of every few scans, so no obstacle is lost.
+
+There is no ROS in here, so it can be timed with scan_benchmark.py on any machine.
+'''
+
+# What the range stage does with a range outside of range_min to range_max:
+# replace - Use the replacement value, 4.9 by default, a little under the XV11's 5 meter max,
+#           so the costmap clears out to there instead of ignoring the beam.
+# clamp - Move it to range_min or range_max.
+# max - Use range_max.
+OUT_OF_RANGE_MODES = ('replace', 'clamp', 'max')
+
+REMOVED = np.float32('nan')
+
+
+class ScanData(object):
+    '''
+    The parts of a LaserScan the stages use, for running without ROS.
+    A sensor_msgs/LaserScan works anywhere one of these does.
+    '''
+
+    def __init__(self, ranges, angle_min=0.0, angle_increment=math.pi / 180, range_min=0.06, range_max=5.0,
+                 intensities=()):
+        self.ranges = ranges
+        self.angle_min = angle_min
+        self.angle_increment = angle_increment
+        self.range_min = range_min
+        self.range_max = range_max
+        self.intensities = intensities
+
+
+class RangeStage(object):
+    '''
+    Replaces, clamps or maxes out ranges outside of range_min to range_max.
+    NaN ranges are left alone, like the list comprehension laser_filter.py used to have.
+    '''
+    name = 'range'
+
+    def __init__(self, mode='replace', replacement=4.9):
+        if mode not in OUT_OF_RANGE_MODES:
+            raise ValueError("Unknown out of range mode: " + str(mode))
+        self._Mode = mode
+        self._Replacement = np.float32(replacement)
+        self.resize(0)
+
+    def resize(self, size):
+        self._OutOfRange = np.zeros(size, dtype=bool)
+        self._AboveMax = np.zeros(size, dtype=bool)
+
+    def apply(self, ranges, scan):
+        if self._Mode == 'clamp':
+            np.clip(ranges, scan.range_min, scan.range_max, out=ranges)
+            return
+        np.less(ranges, scan.range_min, out=self._OutOfRange)
+        np.greater(ranges, scan.range_max, out=self._AboveMax)
+        np.logical_or(self._OutOfRange, self._AboveMax, out=self._OutOfRange)
+        if self._Mode == 'max':
+            np.copyto(ranges, np.float32(scan.range_max), where=self._OutOfRange)
+        else:
+            np.copyto(ranges, self._Replacement, where=self._OutOfRange)
+
+
+class MedianStage(object):
+    '''
+    Replaces a range with the median of the window around it,
+    if it is more than max_difference meters away from that median.
+    With max_difference 0 it is a plain median filter.
+    A window with a NaN in it has no median, so that range is left alone.
+    '''
+    name = 'median'
+
+    def __init__(self, window=3, max_difference=0.2):
+        if window < 3 or window % 2 == 0:
+            raise ValueError("The median window must be odd and at least 3, not " + str(window))
+        self._Window = window
+        self._MaxDifference = max_difference
+        self.resize(0)
+
+    def resize(self, size):
+        self._Stack = np.zeros((self._Window, size), dtype=np.float32)
+        self._Median = np.zeros(size, dtype=np.float32)
+        self._High = np.zeros(size, dtype=np.float32)
+        self._Difference = np.zeros(size, dtype=np.float32)
+        self._Replace = np.zeros(size, dtype=bool)
+
+    def apply(self, ranges, scan):
+        size = ranges.shape[0]
+        half = self._Window // 2
+        if size <= half:
+            return
+        # Each row is the scan shifted by one beam, with the end beams repeated past the ends.
+        for row in range(self._Window):
+            offset = row - half
+            if offset < 0:
+                self._Stack[row, -offset:] = ranges[:size + offset]
+                self._Stack[row, :-offset] = ranges[0]
+            elif offset > 0:
+                self._Stack[row, :size - offset] = ranges[offset:]
+                self._Stack[row, size - offset:] = ranges[-1]
+            else:
+                self._Stack[row] = ranges
+        if self._Window == 3:
+            # The median of three is min/max arithmetic, which is a lot quicker than np.median.
+            np.maximum(self._Stack[0], self._Stack[1], out=self._High)
+            np.minimum(self._Stack[0], self._Stack[1], out=self._Median)
+            np.minimum(self._High, self._Stack[2], out=self._High)
+            np.maximum(self._Median, self._High, out=self._Median)
+        else:
+            np.median(self._Stack, axis=0, out=self._Median, overwrite_input=True)
+        np.subtract(ranges, self._Median, out=self._Difference)
+        np.absolute(self._Difference, out=self._Difference)
+        np.greater(self._Difference, self._MaxDifference, out=self._Replace)
+        np.copyto(ranges, self._Median, where=self._Replace)
+
+
+class ShadowStage(object):
+    '''
+    Removes veiling points, the false readings the beam makes when it half hits the edge of something,
+    found by the angle between the beam and the line to a neighbouring point.
+    Angles are in degrees, a pair of points up to window beams apart makes a shadow if that angle,
+    at either of them, is under min_angle or over max_angle.
+    Like laser_filters' ScanShadowsFilter only the farther point of the pair is removed,
+    so the edge of the obstacle, or all of a thin one, is kept.
+    '''
+    name = 'shadow'
+
+    def __init__(self, min_angle=10.0, max_angle=170.0, window=1):
+        self._MinAngle = math.radians(min_angle)
+        self._MaxAngle = math.radians(max_angle)
+        self._Window = window
+        self.resize(0)
+
+    def resize(self, size):
+        self._Numerator = np.zeros(size, dtype=np.float32)
+        self._Denominator = np.zeros(size, dtype=np.float32)
+        self._Angle = np.zeros(size, dtype=np.float32)
+        self._Bad = np.zeros(size, dtype=bool)
+        self._Above = np.zeros(size, dtype=bool)
+        self._Remove = np.zeros(size, dtype=bool)
+        self._Pair = np.zeros(size, dtype=bool)
+        self._Farther = np.zeros(size, dtype=bool)
+
+    def _check(self, points, neighbours, sin_step, cos_step, length):
+        # Angle at each point between the beam back to the laser and the line to the neighbour.
+        numerator = self._Numerator[:length]
+        denominator = self._Denominator[:length]
+        angle = self._Angle[:length]
+        bad = self._Bad[:length]
+        above = self._Above[:length]
+        np.multiply(neighbours, sin_step, out=numerator)
+        np.multiply(neighbours, cos_step, out=denominator)
+        np.subtract(points, denominator, out=denominator)
+        np.arctan2(numerator, denominator, out=angle)
+        np.less(angle, self._MinAngle, out=bad)
+        np.greater(angle, self._MaxAngle, out=above)
+        np.logical_or(bad, above, out=bad)
+        return bad
+
+    def apply(self, ranges, scan):
+        size = ranges.shape[0]
+        self._Remove[:] = False
+        for offset in range(1, min(self._Window, size - 1) + 1):
+            step = abs(offset * scan.angle_increment)
+            sin_step = math.sin(step)
+            cos_step = math.cos(step)
+            length = size - offset
+            # Each point against the neighbour after it, then the neighbour against it.
+            pair = self._Pair[:length]
+            np.copyto(pair, self._check(ranges[:length], ranges[offset:], sin_step, cos_step, length))
+            bad = self._check(ranges[offset:], ranges[:length], sin_step, cos_step, length)
+            np.logical_or(pair, bad, out=pair)
+            # Remove whichever of the two is farther away.
+            farther = self._Farther[:length]
+            np.greater(ranges[:length], ranges[offset:], out=farther)
+            np.logical_and(farther, pair, out=farther)
+            np.logical_or(self._Remove[:length], farther, out=self._Remove[:length])
+            np.less(ranges[:length], ranges[offset:], out=farther)
+            np.logical_and(farther, pair, out=farther)
+            np.logical_or(self._Remove[offset:], farther, out=self._Remove[offset:])
+        np.copyto(ranges, REMOVED, where=self._Remove)
+
+
+class CropStage(object):
+    '''
+    Removes beams outside of min_angle to max_angle, in radians, i.e. ones that hit the robot itself.
+    The scan keeps its size, so nothing downstream has to change.
+    '''
+    name = 'crop'
+
+    def __init__(self, min_angle=-math.pi, max_angle=math.pi):
+        self._MinAngle = min_angle
+        self._MaxAngle = max_angle
+        self._Geometry = None
+        self.resize(0)
+
+    def resize(self, size):
+        self._Outside = np.zeros(size, dtype=bool)
+        self._Geometry = None
+
+    def apply(self, ranges, scan):
+        # The beam angles only change if the sensor does, so the mask is worked out once.
+        geometry = (ranges.shape[0], scan.angle_min, scan.angle_increment)
+        if geometry != self._Geometry:
+            angles = scan.angle_min + np.arange(ranges.shape[0]) * scan.angle_increment
+            np.logical_or(angles < self._MinAngle, angles > self._MaxAngle, out=self._Outside)
+            self._Geometry = geometry
+        np.copyto(ranges, REMOVED, where=self._Outside)
+
+
+class IntensityStage(object):
+    '''
+    Removes beams with an intensity under lower or over upper.
+    Scans without intensities are passed through.
+    '''
+    name = 'intensity'
+
+    def __init__(self, lower=0.0, upper=float('inf')):
+        self._Lower = lower
+        self._Upper = upper
+        self.resize(0)
+
+    def resize(self, size):
+        self._Outside = np.zeros(size, dtype=bool)
+        self._Above = np.zeros(size, dtype=bool)
+
+    def apply(self, ranges, scan):
+        if len(scan.intensities) != ranges.shape[0]:
+            return
+        np.less(scan.intensities, self._Lower, out=self._Outside)
+        np.greater(scan.intensities, self._Upper, out=self._Above)
+        np.logical_or(self._Outside, self._Above, out=self._Outside)
+        np.copyto(ranges, REMOVED, where=self._Outside)
+
+
+STAGE_TYPES = dict((stage.name, stage) for stage in (RangeStage, MedianStage, ShadowStage, CropStage, IntensityStage))
+
+DEFAULT_STAGES = [{'type': 'range', 'mode': 'replace', 'replacement': 4.9}]
+
+
+def build_stages(config):
+    '''
+    Make the stages from a list of dicts, each with a type and that stage's settings.
+    Raises ValueError for anything that does not make sense.
+    '''
+    stages = []
+    for stage_config in config:
+        settings = dict(stage_config)
+        stage_type = settings.pop('type', None)
+        if stage_type not in STAGE_TYPES:
+            raise ValueError("Unknown scan filter stage type: " + str(stage_type))
+        try:
+            stages.append(STAGE_TYPES[stage_type](**settings))
+        except TypeError as e:
+            raise ValueError("Bad settings for the " + stage_type + " stage: " + str(e))
+    return stages
+
+
+class ScanFilter(object):
+    '''
+    Helper class that runs the stages on one scan after another.
+    '''
+
+    def __init__(self, stages=None):
+        '''
+        stages: A list of stages, or of dicts for build_stages. Just the range stage if it is not given.
+        '''
+        if stages is None:
+            stages = DEFAULT_STAGES
+        self._Stages = [build_stages([stage])[0] if isinstance(stage, dict) else stage for stage in stages]
+        self._Ranges = np.zeros(0, dtype=np.float32)
+        self.reset_timings()
+
+    def reset_timings(self):
+        self._Count = 0
+        self._Seconds = [0.0] * len(self._Stages)
+        self._MaxSeconds = [0.0] * len(self._Stages)
+
+    def timings(self):
+        '''
+        Returns (stage name, average seconds, max seconds) for each stage
+        over the scans since the timings were last reset, and the number of scans.
+        '''
+        count = max(self._Count, 1)
+        return [(stage.name, self._Seconds[i] / count, self._MaxSeconds[i])
+                for i, stage in enumerate(self._Stages)], self._Count
+
+    def filter(self, scan):
+        '''
+        scan: A LaserScan, ideally from numpy_msg(LaserScan) so the ranges are already a float32 array,
+        or a ScanData.
+        Returns the filtered ranges as a float32 array.
+        The array is reused for the next scan, so publish or copy it before calling filter again.
+        '''
+        size = len(scan.ranges)
+        # Scans from one sensor are all the same size, so this only happens on the first one.
+        if self._Ranges.shape[0] != size:
+            self._Ranges = np.zeros(size, dtype=np.float32)
+            for stage in self._Stages:
+                stage.resize(size)
+        buf = self._Ranges
+        # numpy_msg arrays point into the received message and are read only, so this is the one copy.
+        np.copyto(buf, np.asarray(scan.ranges, dtype=np.float32), casting='same_kind')
+        # NaN is how a removed beam looks, and comparing it is not worth a warning.
+        with np.errstate(invalid='ignore'):
+            for i, stage in enumerate(self._Stages):
+                start = time.time()
+                stage.apply(buf, scan)
+                seconds = time.time() - start
+                self._Seconds[i] += seconds
+                if seconds > self._MaxSeconds[i]:
+                    self._MaxSeconds[i] = seconds
+        self._Count += 1
+        return buf
+
+
+# How ScanDecimator puts together the scans that arrive between publishes:
+# latest - Just the newest one.
+# min - The nearest range each beam saw in any of them, for a robot that is not moving fast.
+MERGE_MODES = ('latest', 'min')
+
+
+class ScanDecimator(object):
+    '''
+    Helper class that thins out filtered scans for consumers that cannot use every beam of every scan,
+    like costmaps updating a few times a second.
+    '''
+
+    def __init__(self, beams=1, rate=0.0, merge='latest'):
+        '''
+        beams: Beams to combine into one, keeping the nearest range. 1 keeps them all.
+        rate: Scans per second to let through at most, 0 lets every scan through.
+        merge: What to do with the scans in between, see MERGE_MODES.
+        '''
+        if beams < 1:
+            raise ValueError("beams must be at least 1, not " + str(beams))
+        if merge not in MERGE_MODES:
+            raise ValueError("Unknown merge mode: " + str(merge))
+        self.beams = int(beams)
+        self._Period = 1.0 / rate if rate > 0 else 0.0
+        self._Merge = merge
+        # True if every scan has to be seen, not just the ones that get published.
+        self.merges = merge == 'min' and self._Period > 0
+        self._LastPublish = None
+        self._Merging = False
+        self._Padded = np.zeros(0, dtype=np.float32)
+        self._Pooled = np.zeros(0, dtype=np.float32)
+        self._Merged = np.zeros(0, dtype=np.float32)
+
+    def pooled_size(self, size):
+        return (size + self.beams - 1) // self.beams
+
+    def _pool(self, ranges):
+        if self.beams == 1:
+            return ranges
+        size = ranges.shape[0]
+        pooled_size = self.pooled_size(size)
+        if self._Pooled.shape[0] != pooled_size:
+            # Padded with NaN so the last group can be short, fmin skips NaN.
+            self._Padded = np.zeros(pooled_size * self.beams, dtype=np.float32)
+            self._Padded[size:] = REMOVED
+            self._Pooled = np.zeros(pooled_size, dtype=np.float32)
+        self._Padded[:size] = ranges
+        np.fmin.reduce(self._Padded.reshape(pooled_size, self.beams), axis=1, out=self._Pooled)
+        return self._Pooled
+
+    def due(self, stamp):
+        '''
+        True if a scan at stamp would be published.
+        When not merging, a scan that is not due does not need to be filtered at all.
+        '''
+        return self._LastPublish is None or not 0 <= stamp - self._LastPublish < self._Period
+
+    def add(self, ranges, stamp):
+        '''
+        ranges: Filtered ranges from ScanFilter.filter.
+        stamp: Seconds, the time of the scan.
+        Returns the ranges to publish, or None if this scan is held back.
+        The array is reused, so publish or copy it before calling add again.
+        '''
+        pooled = self._pool(ranges)
+        if self.merges:
+            if not self._Merging or self._Merged.shape[0] != pooled.shape[0]:
+                if self._Merged.shape[0] != pooled.shape[0]:
+                    self._Merged = np.zeros(pooled.shape[0], dtype=np.float32)
+                np.copyto(self._Merged, pooled)
+                self._Merging = True
+            else:
+                np.fmin(self._Merged, pooled, out=self._Merged)
+            pooled = self._Merged
+        if not self.due(stamp):
+            return None
+        self._LastPublish = stamp
+        self._Merging = False
+        return pooled
+
+
+if __name__ == '__main__':
+    scan_filter = ScanFilter([{'type': 'range'}, {'type': 'median', 'window': 3}, {'type': 'shadow'},
+                              {'type': 'crop', 'min_angle': 0.0, 'max_angle': 0.09}])
+    print(scan_filter.filter(ScanData([0.01, 1.0, float('inf'), float('nan'), 6.0, 2.5, 2.5, 4.0, 2.5, 2.5],
+                                      angle_increment=0.01)))
+    for name, average, longest in scan_filter.timings()[0]:
+        print("%-10s %.1f us" % (name, average * 1e6))
+
+    # The shadow stage must keep the near side of an edge, and a thin obstacle, and only drop the veiling point.
+    shadow_filter = ScanFilter([{'type': 'shadow'}])
+    edge = shadow_filter.filter(ScanData([3.0] * 5 + [1.0] * 5)).tolist()
+    assert np.isnan(edge).sum() == 1 and np.isnan(edge[4]) and edge[5:] == [1.0] * 5, edge
+    thin = [3.0] * 11
+    thin[5] = 1.0
+    thin = shadow_filter.filter(ScanData(thin)).tolist()
+    assert thin[5] == 1.0 and np.isnan(thin[4]) and np.isnan(thin[6]), thin
+    print("Shadow stage keeps edges and thin obstacles")
@@ -1,13 +1,35 @@
 #!/usr/bin/env python
+import numpy as np
 import rospy
+from rospy.numpy_msg import numpy_msg
 from sensor_msgs.msg import LaserScan
-import math
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+
+from ScanFilter import ScanDecimator, ScanFilter
+
+# numpy_msg gives us ranges as a float32 array straight from the message buffer,
+# instead of a tuple of Python floats, and writes arrays back out the same way.
+NumpyLaserScan = numpy_msg(LaserScan)
+NO_INTENSITIES = np.zeros(0, dtype=np.float32)
 
 def callback(data):
+    stamp = data.header.stamp.to_sec() or rospy.get_time() # Some drivers leave the stamp empty.
+    if not decimator.merges and not decimator.due(stamp):
+        return # Would not be published, so do not bother filtering it.
 #Option 1) Conform data to specified input/output ranges
-    #data.ranges  = [data.range_max if range_val>data.range_max else (data.range_min if range_val<data.range_min else range_val) for range_val in data.ranges]
-    #data.ranges  = [data.range_max if range_val>data.range_max else (data.range_max if range_val<data.range_min else range_val) for range_val in data.ranges]
-    data.ranges  = [4.9 if range_val>data.range_max else (4.9 if range_val<data.range_min else range_val) for range_val in data.ranges]
+    # The ~stages list picks what is done to the scan, see ScanFilter.py and param/laser_filter.yaml.
+    # Without it, ranges outside of range_min to range_max are replaced with 4.9, or as ~out_of_range says.
+    ranges = decimator.add(scan_filter.filter(data), stamp)
+    if ranges is None:
+        return
+    if decimator.beams > 1:
+        # Each beam now stands for the group of beams it was pooled from, so it points at the middle of them.
+        data.angle_min += (decimator.beams - 1) * data.angle_increment / 2
+        data.angle_increment *= decimator.beams
+        data.angle_max = data.angle_min + (len(ranges) - 1) * data.angle_increment
+        data.time_increment *= decimator.beams
+        data.intensities = NO_INTENSITIES # They do not go with the pooled ranges.
+    data.ranges = ranges
 #Option 2) Conform input/output ranges to data
     # IF I set the max to a number, then I have to comment these out,
     # Lest the max always be whatever I set it to above!
@@ -15,13 +37,44 @@ def callback(data):
     #data.range_min = min(data.range_min,min(data.ranges))
     pub.publish(data)
 
+def publish_timings(event):
+    # How long each stage takes, so a slow one can be spotted in rqt_robot_monitor.
+    timings, scans = scan_filter.timings()
+    scan_filter.reset_timings()
+    status = DiagnosticStatus()
+    status.name = "arlobot: laser_filter"
+    status.level = DiagnosticStatus.OK
+    status.message = "OK" if scans else "No scans"
+    status.values.append(KeyValue("scans", "%d" % scans))
+    for name, average, longest in timings:
+        status.values.append(KeyValue(name + " average us", "%.1f" % (average * 1e6)))
+        status.values.append(KeyValue(name + " max us", "%.1f" % (longest * 1e6)))
+    diagnostics = DiagnosticArray()
+    diagnostics.header.stamp = rospy.Time.now()
+    diagnostics.status.append(status)
+    diagnostics_pub.publish(diagnostics)
+
 # Intializes everything
 def start():
     rospy.init_node('laser_filter')
     scan_topic = rospy.get_param('~scan_topic', 'xv11')
-    global pub
-    pub = rospy.Publisher(scan_topic+'_filtered', LaserScan, queue_size=10)
-    rospy.Subscriber(scan_topic, LaserScan, callback)
+    global pub, scan_filter, decimator, diagnostics_pub
+    stages = rospy.get_param('~stages', [{'type': 'range',
+                                          'mode': rospy.get_param('~out_of_range', 'replace'),
+                                          'replacement': rospy.get_param('~replacement', 4.9)}])
+    try:
+        scan_filter = ScanFilter(stages)
+        # Costmaps update a few times a second at most, so they can be sent fewer, smaller scans.
+        decimator = ScanDecimator(rospy.get_param('~decimate_beams', 1), rospy.get_param('~publish_rate', 0.0),
+                                  rospy.get_param('~merge', 'latest'))
+    except ValueError as e:
+        rospy.logfatal("laser_filter: " + str(e))
+        return
+    # Only the newest scan is worth sending, an old one just makes the costmap catch up.
+    pub = rospy.Publisher(scan_topic+'_filtered', NumpyLaserScan, queue_size=1)
+    diagnostics_pub = rospy.Publisher('/diagnostics', DiagnosticArray, queue_size=1)
+    rospy.Timer(rospy.Duration(rospy.get_param('~diagnostics_period', 5.0)), publish_timings)
+    rospy.Subscriber(scan_topic, NumpyLaserScan, callback, queue_size=1)
     rospy.spin()
 
 if __name__ == '__main__':
@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+from ScanFilter import ScanData, ScanDecimator, ScanFilter
+from ScanMerger import ScanMerger
+
+'''
+Times every step scans go through on their way to the costmaps, each on its own,
+on made up scans or on scans recorded from the robot, without a ROS master.
+
+list - What laser_filter.py used to do, a list comprehension
+numpy - ScanFilter with just the range stage, what laser_filter.py does by default
+chain - ScanFilter with every stage, how long each stage took is printed after it
+decimate - The chain followed by min pooling every --decimate-beams beams into one,
+           the points column for it is how many beams are left for the costmap to raytrace
+merge - ScanMerger putting the scan and the PING scan into one, like scan_merger.py
+merge msg - That and making scan_merger.py's LaserScan of it and serializing it
+callback - laser_filter.py's callback, from a received message to a serialized one
+message list, message numpy - Deserializing, filtering and serializing a LaserScan, the old way and the numpy_msg way
+proximity - Building the PING and IR ranges from the Propeller's sensor JSON, see ProximityScan.py in arlobot_bringup
+proximity msg - That and filling in and serializing the two LaserScans, like propellerbot_node.py does
+The callback and msg methods need rospy and sensor_msgs, merge msg tf too, and are left out without them.
+
+Made up scans are a room a few meters across, with --out-of-range of the readings
+too close, too far or missing, and --noise meters of noise on the rest.
+--variants different ones are made, and used in turn, so the filters do not see the same scan every time.
+
+Recorded scans can be given with --recorded, as any of:
+- The output of rostopic echo -p /xv11 > xv11.csv, only the ranges columns are used
+- A text file with the ranges of one scan on each line
+- A .npy file holding one scan per row, or a .npz file holding that as "ranges"
+
+Usage:
+./scan_benchmark.py --scans 2000 --sizes 360 720 1440 --noise 0.05 --out-of-range 0.3
+./scan_benchmark.py --recorded xv11.csv --methods numpy chain callback
+
+alloc KB is the most memory one call had allocated at once, after the first calls set up their buffers.
+It needs tracemalloc, so it is left blank on Python 2.
+'''
+
+DEFAULT_SIZES = (360, 720, 1440)
+RANGE_MIN = 0.06
+RANGE_MAX = 5.0
+CHAIN_STAGES = [{'type': 'range'}, {'type': 'median'}, {'type': 'shadow'},
+                {'type': 'crop', 'min_angle': -2.5, 'max_angle': 2.5}, {'type': 'intensity', 'lower': 10}]
+METHODS = ('list', 'numpy', 'chain', 'decimate', 'merge', 'merge msg', 'callback', 'message list', 'message numpy',
+           'proximity', 'proximity msg')
+# Where the XV11 sits on base_link, from neato_laser_joint in arlo.urdf.xacro, and the PING and IR arrays.
+XV11_TRANSLATION = (0.015, -0.02, 0.11875)
+PROXIMITY_TRANSLATION = (0.0, 0.0, 0.03695)
+
+
+def list_filter(ranges, range_min, range_max):
+    # What laser_filter.py used to do.
+    return [4.9 if range_val > range_max else (4.9 if range_val < range_min else range_val) for range_val in ranges]
+
+
+def make_scan(size, seed, noise=0.02, out_of_range=0.2):
+    '''
+    A room a few meters across, with some readings too close, too far or missing, like the XV11 gives.
+    Half of the out of range readings are 0, a quarter are inf and a quarter are past RANGE_MAX.
+    '''
+    generator = random.Random(seed)
+    ranges = []
+    for i in range(size):
+        roll = generator.random() / out_of_range if out_of_range > 0 else 1.0
+        if roll < 0.5:
+            ranges.append(0.0)
+        elif roll < 0.75:
+            ranges.append(float('inf'))
+        elif roll < 1.0:
+            ranges.append(generator.uniform(RANGE_MAX, 8.0))
+        else:
+            ranges.append(2.0 + math.sin(i * 2 * math.pi / size) + generator.uniform(-noise, noise))
+    return ranges
+
+
+def load_recorded(path):
+    '''
+    Returns the scans in path as a float32 array with one scan per row.
+    '''
+    if path.endswith('.npy'):
+        scans = np.load(path)
+    elif path.endswith('.npz'):
+        scans = np.load(path)['ranges']
+    else:
+        with open(path) as recording:
+            header = recording.readline()
+        if header.startswith('%'):
+            # rostopic echo -p, which has every field of the message in its own column.
+            columns = [i for i, name in enumerate(header.lstrip('%').strip().split(','))
+                       if name.startswith('field.ranges')]
+            scans = np.genfromtxt(path, delimiter=',', skip_header=1, usecols=columns)
+        else:
+            scans = np.genfromtxt(path, delimiter=',' if ',' in header else None)
+    scans = np.atleast_2d(np.asarray(scans, dtype=np.float32))
+    if scans.shape[1] == 0:
+        raise ValueError("No ranges in " + path)
+    return scans
+
+
+def make_sensor_data(seed):
+    '''
+    The sensor JSON propellerbot_node.py gets from the Propeller, decoded,
+    with most PING and IR sensors seeing something in the first couple of meters.
+    '''
+    generator = random.Random(seed)
+    sensor_data = {}
+    for i in range(14):
+        if generator.random() < 0.8:
+            sensor_data['p' + str(i)] = generator.randint(2, 300)
+    for i in range(10):
+        if generator.random() < 0.8:
+            sensor_data['i' + str(i)] = generator.randint(10, 80)
+    return sensor_data
+
+
+def import_proximity_scan():
+    '''
+    Returns the ProximityScan module from arlobot_bringup, or None if it cannot be found.
+    '''
+    try:
+        import rospkg
+        package = rospkg.RosPack().get_path('arlobot_bringup')
+    except Exception:
+        # Not in a ROS workspace, so look next to this package in the source tree.
+        package = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'arlobot',
+                               'arlobot_bringup')
+    sys.path.append(os.path.join(package, 'scripts'))
+    try:
+        import ProximityScan
+    except ImportError:
+        return None
+    return ProximityScan
+
+
+def cpu_seconds():
+    try:
+        return time.process_time()
+    except AttributeError:
+        return time.clock()  # Python 2, which is CPU time on Linux
+
+
+def time_it(function, count):
+    '''
+    Returns (wall seconds, CPU seconds) for count calls of function, which is passed the call number.
+    '''
+    wall_start = time.time()
+    cpu_start = cpu_seconds()
+    for i in range(count):
+        function(i)
+    return time.time() - wall_start, cpu_seconds() - cpu_start
+
+
+def peak_allocation(function, count):
+    '''
+    Returns the most bytes one of count calls of function had allocated at once,
+    or None if tracemalloc is not there.
+    '''
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+    peak = 0
+    for i in range(count):
+        tracemalloc.start()
+        function(i)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return peak
+
+
+def message_functions(scans, range_min, range_max, scan_filter):
+    '''
+    Returns {name: function} that round trip a LaserScan holding each of scans in turn,
+    through laser_filter.py's callback and the old and new ways of filtering,
+    or an empty dict if the ROS messages are not available.
+    '''
+    try:
+        from io import BytesIO
+        from rospy.numpy_msg import numpy_msg
+        from sensor_msgs.msg import LaserScan
+        import laser_filter
+    except ImportError:
+        return {}
+    NumpyLaserScan = numpy_msg(LaserScan)
+    data = []
+    for ranges in scans:
+        scan = LaserScan()
+        scan.header.stamp.secs = 1  # laser_filter.py falls back on the ROS clock for an empty stamp.
+        scan.range_min = range_min
+        scan.range_max = range_max
+        scan.ranges = [float(range_val) for range_val in ranges]
+        buffer = BytesIO()
+        scan.serialize(buffer)
+        data.append(buffer.getvalue())
+
+    class SerializingPublisher(object):
+        # What rospy does to a published message, without sending it anywhere.
+        def publish(self, message):
+            message.serialize_numpy(BytesIO(), np)
+
+    laser_filter.pub = SerializingPublisher()
+    laser_filter.scan_filter = scan_filter
+    laser_filter.decimator = ScanDecimator()
+
+    def plain(i):
+        received = LaserScan().deserialize(data[i % len(data)])
+        received.ranges = list_filter(received.ranges, received.range_min, received.range_max)
+        received.serialize(BytesIO())
+
+    def numpy(i):
+        received = NumpyLaserScan().deserialize_numpy(data[i % len(data)], np)
+        received.ranges = scan_filter.filter(received)
+        received.serialize_numpy(BytesIO(), np)
+
+    def callback(i):
+        laser_filter.callback(NumpyLaserScan().deserialize_numpy(data[i % len(data)], np))
+
+    return {'message list': plain, 'message numpy': numpy, 'callback': callback}
+
+
+def proximity_functions(ProximityScan):
+    '''
+    Returns {name: function} for building the PING and IR scans, without and with the LaserScans.
+    '''
+    sensor_data = [make_sensor_data(seed) for seed in range(10)]
+    functions = {'proximity': lambda i: ProximityScan.proximity_ranges(sensor_data[i % len(sensor_data)])}
+    try:
+        from io import BytesIO
+        from sensor_msgs.msg import LaserScan
+    except ImportError:
+        return functions
+
+    def message(i):
+        ping_ranges, ir_ranges = ProximityScan.proximity_ranges(sensor_data[i % len(sensor_data)])
+        for frame_id, ranges in (("ping_sensor_array", ping_ranges), ("ir_sensor_array", ir_ranges)):
+            scan = LaserScan()
+            scan.header.frame_id = frame_id
+            scan.angle_increment = (2 * 3.14) / ProximityScan.NUM_READINGS
+            scan.range_min = 0.02
+            scan.range_max = ProximityScan.ARTIFICIAL_FAR_DISTANCE + 1
+            scan.ranges = ranges
+            scan.serialize(BytesIO())
+
+    functions['proximity msg'] = message
+    return functions
+
+
+def merged_scan_publisher():
+    '''
+    Returns a function that makes scan_merger.py's LaserScan of what ScanMerger.merge returned
+    and serializes it the way rospy would publish it, or None if the ROS messages are not available.
+    '''
+    try:
+        from io import BytesIO
+        import scan_merger
+    except ImportError:
+        return None
+
+    def publish(merger, merged):
+        ranges, range_min, range_max, stamp = merged
+        scan = scan_merger.scan_message(merger, ranges, range_min, range_max, stamp, 'base_link', 0.2)
+        scan.serialize_numpy(BytesIO(), np)
+
+    return publish
+
+
+def make_merger(ProximityScan, sensor_scan, publish=None):
+    '''
+    Returns a function that merges sensor_scan(i) with the PING scan, or just merges it
+    if ProximityScan is None, and hands the result to publish if that is given.
+    '''
+    merger = ScanMerger()
+    merger.set_transform('neato_laser', XV11_TRANSLATION, np.eye(3))
+    merger.set_transform('ping_sensor_array', PROXIMITY_TRANSLATION, np.eye(3))
+    ping = None
+    if ProximityScan is not None:
+        ping_ranges = ProximityScan.proximity_ranges(make_sensor_data(0))[0]
+        ping = ScanData(np.array(ping_ranges, dtype=np.float32), angle_min=0.0,
+                        angle_increment=(2 * 3.14) / ProximityScan.NUM_READINGS,
+                        range_min=0.02, range_max=ProximityScan.ARTIFICIAL_FAR_DISTANCE + 1)
+
+    def merge(i):
+        merger.add('xv11', sensor_scan(i), 'neato_laser', 0.0)
+        if ping is not None:
+            merger.add('ultrasonic_scan', ping, 'ping_sensor_array', 0.0)
+        merged = merger.merge(0.0)
+        if publish is not None:
+            publish(merger, merged)
+
+    return merge
+
+
+def print_row(name, points, count, wall, cpu, allocated, scan_rate):
+    print("%-14s %6d %12.0f %12.1f %14.3f %10s" % (name, points, count / wall, wall / count * 1e6,
+                                                   cpu / count * scan_rate * 100,
+                                                   '' if allocated is None else "%.1f" % (allocated / 1024.0)))
+
+
+def run(name, function, points, args, chain=None):
+    wall, cpu = time_it(function, args.scans)
+    print_row(name, points, args.scans, wall, cpu, peak_allocation(function, args.alloc_calls), args.scan_rate)
+    if chain is not None:
+        for stage, average, longest in chain.timings()[0]:
+            print("  %-12s %6s %12s %12.1f" % (stage, '', '', average * 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each step of scan processing, without a ROS master.")
+    parser.add_argument('--scans', type=int, default=2000, help="Scans to process for each size and method")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help="Points per made up scan")
+    parser.add_argument('--noise', type=float, default=0.02, help="Meters of noise on made up ranges")
+    parser.add_argument('--out-of-range', type=float, default=0.2,
+                        help="Fraction of made up ranges that are too close, too far or missing")
+    parser.add_argument('--variants', type=int, default=10, help="Different made up scans to use in turn")
+    parser.add_argument('--recorded', help="Scans recorded from the robot to use instead of made up ones")
+    parser.add_argument('--range-min', type=float, default=RANGE_MIN, help="range_min of the recorded scans")
+    parser.add_argument('--range-max', type=float, default=RANGE_MAX, help="range_max of the recorded scans")
+    parser.add_argument('--methods', nargs='+', choices=METHODS, default=list(METHODS))
+    parser.add_argument('--decimate-beams', type=int, default=4, help="Beams to pool into one for the decimate method")
+    parser.add_argument('--alloc-calls', type=int, default=20, help="Calls to look at for the alloc KB column")
+    parser.add_argument('--scan-rate', type=float, default=10.0,
+                        help="Scans per second from the sensor, for the CPU percent column")
+    args = parser.parse_args()
+
+    if args.recorded:
+        recorded = load_recorded(args.recorded)
+        scan_sets = [(recorded.shape[1], list(recorded))]
+        range_min, range_max = args.range_min, args.range_max
+    else:
+        scan_sets = [(size, [np.array(make_scan(size, size * args.variants + variant, args.noise, args.out_of_range),
+                                      dtype=np.float32) for variant in range(args.variants)])
+                     for size in args.sizes]
+        range_min, range_max = RANGE_MIN, RANGE_MAX
+    ProximityScan = import_proximity_scan()
+
+    print("%-14s %6s %12s %12s %14s %10s" % ('method', 'points', 'scans/s', 'us/scan',
+                                             'CPU %% at %gHz' % args.scan_rate, 'alloc KB'))
+    for size, arrays in scan_sets:
+        lists = [[float(range_val) for range_val in ranges] for ranges in arrays]
+        scans = [ScanData(ranges, angle_min=-math.pi, angle_increment=2 * math.pi / size,
+                          range_min=range_min, range_max=range_max,
+                          intensities=np.array([i % 100 for i in range(size)], dtype=np.float32))
+                 for ranges in arrays]
+        scan_filter = ScanFilter()
+        chain = ScanFilter(CHAIN_STAGES)
+        # Both have to give the same answer, or the speed does not matter.
+        expected = np.array(list_filter(lists[0], range_min, range_max), dtype=np.float32)
+        if not np.array_equal(scan_filter.filter(scans[0]), expected):
+            print("ScanFilter does not match the list comprehension for %d points!" % size)
+            return 1
+        decimator = ScanDecimator(args.decimate_beams)
+        chain.filter(scans[0])  # Leave out the first scan, which sets up the buffers.
+        chain.reset_timings()
+
+        # The merger gets filtered scans, like scan_merger.py does from laser_filter.py.
+        filtered = [ScanData(scan_filter.filter(scan).copy(), scan.angle_min, scan.angle_increment, scan.range_min,
+                             scan.range_max) for scan in scans]
+
+        methods = {'list': lambda i: list_filter(lists[i % len(lists)], range_min, range_max),
+                   'numpy': lambda i: scan_filter.filter(scans[i % len(scans)]),
+                   'chain': lambda i: chain.filter(scans[i % len(scans)]),
+                   'decimate': lambda i: decimator.add(chain.filter(scans[i % len(scans)]), 0),
+                   'merge': make_merger(ProximityScan, lambda i: filtered[i % len(filtered)])}
+        publish = merged_scan_publisher()
+        if publish is not None:
+            methods['merge msg'] = make_merger(ProximityScan, lambda i: filtered[i % len(filtered)], publish)
+        methods.update(message_functions(arrays, range_min, range_max, ScanFilter()))
+        for name in args.methods:
+            if name not in methods:
+                continue
+            points = decimator.pooled_size(size) if name == 'decimate' else size
+            run(name, methods[name], points, args, chain if name == 'chain' else None)
+            if name == 'chain':
+                chain.reset_timings()
+
+    if ProximityScan is not None:
+        proximity = proximity_functions(ProximityScan)
+        for name in args.methods:
+            if name in proximity:
+                run(name, proximity[name], ProximityScan.NUM_READINGS, args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
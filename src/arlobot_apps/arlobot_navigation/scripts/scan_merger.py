@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+import threading
+
+import numpy as np
+import rospy
+import tf
+from tf.transformations import quaternion_matrix
+from rospy.numpy_msg import numpy_msg
+from sensor_msgs.msg import LaserScan, PointCloud2, PointField
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+
+from ScanMerger import ScanMerger
+
+'''
+Merges the XV11 and PING scans into one LaserScan or PointCloud2 for the costmaps,
+so they do one raytrace and marking pass per update instead of one per sensor.
+See param/scan_merger.yaml and costmap_common_params_merged.yaml.
+
+Points are kept in base_link as each scan arrives and published with the newest stamp,
+so while the robot moves the older sources are off by however far it went since their scan.
+max_age keeps that to about one XV11 scan period, 0.3 seconds or up to 15 cm at the planners' 0.5 m/s.
+'''
+
+NumpyLaserScan = numpy_msg(LaserScan)
+NO_INTENSITIES = np.zeros(0, dtype=np.float32)
+CLOUD_FIELDS = [PointField('x', 0, PointField.FLOAT32, 1),
+                PointField('y', 4, PointField.FLOAT32, 1),
+                PointField('z', 8, PointField.FLOAT32, 1)]
+
+
+def source_callback(data, source):
+    frame = data.header.frame_id
+    if not merger.has_transform(frame):
+        # Sensors are bolted to the robot, so this is only looked up for the first scan from a frame.
+        try:
+            translation, quaternion = tf_listener.lookupTransform(frame_id, frame, rospy.Time(0))
+        except (tf.LookupException, tf.ConnectivityException, tf.ExtrapolationException) as e:
+            rospy.logwarn_throttle(10, "scan_merger: No transform from " + frame + " to " + frame_id + " yet: " + str(e))
+            return
+        with lock:
+            merger.set_transform(frame, translation, quaternion_matrix(quaternion)[:3, :3])
+    # Each subscriber has its own thread, and so does the publish timer.
+    with lock:
+        merger.add(source, data, frame, data.header.stamp.to_sec() or rospy.get_time())
+
+
+def cloud_message(points, stamp, frame_id):
+    ''' A PointCloud2 of the (N, 3) points from ScanMerger.points. '''
+    cloud = PointCloud2()
+    cloud.header.stamp = rospy.Time.from_sec(stamp)
+    cloud.header.frame_id = frame_id
+    cloud.height = 1
+    cloud.width = points.shape[0]
+    cloud.fields = CLOUD_FIELDS
+    cloud.is_bigendian = False
+    cloud.point_step = 12
+    cloud.row_step = 12 * points.shape[0]
+    cloud.is_dense = True
+    cloud.data = points.astype(np.float32).tobytes()
+    return cloud
+
+
+def scan_message(merger, ranges, range_min, range_max, stamp, frame_id, scan_time):
+    ''' A numpy_msg LaserScan of what ScanMerger.merge returned. '''
+    scan = NumpyLaserScan()
+    scan.header.stamp = rospy.Time.from_sec(stamp)
+    scan.header.frame_id = frame_id
+    scan.angle_min = merger.angle_min
+    scan.angle_max = merger.angle_max
+    scan.angle_increment = merger.angle_increment
+    scan.scan_time = scan_time
+    scan.range_min = range_min
+    scan.range_max = range_max
+    scan.ranges = ranges
+    scan.intensities = NO_INTENSITIES # numpy_msg serializes arrays, not the empty tuple a new message has.
+    return scan
+
+
+def publish_merged(event):
+    now = rospy.get_time()
+    if output == 'cloud':
+        with lock:
+            points, stamp = merger.points(now)
+        if stamp is None:
+            return
+        pub.publish(cloud_message(points, stamp, frame_id))
+        return
+    with lock:
+        merged = merger.merge(now)
+        if merged is None:
+            return
+        ranges, range_min, range_max, stamp = merged
+        ranges = ranges.copy()  # merge reuses it
+    pub.publish(scan_message(merger, ranges, range_min, range_max, stamp, frame_id, period))
+
+
+def publish_diagnostics(event):
+    with lock:
+        average, longest, merges = merger.timings()
+        merger.reset_timings()
+        ages = merger.ages(rospy.get_time())
+    status = DiagnosticStatus()
+    status.name = "arlobot: scan_merger"
+    status.level = DiagnosticStatus.OK
+    status.message = "OK"
+    missing = [source for source in sources if ages.get(source, warn_age + 1) > warn_age]
+    if missing:
+        status.level = DiagnosticStatus.WARN
+        status.message = "No recent scans from " + ", ".join(missing)
+    status.values.append(KeyValue("merges", "%d" % merges))
+    status.values.append(KeyValue("merge average us", "%.1f" % (average * 1e6)))
+    status.values.append(KeyValue("merge max us", "%.1f" % (longest * 1e6)))
+    for source in sources:
+        status.values.append(KeyValue(source + " age", "%.2f" % ages[source] if source in ages else "never"))
+    diagnostics = DiagnosticArray()
+    diagnostics.header.stamp = rospy.Time.now()
+    diagnostics.status.append(status)
+    diagnostics_pub.publish(diagnostics)
+
+
+# Intializes everything
+def start():
+    rospy.init_node('scan_merger')
+    global merger, lock, tf_listener, pub, diagnostics_pub, frame_id, output, period, sources, warn_age
+    frame_id = rospy.get_param('~frame_id', 'base_link')
+    output = rospy.get_param('~output', 'scan')
+    if output not in ('scan', 'cloud'):
+        rospy.logfatal("scan_merger: ~output must be scan or cloud, not " + str(output))
+        return
+    sources = rospy.get_param('~sources', ['xv11', 'ultrasonic_scan'])
+    max_age = rospy.get_param('~max_age', 0.3)
+    warn_age = rospy.get_param('~warn_age', 1.0)
+    try:
+        merger = ScanMerger(rospy.get_param('~angle_min', -np.pi), rospy.get_param('~angle_max', np.pi),
+                            rospy.get_param('~angle_increment', np.pi / 180), max_age)
+    except ValueError as e:
+        rospy.logfatal("scan_merger: " + str(e))
+        return
+    # The local costmap updates at 5 Hz, so there is no point in merging faster than that.
+    period = 1.0 / rospy.get_param('~rate', 5.0)
+    lock = threading.Lock()
+    tf_listener = tf.TransformListener()
+    if output == 'cloud':
+        pub = rospy.Publisher('~cloud', PointCloud2, queue_size=1)
+    else:
+        pub = rospy.Publisher('~scan', NumpyLaserScan, queue_size=1)
+    diagnostics_pub = rospy.Publisher('/diagnostics', DiagnosticArray, queue_size=1)
+    for source in sources:
+        rospy.Subscriber(source, NumpyLaserScan, source_callback, source, queue_size=1)
+    rospy.Timer(rospy.Duration(period), publish_merged)
+    rospy.Timer(rospy.Duration(rospy.get_param('~diagnostics_period', 5.0)), publish_diagnostics)
+    rospy.spin()
+
+if __name__ == '__main__':
+    start()